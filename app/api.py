@@ -0,0 +1,223 @@
+"""
+Async HTTP chat API for Clickatell AI Assistant
+
+A dependency-free ASGI application serving the retrieval chain through its
+async interface, so one process can hold hundreds of conversations that are
+waiting on the LLM. Run it with any ASGI server, for example:
+
+    uvicorn app.api:app --port 8000
+
+Endpoints:
+    POST /chat     {"message": "...", "session_id": "...", "stream": false, "section": null}
+    GET  /health
+    GET  /metrics  Prometheus histograms of every stage of the chain (see legacy/tracing.py)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+
+# Add parent directory to path
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+from legacy import metrics, streaming
+
+logger = logging.getLogger(__name__)
+
+# Phrases from the prompt's fallback answer; a match means the user should go to a live agent
+FALLBACK_KEYWORDS = [
+    "i'm not confident i can assist with that",
+    "let me connect you to a live agent",
+]
+
+MAX_BODY_BYTES = 64 * 1024
+
+
+def is_fallback(answer):
+    answer = answer.lower()
+    return any(keyword in answer for keyword in FALLBACK_KEYWORDS)
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            raise ValueError("Request body too large")
+        if not message.get("more_body", False):
+            return body
+
+
+def _log_traces():
+    # One JSON line per answered request on stderr, unless the server configured the trace logger itself
+    trace_logger = logging.getLogger("legacy.tracing")
+    if not trace_logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        trace_logger.addHandler(handler)
+        trace_logger.setLevel(logging.INFO)
+        trace_logger.propagate = False
+
+
+async def _send_text(send, status, text, content_type):
+    body = text.encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode("ascii")),
+            (b"content-length", str(len(body)).encode("ascii")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def _parse_chat_request(body):
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        raise ValueError("Body must be JSON")
+    if not isinstance(payload, dict):
+        raise ValueError("Body must be a JSON object")
+
+    message = payload.get("message")
+    if not isinstance(message, str) or not message.strip():
+        raise ValueError("'message' must be a non-empty string")
+    session_id = payload.get("session_id") or f"api-{uuid.uuid4().hex}"
+    if not isinstance(session_id, str):
+        raise ValueError("'session_id' must be a string")
+    section = payload.get("section")
+    if section is not None and not isinstance(section, str):
+        raise ValueError("'section' must be a string")
+    return message.strip(), session_id, bool(payload.get("stream", False)), section
+
+
+def create_app(chain=None, registry=None):
+    """Build the ASGI app around ``chain``; the shared engine's chain is used by default.
+
+    ``GET /metrics`` serves ``registry``, by default the process-wide one the chain's tracer records into.
+    """
+    state = {"chain": chain}
+    registry = registry or metrics.registry
+    _log_traces()
+    chain_lock = asyncio.Lock()
+
+    async def get_chain():
+        if state["chain"] is None:
+            async with chain_lock:
+                if state["chain"] is None:
+                    # Building the engine loads the index and models; keep it off the event loop
+                    from legacy.engine import get_engine
+                    engine = await asyncio.to_thread(get_engine)
+                    state["chain"] = engine.chain
+        return state["chain"]
+
+    async def chat(send, message, session_id, stream, section=None):
+        chain = await get_chain()
+        inputs = {"input": message}
+        if section:
+            # Only search this knowledge base section
+            inputs["section"] = section
+        config = {"configurable": {"session_id": session_id}}
+        started = time.perf_counter()
+
+        if not stream:
+            try:
+                answer = await chain.ainvoke(inputs, config=config)
+            except Exception:
+                logger.exception("Chat request failed for session %s", session_id)
+                await _send_json(send, 500, {"error": "Internal error"})
+                return
+            streaming.time_to_last_token.record(time.perf_counter() - started)
+            await _send_json(send, 200, {
+                "session_id": session_id,
+                "answer": answer,
+                "fallback": is_fallback(answer),
+            })
+            return
+
+        # Newline-delimited JSON: one {"token": ...} line per chunk, then a summary line
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/x-ndjson")],
+        })
+        answer = ""
+        try:
+            async for token in chain.astream(inputs, config=config):
+                if not answer:
+                    streaming.time_to_first_token.record(time.perf_counter() - started)
+                answer += token
+                line = json.dumps({"token": token}) + "\n"
+                await send({"type": "http.response.body", "body": line.encode("utf-8"), "more_body": True})
+        except Exception:
+            # Headers are already sent, so report the failure in the stream itself
+            logger.exception("Streaming chat request failed for session %s", session_id)
+            line = json.dumps({"error": "Internal error"}) + "\n"
+            await send({"type": "http.response.body", "body": line.encode("utf-8")})
+            return
+        streaming.time_to_last_token.record(time.perf_counter() - started)
+        line = json.dumps({"done": True, "session_id": session_id, "fallback": is_fallback(answer)}) + "\n"
+        await send({"type": "http.response.body", "body": line.encode("utf-8")})
+
+    async def lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            await lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        method, path = scope["method"], scope["path"]
+        if path == "/health" and method == "GET":
+            await _send_json(send, 200, {"status": "ok"})
+        elif path == "/metrics" and method == "GET":
+            await _send_text(send, 200, registry.render(), metrics.CONTENT_TYPE)
+        elif path == "/chat" and method == "POST":
+            try:
+                body = await _read_body(receive)
+                if body is None:
+                    return
+                message, session_id, stream, section = _parse_chat_request(body)
+            except ValueError as e:
+                await _send_json(send, 400, {"error": str(e)})
+                return
+            await chat(send, message, session_id, stream, section)
+        elif path in ("/health", "/chat", "/metrics"):
+            await _send_json(send, 405, {"error": "Method not allowed"})
+        else:
+            await _send_json(send, 404, {"error": "Not found"})
+
+    return app
+
+
+app = create_app()
@@ -6,6 +6,7 @@ import streamlit as st
 import sys
 import os
 import hashlib
+import uuid
 
 # Add parent directory to path
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -52,29 +53,60 @@ def initialize_session_state():
         st.session_state.pending_handover = False
     if 'processing' not in st.session_state:
         st.session_state.processing = False
+    if 'session_id' not in st.session_state:
+        # The ?session= link lets a returning user pick up their conversation after a restart
+        st.session_state.session_id = st.query_params.get("session") or f"user-{uuid.uuid4().hex}"
+        st.query_params["session"] = st.session_state.session_id
     if 'qa_chain' not in st.session_state:
         try:
-            legacy_path = os.path.join(parent_dir, 'legacy')
-            sys.path.insert(0, legacy_path)
-            from retrieval_chain import build_retrieval_chain
+            from legacy.engine import get_engine
             with st.spinner("Initializing AI Assistant..."):
-                st.session_state.qa_chain = build_retrieval_chain()
+                st.session_state.qa_chain = get_engine().chain
         except Exception as e:
             st.error(f"Failed to initialize AI: {e}")
             st.session_state.qa_chain = None
+    if 'history_restored' not in st.session_state:
+        st.session_state.history_restored = True
+        if st.session_state.qa_chain and not st.session_state.messages:
+            from legacy.engine import get_engine
+            history = get_engine().sessions(st.session_state.session_id)
+            st.session_state.messages = [
+                {"role": "user" if message.type == "human" else "assistant", "content": message.content}
+                for message in history.messages
+            ]
 
 def get_message_hash(message):
     return hashlib.md5(message.encode()).hexdigest()
 
+FALLBACK_KEYWORDS = [
+    "i'm not confident",
+    "let me connect you to a live agent",
+    "i'm unable to assist"
+]
+
 def is_fallback_response(response):
-    fallback_keywords = [
-        "i'm not confident",
-        "let me connect you to a live agent",
-        "i'm unable to assist"
-    ]
-    return any(keyword in response.lower() for keyword in fallback_keywords)
+    return any(keyword in response.lower() for keyword in FALLBACK_KEYWORDS)
+
+def stream_response(user_input, placeholder):
+    """Render the answer token by token in a chat bubble and return the full text"""
+    from legacy.streaming import AnswerStream
+    answer = AnswerStream(st.session_state.qa_chain, user_input, st.session_state.session_id, FALLBACK_KEYWORDS,
+                          section=st.session_state.get("section"))
+    shown = ""
+    for text in answer:
+        shown += text
+        placeholder.markdown(f"""
+        <div class="user-message">
+            <strong>You:</strong> {user_input}
+        </div>
+        <div class="bot-message">
+            <strong>🤖 Assistant:</strong><br>
+            {shown}▌
+        </div>
+        """, unsafe_allow_html=True)
+    return answer.text
 
-def process_message(user_input):
+def process_message(user_input, placeholder=None):
     if not user_input.strip():
         return
     
@@ -107,10 +139,16 @@ def process_message(user_input):
             st.session_state.messages.append({"role": "user", "content": user_input})
             
             if st.session_state.qa_chain:
-                response = st.session_state.qa_chain.invoke(
-                    {"input": user_input},
-                    config={"configurable": {"session_id": "user-session"}}
-                )
+                if placeholder is not None:
+                    response = stream_response(user_input, placeholder)
+                else:
+                    inputs = {"input": user_input}
+                    if st.session_state.get("section"):
+                        inputs["section"] = st.session_state.section
+                    response = st.session_state.qa_chain.invoke(
+                        inputs,
+                        config={"configurable": {"session_id": st.session_state.session_id}}
+                    )
                 
                 if is_fallback_response(response):
                     response = "I'm not confident I can assist with that. Would you like me to connect you to a live agent? (yes/no)"
@@ -147,6 +185,9 @@ def main():
             </div>
             """, unsafe_allow_html=True)
     
+    # Answers stream into this slot until the page reruns
+    stream_placeholder = st.empty()
+    
     with st.form("chat_form", clear_on_submit=True):
         if st.session_state.pending_handover:
             st.info("Please respond with 'yes' or 'no' to connect to a live agent.")
@@ -163,7 +204,7 @@ def main():
         )
         
         if submitted and user_input.strip():
-            process_message(user_input.strip())
+            process_message(user_input.strip(), stream_placeholder)
             st.rerun()
     
     with st.sidebar:
@@ -174,9 +215,34 @@ def main():
             st.session_state.processed_hashes = set()
             st.session_state.pending_handover = False
             st.session_state.processing = False
+            if st.session_state.qa_chain:
+                from legacy.engine import get_engine
+                # Free the old conversation's history now instead of waiting for it to expire
+                get_engine().sessions.discard(st.session_state.session_id)
+            st.session_state.session_id = f"user-{uuid.uuid4().hex}"
+            st.query_params["session"] = st.session_state.session_id
             st.rerun()
         
         st.metric("Messages", len(st.session_state.messages))
+        
+        if st.session_state.qa_chain:
+            from legacy.engine import get_engine
+            # Restrict answers to one part of the knowledge base
+            sections = ["All sections"] + get_engine().retriever.sections()
+            choice = st.selectbox("Search in", sections)
+            st.session_state.section = None if choice == "All sections" else choice
+
+            engine_stats = get_engine().stats()
+            st.metric("RAG Engines", engine_stats["engines"])
+            st.metric("Engine Memory (MB)", engine_stats["engine_memory_mb"])
+            st.metric("Live Sessions", engine_stats["sessions_live"])
+            if engine_stats["cold_start_seconds"] is not None:
+                st.metric("Cold Start to First Answer (s)", engine_stats["cold_start_seconds"])
+            ttft = engine_stats["time_to_first_token"]
+            if ttft["p50_ms"] is not None:
+                st.metric("Time to First Token (p50)", f"{ttft['p50_ms']:.0f} ms")
+            if "semantic_cache_hit_rate" in engine_stats:
+                st.metric("Answer Cache Hit Rate", f"{engine_stats['semantic_cache_hit_rate']:.0%}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
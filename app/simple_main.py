@@ -6,6 +6,7 @@ import streamlit as st
 import sys
 import os
 import hashlib
+import uuid
 
 # Add parent directory to path
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -53,15 +54,14 @@ def initialize_session_state():
         st.session_state.pending_handover = False
     if 'processing' not in st.session_state:
         st.session_state.processing = False
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = f"user-{uuid.uuid4().hex}"
     if 'qa_chain' not in st.session_state:
-        # Try to import and initialize RAG engine
+        # Reuse the process-wide RAG engine (built once, shared by all sessions)
         try:
-            # Import from legacy folder
-            legacy_path = os.path.join(parent_dir, 'legacy')
-            sys.path.insert(0, legacy_path)
-            from retrieval_chain import build_retrieval_chain
+            from legacy.engine import get_engine
             with st.spinner("Initializing AI Assistant..."):
-                st.session_state.qa_chain = build_retrieval_chain()
+                st.session_state.qa_chain = get_engine().chain
         except Exception as e:
             st.error(f"Failed to initialize AI: {e}")
             st.info("Please ensure OpenAI API key is configured in .env file")
@@ -119,7 +119,7 @@ def process_message(user_input):
             if st.session_state.qa_chain:
                 response = st.session_state.qa_chain.invoke(
                     {"input": user_input},
-                    config={"configurable": {"session_id": "user-session"}}
+                    config={"configurable": {"session_id": st.session_state.session_id}}
                 )
                 
                 if is_fallback_response(response):
@@ -188,10 +188,23 @@ def main():
             st.session_state.processed_hashes = set()
             st.session_state.pending_handover = False
             st.session_state.processing = False
+            if st.session_state.qa_chain:
+                from legacy.engine import get_engine
+                # Free the old conversation's history now instead of waiting for it to expire
+                get_engine().sessions.discard(st.session_state.session_id)
+            st.session_state.session_id = f"user-{uuid.uuid4().hex}"
             st.rerun()
         
         st.metric("Messages", len(st.session_state.messages))
         
+        if st.session_state.qa_chain:
+            from legacy.engine import get_engine
+            engine_stats = get_engine().stats()
+            st.metric("RAG Engines", engine_stats["engines"])
+            st.metric("Engine Memory (MB)", engine_stats["engine_memory_mb"])
+            if engine_stats["cold_start_seconds"] is not None:
+                st.metric("Cold Start to First Answer (s)", engine_stats["cold_start_seconds"])
+        
         if st.session_state.processing:
             st.info("Processing...")
 
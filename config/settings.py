@@ -20,6 +20,104 @@ INDEX_PATH = os.path.join("vector_store", "faiss_index")
 # Embedding model to use from HuggingFace
 EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
+# Embedding backend: "torch" (sentence-transformers) or "onnx" (onnxruntime on CPU, no torch import when serving).
+# Export the ONNX model first with scripts/export_onnx.py; without it the torch backend is used.
+EMBED_BACKEND = "torch"
+EMBED_ONNX_PATH = os.path.join("vector_store", "onnx_model")
+EMBED_ONNX_QUANTIZED = True                                        #  Use the int8 export (faster, cosine >= 0.99 to torch)
+EMBED_ONNX_THREADS = 0                                             #  onnxruntime intra-op threads; 0 = all cores
+
+# Micro-batching of query embeddings: concurrent questions share one forward pass
+EMBED_BATCHING_ENABLED = True
+EMBED_BATCH_MAX_SIZE = 32                                          #  Most queries embedded in one call
+EMBED_BATCH_MAX_WAIT_MS = 2                                        #  Longest wait for more queries, only under concurrent load
+
 # Chunking configuration for splitting documents
 CHUNK_SIZE = 600                                                   #  Maximum number of characters per chunk
 CHUNK_OVERLAP = 80                                                 #  Overlap between chunks to preserve context
+CHUNK_STRATEGY = "sections"                                        #  "sections" keeps chunks inside one "Section N:" block; "recursive" ignores structure
+
+# Number of chunks sent to the embedding model per call when building the index
+EMBED_BATCH_SIZE = 64
+
+# FAISS index type: "flat" (exact), "hnsw" or "ivf" (approximate), or "auto" to choose by number of vectors
+INDEX_TYPE = "auto"
+INDEX_HNSW_MIN_VECTORS = 20000                                     #  "auto" uses HNSW from this many vectors
+INDEX_IVF_MIN_VECTORS = 1000000                                    #  ... and IVF from this many (smaller than HNSW in memory)
+HNSW_M = 32                                                        #  Graph neighbours per vector; more = better recall, more memory
+HNSW_EF_CONSTRUCTION = 80                                          #  Build-time search depth
+HNSW_EF_SEARCH = 64                                                #  Query-time search depth; more = better recall, slower
+IVF_NLIST = None                                                   #  Number of clusters; None = 4 * sqrt(vectors)
+IVF_NPROBE = 16                                                    #  Clusters scanned per query
+
+# Compact vector codes: "none" (float32), "fp16", "int8", or "binary" (1 bit per dimension, always scanned in full).
+# Candidates are rescored with the full-precision vectors, which stay on disk (memory-mapped) rather than in RAM.
+INDEX_QUANTIZATION = "none"
+INDEX_RESCORE_FACTOR = 4                                           #  fp16/int8: rescore k * factor candidates
+INDEX_BINARY_RESCORE_FACTOR = 20                                   #  binary codes are coarser and need more candidates
+
+# Embedding caches: document vectors on disk (reused across rebuilds), query vectors in memory
+EMBED_CACHE_ENABLED = True
+EMBED_CACHE_PATH = os.path.join("vector_store", "embedding_cache.bin")
+EMBED_QUERY_CACHE_SIZE = 2048                                      #  Most recent query vectors kept per process
+
+# Exact-match answer cache shared by all processes on the host (SQLite)
+EXACT_CACHE_ENABLED = True
+EXACT_CACHE_PATH = os.path.join("vector_store", "answer_cache.sqlite3")
+
+# Semantic answer cache: reuse an answer when a new question is this close (cosine distance) to a previous one
+SEMANTIC_CACHE_ENABLED = True
+SEMANTIC_CACHE_MAX_DISTANCE = 0.08                                 #  0 = identical meaning, 2 = opposite
+SEMANTIC_CACHE_MAX_ENTRIES = 1000                                  #  Least recently used answers are evicted first
+SEMANTIC_CACHE_TTL_SECONDS = 24 * 60 * 60                          #  Answers expire after a day
+
+# Chat histories kept in memory per process; idle sessions are dropped, then the least recently used
+SESSION_MAX_SESSIONS = 10000
+SESSION_IDLE_TTL_SECONDS = 2 * 60 * 60                             #  Sessions idle for two hours are forgotten
+
+# Conversation memory sent with each question: "summary" keeps recent turns plus a rolling summary, "full" sends everything
+MEMORY_MODE = "summary"
+MEMORY_RECENT_TURNS = 4                                            #  Question/answer pairs kept verbatim
+MEMORY_TOKEN_BUDGET = 1000                                         #  Maximum tokens for summary + recent turns
+
+# Durable chat history (SQLite, written in the background) so conversations survive restarts
+HISTORY_PERSISTENCE_ENABLED = True
+HISTORY_DB_PATH = os.path.join("vector_store", "chat_history.sqlite3")
+HISTORY_FLUSH_INTERVAL_SECONDS = 0.5                               #  Longest a queued message waits before it is written
+HISTORY_BATCH_SIZE = 256                                           #  Maximum updates written per transaction
+HISTORY_RESTORE_MESSAGES = 40                                      #  Most recent messages loaded when a session returns
+HISTORY_RETENTION_DAYS = 30                                        #  Sessions idle for longer are deleted (None keeps everything)
+HISTORY_PRUNE_INTERVAL_SECONDS = 3600                              #  How often the writer looks for expired sessions
+
+# Retrieval: "hybrid" fuses FAISS and BM25 rankings (reciprocal rank fusion), "dense" uses FAISS only
+RETRIEVAL_MODE = "hybrid"
+RETRIEVAL_K = 3                                                    #  Chunks sent to the LLM
+RETRIEVAL_FETCH_K = 20                                             #  Candidates taken from each retriever before fusion
+RETRIEVAL_RRF_K = 60                                               #  Rank fusion constant; higher flattens rank differences
+
+# Cross-encoder reranking of retrieved chunks; falls back to the retrieval order when it would be too slow
+RERANK_ENABLED = True
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 12                                             #  Chunks retrieved and rescored per question
+RERANK_MIN_SCORE = 0.2                                             #  Relevance cutoff (0-1); lower-scoring chunks are dropped
+RERANK_MAX_K = 4                                                   #  Most chunks kept after reranking
+RERANK_BUDGET_MS = 150                                             #  Skip reranking when it is predicted to take longer
+
+# Context assembly: overlapping and duplicate chunks are merged, then packed into a token budget by relevance
+CONTEXT_TOKEN_BUDGET = 1200                                        #  Maximum context tokens sent to the LLM
+CONTEXT_MIN_SIMILARITY = 0.2                                       #  Chunks with a lower cosine similarity are dropped
+
+# Identical questions arriving while the first one is still being answered share its retrieval and LLM call
+COALESCE_ENABLED = True
+
+# Per-request tracing: stage timings, retrieved chunks and token counts, logged as one JSON line per answer
+# (logger "legacy.tracing") and exported as Prometheus histograms at GET /metrics of app/api.py
+TRACING_ENABLED = True
+TRACE_LOG_QUESTIONS = False                                        #  Include the user's question in trace logs (may hold personal data)
+
+# Confidence gate: hand over to a live agent without calling the LLM when retrieval is weak.
+# Cosine similarity thresholds; recalibrate with scripts/calibrate_gate.py after changing the model or knowledge base.
+# Off until the thresholds below come from that script: guessed values hand answerable questions to an agent
+CONFIDENCE_GATE_ENABLED = False
+CONFIDENCE_MIN_TOP_SCORE = 0.30                                    #  Placeholder; best chunk must be at least this similar
+CONFIDENCE_MIN_MARGIN = 0.05                                       #  Placeholder; ...and stand out this much from the others
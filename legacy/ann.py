@@ -0,0 +1,267 @@
+"""
+Choice and construction of the FAISS index used for dense search.
+
+A flat index is exact but compares the query with every vector, so its cost
+grows linearly with the corpus. HNSW (a navigable graph) and IVF (inverted
+lists over k-means clusters) only visit a small part of the index at the
+price of a little recall. ``INDEX_TYPE = "auto"`` picks flat for small
+corpora, HNSW for medium ones and IVF for very large ones.
+
+The vectors can also be stored as compact codes (``INDEX_QUANTIZATION``):
+float16, int8, or binary codes compared by Hamming distance. The top
+``k * INDEX_RESCORE_FACTOR`` candidates are then rescored exactly against the
+float32 vectors, which are kept in the memory-mapped file and only paged in
+for those candidates.
+
+The index is always built from the exact vectors, so switching types never
+needs re-embedding. When the knowledge base changes, flat and IVF indexes
+are updated in place (IVF keeps its trained centroids as long as the list
+count stays within a factor of two of the ideal one); HNSW graphs can only
+grow in place, so any deleted chunk rebuilds the whole graph. Every type
+uses L2 distance like LangChain's default flat index, so scores keep meaning
+``cosine = 1 - d / 2`` for unit vectors.
+"""
+
+import logging
+import math
+import time
+
+import faiss
+import numpy as np
+
+from config.settings import (
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+    HNSW_M,
+    INDEX_HNSW_MIN_VECTORS,
+    INDEX_BINARY_RESCORE_FACTOR,
+    INDEX_IVF_MIN_VECTORS,
+    INDEX_QUANTIZATION,
+    INDEX_RESCORE_FACTOR,
+    INDEX_TYPE,
+    IVF_NLIST,
+    IVF_NPROBE,
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "hnsw", "ivf")
+QUANTIZATIONS = ("none", "fp16", "int8", "binary")
+
+_SCALAR_QUANTIZERS = {"fp16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+
+# FAISS needs about this many training points per IVF cluster
+_IVF_POINTS_PER_CLUSTER = 39
+# Training on more points than this per cluster barely changes the centroids
+_IVF_MAX_TRAINING_PER_CLUSTER = 256
+# Points used to fit the int8 value ranges
+_SQ_TRAINING_SIZE = 65536
+
+
+def choose_index_type(size):
+    if size >= INDEX_IVF_MIN_VECTORS:
+        return "ivf"
+    if size >= INDEX_HNSW_MIN_VECTORS:
+        return "hnsw"
+    return "flat"
+
+
+def index_spec(size, index_type=None, quantization=None):
+    """Type and parameters of the index to build for ``size`` vectors, as stored in the manifest"""
+    index_type = index_type or INDEX_TYPE
+    quantization = quantization or INDEX_QUANTIZATION
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+    if quantization == "binary":
+        # Hamming distance over 1-bit codes is cheap enough to scan exhaustively
+        index_type = "flat"
+    if index_type == "auto":
+        index_type = choose_index_type(size)
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected 'auto' or one of {INDEX_TYPES}")
+
+    if index_type == "hnsw":
+        spec = {"type": "hnsw", "m": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION, "ef_search": HNSW_EF_SEARCH}
+    elif index_type == "ivf":
+        nlist = IVF_NLIST or int(4 * math.sqrt(size))
+        nlist = max(1, min(nlist, size // _IVF_POINTS_PER_CLUSTER))
+        spec = {"type": "ivf", "nlist": nlist, "nprobe": min(IVF_NPROBE, nlist)}
+    else:
+        spec = {"type": "flat"}
+    if quantization != "none":
+        spec["quantization"] = quantization
+        spec["rescore_factor"] = INDEX_BINARY_RESCORE_FACTOR if quantization == "binary" else INDEX_RESCORE_FACTOR
+    return spec
+
+
+def spec_matches(stored, wanted):
+    """True if an index built as ``stored`` can keep serving where ``wanted`` would be built now.
+
+    IVF list counts follow the corpus size; an index whose count is within a
+    factor of two of the ideal one is kept rather than retrained.
+    """
+    stored = stored or {"type": "flat"}
+    if stored == wanted:
+        return True
+    if stored.get("type") != "ivf" or wanted["type"] != "ivf":
+        return False
+    same = {key: value for key, value in stored.items() if key not in ("nlist", "nprobe")} == \
+        {key: value for key, value in wanted.items() if key not in ("nlist", "nprobe")}
+    return same and wanted["nlist"] / 2 <= stored["nlist"] <= wanted["nlist"] * 2
+
+
+def _base(index):
+    return faiss.downcast_index(index.base_index) if isinstance(index, faiss.IndexRefine) else index
+
+
+def index_type(index):
+    index = _base(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def quantization(index):
+    base = _base(index)
+    if isinstance(base, faiss.IndexLSH):
+        return "binary"
+    if isinstance(base, (faiss.IndexScalarQuantizer, faiss.IndexHNSWSQ, faiss.IndexIVFScalarQuantizer)):
+        qtype = base.sq.qtype if hasattr(base, "sq") else faiss.downcast_index(base.storage).sq.qtype
+        return {code: name for name, code in _SCALAR_QUANTIZERS.items()}.get(qtype, "other")
+    return "none"
+
+
+def vectors(index):
+    """All vectors of a flat, HNSW or IVF index, in index order"""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def flat_index(index):
+    """Exact, writable copy of ``index`` (or ``index`` itself if it is already flat).
+
+    Incremental updates delete vectors, which HNSW does not support, so the
+    index is edited in flat form and converted again when it is saved.
+    """
+    if isinstance(index, faiss.IndexFlat):
+        return index
+    flat = faiss.IndexFlatL2(index.d)
+    flat.add(vectors(index))
+    return flat
+
+
+def _training_sample(data, size):
+    if len(data) <= size:
+        return data
+    return data[np.random.default_rng(0).choice(len(data), size, replace=False)]
+
+
+def build_index(index, spec):
+    """Return an index of the ``spec`` type holding the same vectors as ``index``, in the same order"""
+    codes = spec.get("quantization", "none")
+    if spec["type"] == index_type(index) and codes == quantization(index):
+        return index
+    started = time.perf_counter()
+    data = np.ascontiguousarray(vectors(index), dtype=np.float32)
+    dimension = index.d
+    qtype = _SCALAR_QUANTIZERS.get(codes)
+
+    if codes == "binary":
+        # One bit per dimension: the sign of each component
+        built = faiss.IndexLSH(dimension, dimension, False, False)
+    elif spec["type"] == "flat":
+        built = faiss.IndexFlatL2(dimension) if qtype is None else \
+            faiss.IndexScalarQuantizer(dimension, qtype, faiss.METRIC_L2)
+    elif spec["type"] == "hnsw":
+        built = faiss.IndexHNSWFlat(dimension, spec["m"]) if qtype is None else \
+            faiss.IndexHNSWSQ(dimension, qtype, spec["m"])
+        built.hnsw.efConstruction = spec["ef_construction"]
+        built.hnsw.efSearch = spec["ef_search"]
+    else:
+        quantizer = faiss.IndexFlatL2(dimension)
+        built = faiss.IndexIVFFlat(quantizer, dimension, spec["nlist"]) if qtype is None else \
+            faiss.IndexIVFScalarQuantizer(quantizer, dimension, spec["nlist"], qtype, faiss.METRIC_L2)
+        built.nprobe = spec["nprobe"]
+    if not built.is_trained:
+        size = spec["nlist"] * _IVF_MAX_TRAINING_PER_CLUSTER if "nlist" in spec else _SQ_TRAINING_SIZE
+        built.train(_training_sample(data, size))
+
+    if codes != "none":
+        # Rescore the best candidates against the float32 vectors kept alongside the codes
+        built = faiss.IndexRefineFlat(built)
+        built.k_factor = spec["rescore_factor"]
+    built.add(data)
+    logger.info("Built %s index (%s codes) over %d vectors in %.2fs",
+                spec["type"], codes, len(data), time.perf_counter() - started)
+    return built
+
+
+def _remove_positions(index, positions):
+    """Remove the vectors at sorted ``positions``; later vectors move up as in a flat index"""
+    if isinstance(index, faiss.IndexRefine):
+        _remove_positions(_base(index), positions)
+        _remove_positions(faiss.downcast_index(index.refine_index), positions)
+        index.ntotal -= len(positions)
+        return
+    if isinstance(index, faiss.IndexFlatCodes):
+        index.remove_ids(faiss.IDSelectorBatch(positions))
+        return
+    # IVF lists keep the ids they were added with; renumber them to stay positions
+    index.set_direct_map_type(faiss.DirectMap.NoMap)
+    index.remove_ids(faiss.IDSelectorBatch(positions))
+    lists = index.invlists
+    for list_no in range(index.nlist):
+        size = lists.list_size(list_no)
+        if size == 0:
+            continue
+        ids = faiss.rev_swig_ptr(lists.get_ids(list_no), size).copy()
+        codes = faiss.rev_swig_ptr(lists.get_codes(list_no), size * lists.code_size).copy()
+        ids -= np.searchsorted(positions, ids)
+        lists.update_entries(list_no, 0, size, faiss.swig_ptr(ids), faiss.swig_ptr(codes))
+
+
+def update_index(index, removed, added):
+    """Apply an incremental change in place: drop the vectors at ``removed`` positions, append ``added``.
+
+    Returns False, leaving ``index`` untouched, if it cannot be edited in place
+    (vectors cannot be deleted from an HNSW graph); build a new index then.
+    """
+    removed = np.unique(np.asarray(removed, dtype=np.int64))
+    if len(removed) and index_type(index) == "hnsw":
+        return False
+    started = time.perf_counter()
+    if len(removed):
+        _remove_positions(index, removed)
+    if len(added):
+        index.add(np.ascontiguousarray(added, dtype=np.float32))
+    logger.info("Updated %s index in place: %d vectors removed, %d added in %.2fs",
+                index_type(index), len(removed), len(added), time.perf_counter() - started)
+    return True
+
+
+def search_parameters(index, selector=None):
+    """Per-query search parameters carrying the index's own search depth, plus an optional id filter"""
+    if isinstance(index, faiss.IndexRefine):
+        return faiss.IndexRefineSearchParameters(
+            k_factor=index.k_factor, base_index_params=search_parameters(_base(index), selector)
+        )
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def search(index, queries, k, selector=None):
+    """``index.search`` restricted to the ids accepted by ``selector``, if any"""
+    if selector is None:
+        return index.search(queries, k)
+    if isinstance(_base(index), faiss.IndexLSH):
+        # Binary codes cannot be filtered; scan the selected full-precision vectors instead
+        return faiss.downcast_index(index.refine_index).search(queries, k, params=faiss.SearchParameters(sel=selector))
+    return index.search(queries, k, params=search_parameters(index, selector))
@@ -0,0 +1,195 @@
+"""
+Answer caches that sit in front of the LLM.
+
+``ExactAnswerCache`` is a persistent SQLite store keyed by the normalized
+question text, shared by every process on the host and consulted first.
+``SemanticAnswerCache`` returns a stored answer when a new question's
+embedding is within a cosine distance of a previous question asked against
+the same knowledge base version.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config.settings import (
+    EXACT_CACHE_PATH,
+    SEMANTIC_CACHE_MAX_DISTANCE,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_TTL_SECONDS,
+)
+
+
+def normalize_question(question):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    question = re.sub(r"[^\w\s]", "", question.lower())
+    return " ".join(question.split())
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class SemanticAnswerCache:
+    """In-process LRU/TTL cache keyed on query embeddings"""
+
+    def __init__(self, max_distance=SEMANTIC_CACHE_MAX_DISTANCE, max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # key -> (kb_version, answer, stored_at)
+        self._vectors = {}              # key -> normalized query vector
+        self._matrix = None             # stacked vectors, rebuilt after changes
+        self._matrix_keys = []
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    def _expired(self, stored_at, now):
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def _remove(self, key):
+        del self._entries[key]
+        del self._vectors[key]
+        self._matrix = None
+
+    def lookup(self, query_vector, kb_version):
+        """Return the cached answer closest to ``query_vector``, or None"""
+        query = _normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            for key, (_, _, stored_at) in list(self._entries.items()):
+                if self._expired(stored_at, now):
+                    self._remove(key)
+
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix_keys = list(self._vectors)
+                    self._matrix = np.stack([self._vectors[key] for key in self._matrix_keys])
+                distances = 1.0 - self._matrix @ query
+                # Best matches first; skip answers computed against another KB version
+                for position in np.argsort(distances):
+                    if distances[position] > self.max_distance:
+                        break
+                    key = self._matrix_keys[position]
+                    version, answer, _ = self._entries[key]
+                    if version == kb_version:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return answer
+
+            self.misses += 1
+            return None
+
+    def store(self, query_vector, answer, kb_version):
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = (kb_version, answer, time.time())
+            self._vectors[key] = _normalize(query_vector)
+            self._matrix = None
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._vectors.clear()
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class ExactAnswerCache:
+    """Persistent answer cache keyed by (knowledge base version, normalized question).
+
+    Uses SQLite in WAL mode so several processes can read while one writes.
+    Entries for other knowledge base versions are never returned. Each entry
+    records the index it was answered from (``index_path``), so serving a new
+    version of one index purges only that index's old entries.
+    """
+
+    def __init__(self, path=EXACT_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " kb_version TEXT NOT NULL,"
+                " question TEXT NOT NULL,"
+                " answer TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (kb_version, question))"
+            )
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(answers)")]
+            if "index_path" not in columns:
+                # Caches written before entries were tied to an index
+                connection.execute("ALTER TABLE answers ADD COLUMN index_path TEXT NOT NULL DEFAULT ''")
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def lookup(self, question, kb_version):
+        row = self._connection().execute(
+            "SELECT answer FROM answers WHERE kb_version = ? AND question = ?",
+            (kb_version, normalize_question(question)),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def store(self, question, answer, kb_version, index_path=""):
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO answers (kb_version, question, answer, created_at, index_path)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (kb_version, normalize_question(question), answer, time.time(), index_path),
+            )
+
+    def purge_stale(self, kb_version, index_path=""):
+        """Delete answers generated from other versions of the index at ``index_path``"""
+        with self._connection() as connection:
+            return connection.execute(
+                "DELETE FROM answers WHERE index_path = ? AND kb_version != ?", (index_path, kb_version)
+            ).rowcount
+
+    def stats(self):
+        entries = self._connection().execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
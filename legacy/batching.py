@@ -0,0 +1,137 @@
+"""
+Micro-batching of query embeddings.
+
+Every question used to be embedded on its own, so under load the model ran
+one batch-of-one forward pass after another. ``BatchingEmbeddings`` puts a
+queue in front of the model: a single worker thread embeds whatever queries
+are waiting in one call and hands each caller its vector through a future.
+
+When traffic is low the worker starts as soon as a query arrives, so a lone
+question is not delayed. Only when the previous batch had more than one query
+does it wait up to ``max_wait_ms`` for more to arrive.
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from langchain_core.embeddings import Embeddings
+
+from config.settings import EMBED_BATCH_MAX_SIZE, EMBED_BATCH_MAX_WAIT_MS
+from legacy.streaming import LatencyRecorder
+
+logger = logging.getLogger(__name__)
+
+
+class BatchingEmbeddings(Embeddings):
+    """Embeds concurrent queries together; documents are passed straight to ``underlying``"""
+
+    def __init__(self, underlying, max_batch_size=EMBED_BATCH_MAX_SIZE, max_wait_ms=EMBED_BATCH_MAX_WAIT_MS):
+        self.underlying = underlying
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.batches = 0
+        self.queries = 0
+        self.largest_batch = 0
+        self.queue_wait = LatencyRecorder()
+        self.batch_time = LatencyRecorder()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    # Passed through so callers can report on the wrapped model
+    @property
+    def loaded(self):
+        return getattr(self.underlying, "loaded", True)
+
+    @property
+    def load_seconds(self):
+        return getattr(self.underlying, "load_seconds", None)
+
+    @property
+    def load_bytes(self):
+        return getattr(self.underlying, "load_bytes", None)
+
+    def __getstate__(self):
+        # Worker processes get their own queue and thread
+        return {"underlying": self.underlying, "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _start(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def submit(self, text):
+        """Queue ``text`` and return a future for its vector"""
+        if self._worker is None:
+            self._start()
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def _collect(self, first, under_load):
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            try:
+                # Take what is already queued; wait for stragglers only when several users are active
+                remaining = deadline - time.perf_counter()
+                if under_load and remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        under_load = False
+        while True:
+            batch = self._collect(self._queue.get(), under_load)
+            started = time.perf_counter()
+            for _, _, queued in batch:
+                self.queue_wait.record(started - queued)
+            try:
+                vectors = self.underlying.embed_documents([text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            self.batch_time.record(time.perf_counter() - started)
+            with self._lock:
+                self.batches += 1
+                self.queries += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+            under_load = len(batch) > 1
+
+    def embed_documents(self, texts):
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.submit(text).result()
+
+    async def aembed_query(self, text):
+        # Wait on the future without holding a thread
+        return await asyncio.wrap_future(self.submit(text))
+
+    def stats(self):
+        with self._lock:
+            batches, queries, largest = self.batches, self.queries, self.largest_batch
+        return {
+            "batches": batches,
+            "queries": queries,
+            "batch_size_avg": round(queries / batches, 2) if batches else None,
+            "batch_size_max": largest,
+            "queue_wait_ms": self.queue_wait.summary(),
+            "batch_ms": self.batch_time.summary(),
+        }
@@ -1,5 +1,6 @@
 # Import the function that builds the retrieval-augmented chatbot pipeline
 from retrieval_chain import build_retrieval_chain
+from streaming import AnswerStream
 
 def main():
     print("\nRetrieval-Augmented Chatbot Initialized")
@@ -40,21 +41,22 @@ def main():
                 continue
 
 
-        # Invoke the retrieval augmented chain with (user input and session ID)
+        # Stream the retrieval augmented chain's answer (user input and session ID) as it is generated
         try:
-            response = qa_chain.invoke(
-                {"input": user_input},
-                config={"configurable": {"session_id": session_id}}
-            )
+            answer = AnswerStream(qa_chain, user_input, session_id, fallback_keywords)
+            started = False
+            for text in answer:
+                if not started:
+                    print("\nBot: ", end="", flush=True)
+                    started = True
+                print(text, end="", flush=True)
+            if started:
+                print()
 
-
-            # Check if the response contains any fallback trigger phrases
-            response_lower = response.lower()
-            if any(trigger in response_lower for trigger in fallback_keywords):
+            # Fallback trigger phrases are detected on the streamed text
+            if answer.is_fallback:
                 print("\nBot: I'm not confident I can assist with that. Would you like me to connect you to a live agent? (yes/no)")
                 pending_handover = True
-            else:
-                print("\nBot:", response)
 
         except Exception as e:
             print("An error occurred:", str(e))
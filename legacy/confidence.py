@@ -0,0 +1,130 @@
+"""
+Pre-generation confidence gate on retrieval scores.
+
+If the best chunk is not similar enough to the question, or does not stand
+out from the other candidates, the knowledge base almost certainly cannot
+answer it. The gate then hands the user to a live agent straight away,
+without paying for an LLM call whose answer would be the fallback phrase.
+
+Thresholds are cosine similarities and only meaningful for unit-length
+embeddings (such as all-MiniLM-L6-v2); calibrate them with
+``scripts/calibrate_gate.py``.
+"""
+
+import logging
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from config.settings import CONFIDENCE_MIN_MARGIN, CONFIDENCE_MIN_TOP_SCORE
+
+logger = logging.getLogger(__name__)
+
+# Same wording as the fallback the prompt asks the LLM to use, so the UIs detect it the same way
+HANDOVER_MESSAGE = "*I'm not confident I can assist with that. Let me connect you to a live agent.*"
+
+Decision = namedtuple("Decision", ["answerable", "top_score", "margin", "reason"])
+
+
+def retrieval_scores(dense_scores):
+    """Top cosine similarity and its margin over the mean of the other candidates"""
+    if not dense_scores:
+        return None, None
+    top = float(dense_scores[0])
+    rest = dense_scores[1:]
+    margin = top - float(np.mean(rest)) if rest else top
+    return top, margin
+
+
+class ConfidenceGate:
+    """Decides from retrieval scores whether a question should reach the LLM"""
+
+    def __init__(self, min_top_score=CONFIDENCE_MIN_TOP_SCORE, min_margin=CONFIDENCE_MIN_MARGIN):
+        self.min_top_score = min_top_score
+        self.min_margin = min_margin
+        self.passed = 0
+        self.handed_over = 0
+        self.unscored = 0
+        self._lock = threading.Lock()
+
+    def check(self, question, dense_scores, query_vector=None):
+        """Return a ``Decision`` for a question given its dense candidates' similarities (best first)"""
+        if query_vector is not None and abs(float(np.linalg.norm(query_vector)) - 1.0) > 1e-2:
+            # Scores are not cosine similarities, so the thresholds do not apply
+            decision = Decision(True, None, None, "unnormalized")
+        else:
+            top, margin = retrieval_scores(dense_scores)
+            if top is None:
+                decision = Decision(False, None, None, "no_candidates")
+            elif top < self.min_top_score:
+                decision = Decision(False, top, margin, "low_similarity")
+            elif margin < self.min_margin:
+                decision = Decision(False, top, margin, "low_margin")
+            else:
+                decision = Decision(True, top, margin, "confident")
+
+        with self._lock:
+            if decision.reason == "unnormalized":
+                self.unscored += 1
+            elif decision.answerable:
+                self.passed += 1
+            else:
+                self.handed_over += 1
+        logger.info(
+            "Confidence gate %s (%s): top=%s margin=%s",
+            "pass" if decision.answerable else "handover",
+            decision.reason,
+            "n/a" if decision.top_score is None else f"{decision.top_score:.3f}",
+            "n/a" if decision.margin is None else f"{decision.margin:.3f}",
+        )
+        # User text is only logged when debugging thresholds
+        logger.debug("Confidence gate %s question=%r", decision.reason, question)
+        return decision
+
+    def stats(self):
+        with self._lock:
+            checked = self.passed + self.handed_over
+            return {
+                "passed": self.passed,
+                "handed_over": self.handed_over,
+                "unscored": self.unscored,
+                "handover_rate": round(self.handed_over / checked, 3) if checked else 0.0,
+            }
+
+
+def _candidate_thresholds(values):
+    # Midpoints between observed scores, so a threshold never sits exactly on a labelled example
+    values = sorted(set(values))
+    return [0.0] + [round((low + high) / 2, 4) for low, high in zip(values, values[1:])]
+
+
+def calibrate(samples, min_recall=0.95):
+    """Pick thresholds from labelled ``(top_score, margin, answerable)`` samples.
+
+    Returns ``(min_top_score, min_margin, accuracy, recall)`` for the most
+    accurate setting that still passes at least ``min_recall`` of the
+    answerable questions, since a wrong handover costs more than an LLM call.
+    Among equally accurate settings the least strict one wins.
+    """
+    if not samples:
+        return 0.0, 0.0, None, None
+    answerable = sum(1 for _, _, label in samples if label)
+    best = None
+    for min_top in _candidate_thresholds(top for top, _, _ in samples):
+        for min_margin in _candidate_thresholds(margin for _, margin, _ in samples):
+            correct = passed = 0
+            for top, margin, label in samples:
+                predicted = top >= min_top and margin >= min_margin
+                correct += predicted == label
+                passed += predicted and label
+            recall = passed / answerable if answerable else 1.0
+            if recall < min_recall:
+                continue
+            candidate = (correct / len(samples), -min_top, -min_margin, recall)
+            if best is None or candidate > best:
+                best = candidate
+    if best is None:
+        return 0.0, 0.0, None, None
+    accuracy, min_top, min_margin, recall = best
+    return -min_top, -min_margin, accuracy, recall
@@ -0,0 +1,130 @@
+"""
+Assembly of retrieved chunks into the prompt's context.
+
+Neighbouring chunks share up to ``CHUNK_OVERLAP`` characters, and the
+knowledge base repeats some sections, so concatenating retrieved chunks
+wastes prompt tokens on repeated text. The packer drops weak and duplicate
+chunks, stitches chunks from the same source back together where they
+overlap, and fills a token budget in relevance order.
+"""
+
+import logging
+import threading
+
+from config.settings import CHUNK_OVERLAP, CONTEXT_MIN_SIMILARITY, CONTEXT_TOKEN_BUDGET
+from legacy.memory import count_tokens
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = "\n\n"
+
+# Shorter shared spans are more likely to be coincidence than chunk overlap
+MIN_OVERLAP_CHARS = 20
+
+
+def overlap_length(first, second, max_length=CHUNK_OVERLAP * 2):
+    """Length of the longest suffix of ``first`` that is a prefix of ``second``"""
+    longest = min(len(first), len(second), max_length)
+    for length in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:length]):
+            return length
+    return 0
+
+
+def _merge_adjacent(blocks):
+    """Join blocks from the same source whose texts overlap, until none do"""
+    merged = True
+    while merged:
+        merged = False
+        for i, first in enumerate(blocks):
+            for j, second in enumerate(blocks):
+                if i == j or first["source"] != second["source"]:
+                    continue
+                length = overlap_length(first["text"], second["text"])
+                if length:
+                    first["text"] += second["text"][length:]
+                    first["rank"] = min(first["rank"], second["rank"])
+                    del blocks[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return blocks
+
+
+def _truncate(text, budget):
+    # Keep whole lines while they fit
+    kept = []
+    for line in text.splitlines():
+        if count_tokens("\n".join(kept + [line])) > budget:
+            break
+        kept.append(line)
+    return "\n".join(kept)
+
+
+class ContextPacker:
+    """Turns retriever hits into a deduplicated context string within a token budget"""
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, min_similarity=CONTEXT_MIN_SIMILARITY):
+        self.token_budget = token_budget
+        self.min_similarity = min_similarity
+        self.requests = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.last_saved = 0
+        self._lock = threading.Lock()
+
+    def pack(self, hits):
+        """Return the context text for ``hits`` (best first)"""
+        hits = list(hits)
+        naive = SEPARATOR.join(hit.document.page_content for hit in hits)
+
+        # Keep the best hit even if it is weak, so the context is never empty
+        strong = [hit for hit in hits
+                  if hit.dense_score is None or hit.dense_score >= self.min_similarity] or hits[:1]
+
+        blocks = []
+        seen = set()
+        for rank, hit in enumerate(strong):
+            text = hit.document.page_content.strip()
+            if text in seen:
+                continue
+            seen.add(text)
+            blocks.append({"text": text, "source": hit.document.metadata.get("source"), "rank": rank})
+        blocks = sorted(_merge_adjacent(blocks), key=lambda block: block["rank"])
+
+        packed = []
+        used = 0
+        for block in blocks:
+            tokens = count_tokens(block["text"])
+            if used + tokens > self.token_budget:
+                if packed:
+                    continue
+                # The most relevant block alone is over budget: keep what fits of it
+                block["text"] = _truncate(block["text"], self.token_budget)
+                tokens = count_tokens(block["text"])
+            packed.append(block["text"])
+            used += tokens
+        context = SEPARATOR.join(packed)
+
+        tokens_in = count_tokens(naive)
+        tokens_out = count_tokens(context)
+        logger.debug("Packed %d chunks into %d blocks: %d -> %d context tokens",
+                     len(hits), len(packed), tokens_in, tokens_out)
+        with self._lock:
+            self.requests += 1
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+            self.last_saved = tokens_in - tokens_out
+        return context
+
+    def stats(self):
+        with self._lock:
+            saved = self.tokens_in - self.tokens_out
+            return {
+                "requests": self.requests,
+                "tokens_saved": saved,
+                "tokens_saved_avg": round(saved / self.requests, 1) if self.requests else None,
+                "tokens_saved_last": self.last_saved,
+                "tokens_avg": round(self.tokens_out / self.requests, 1) if self.requests else None,
+            }
@@ -0,0 +1,346 @@
+"""
+Embedding model wrappers used by the vector store.
+
+``build_embeddings()`` returns the stack used by the app: a lazily loaded
+HuggingFace model (or its ONNX export, see ``legacy/onnx_embeddings.py``)
+behind a content-addressed cache for document vectors and an in-process LRU
+for query vectors. Concurrent query misses are embedded together (see
+``legacy/batching.py``).
+"""
+
+import hashlib
+import logging
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config.settings import (
+    EMBED_BACKEND,
+    EMBED_BATCHING_ENABLED,
+    EMBED_MODEL,
+    EMBED_CACHE_ENABLED,
+    EMBED_CACHE_PATH,
+    EMBED_ONNX_QUANTIZED,
+    EMBED_QUERY_CACHE_SIZE,
+)
+from legacy.metrics import current_rss_bytes
+
+logger = logging.getLogger(__name__)
+
+
+class LazyEmbeddings(Embeddings):
+    """Defers loading the HuggingFace model (and importing torch) until the first embed call.
+
+    Loading a persisted FAISS index does not need the model, so startup only pays
+    for it when the first query has to be embedded. ``load_seconds`` and
+    ``load_bytes`` (resident memory added by the load) are None until then.
+    """
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.load_seconds = None
+        self.load_bytes = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    rss_before = current_rss_bytes()
+                    from langchain_huggingface import HuggingFaceEmbeddings
+                    model = HuggingFaceEmbeddings(model_name=self.model_name)
+                    self.load_seconds = time.perf_counter() - started
+                    self.load_bytes = max(current_rss_bytes() - rss_before, 0)
+                    logger.info("Loaded embedding model %s in %.2fs (%.1f MB)", self.model_name,
+                                self.load_seconds, self.load_bytes / (1024 * 1024))
+                    self._model = model
+        return self._model
+
+    def __getstate__(self):
+        # Ship only the model name to worker processes; each one loads its own copy
+        return {"model_name": self.model_name}
+
+    def __setstate__(self, state):
+        self.__init__(state["model_name"])
+
+    def embed_documents(self, texts):
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.model.embed_query(text)
+
+
+class EmbeddingStore:
+    """Append-only binary file mapping a 32-byte key to a float32 vector.
+
+    Layout: a 16-byte header (magic, format version, dimension) followed by
+    fixed-size records of ``key + vector``. Records are memory-mapped, including
+    the ones this process appends, so vectors never pile up in Python memory; a
+    partially written trailing record is ignored. The key index is only built
+    on the first lookup, so opening a large cache costs nothing at startup.
+    """
+
+    MAGIC = b"EMBCACHE"
+    VERSION = 1
+    HEADER = struct.Struct("<8sII")
+
+    def __init__(self, path):
+        self.path = path
+        self.dim = None
+        self._rows = None      # key -> row in the mapped file, built on first use
+        self._vectors = None
+        self._usable = True
+        self._lock = threading.Lock()
+
+    def _record(self):
+        return np.dtype([("key", "S32"), ("vector", "<f4", (self.dim,))])
+
+    def _read_header(self):
+        try:
+            with open(self.path, "rb") as store_file:
+                header = store_file.read(self.HEADER.size)
+        except FileNotFoundError:
+            return None
+        if len(header) < self.HEADER.size:
+            return None
+        magic, version, dim = self.HEADER.unpack(header)
+        if magic != self.MAGIC or version != self.VERSION:
+            logger.warning("Ignoring embedding cache %s with unknown format", self.path)
+            self._usable = False
+            return None
+        return dim
+
+    def _map(self):
+        """Map every complete record currently in the file; return them (None if there are none)"""
+        count = (os.path.getsize(self.path) - self.HEADER.size) // self._record().itemsize
+        if count == 0:
+            return None
+        records = np.memmap(self.path, dtype=self._record(), mode="r", offset=self.HEADER.size, shape=(count,))
+        self._vectors = records["vector"]
+        return records
+
+    def _load(self):
+        if self._rows is not None:
+            return
+        self._rows = {}
+        self.dim = self._read_header()
+        if self.dim is None:
+            return
+        records = self._map()
+        if records is not None:
+            self._rows = {bytes(key): row for row, key in enumerate(records["key"])}
+
+    def _create(self, dim):
+        """Write the header of a new file; only one of several racing processes gets to"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            descriptor = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            # Another process created it; wait for its header
+            for _ in range(100):
+                existing = self._read_header()
+                if existing is not None or not self._usable:
+                    return existing
+                time.sleep(0.01)
+            return None
+        try:
+            os.write(descriptor, self.HEADER.pack(self.MAGIC, self.VERSION, dim))
+        finally:
+            os.close(descriptor)
+        return dim
+
+    def __len__(self):
+        with self._lock:
+            if self._rows is not None:
+                return len(self._rows)
+        dim = self.dim or self._read_header()
+        if dim is None:
+            return 0
+        record_size = 32 + 4 * dim
+        return max(os.path.getsize(self.path) - self.HEADER.size, 0) // record_size
+
+    def get(self, key):
+        with self._lock:
+            self._load()
+            row = self._rows.get(key)
+            return None if row is None else self._vectors[row].tolist()
+
+    def put_many(self, items):
+        """Append ``(key, vector)`` pairs; each record is a single write so processes can share the file"""
+        if not items:
+            return
+        with self._lock:
+            self._load()
+            if not self._usable:
+                return
+            if self.dim is None:
+                self.dim = self._create(len(items[0][1]))
+                if self.dim is None:
+                    return
+            record_size = self._record().itemsize
+            # Drop a record left half-written by a crash, so new ones start on a record boundary
+            size = os.path.getsize(self.path)
+            aligned = size - (size - self.HEADER.size) % record_size
+            if aligned != size:
+                os.truncate(self.path, aligned)
+            appended = {}
+            # Unbuffered: every record is one write() at the current end of the file
+            with open(self.path, "ab", buffering=0) as store_file:
+                for key, vector in items:
+                    if len(vector) != self.dim or key in self._rows or key in appended:
+                        continue
+                    store_file.write(key + np.asarray(vector, dtype="<f4").tobytes())
+                    appended[key] = (store_file.tell() - self.HEADER.size) // record_size - 1
+            if appended:
+                self._map()
+                self._rows.update(appended)
+
+
+class CachedEmbeddings(Embeddings):
+    """Caches document vectors on disk and query vectors in a bounded LRU.
+
+    Document keys hash the model name and backend (see ``embedding_backend``)
+    with the text, so a cache file can be reused across index rebuilds and
+    never returns vectors from another model or precision.
+    """
+
+    def __init__(self, underlying, model_name, store_path=EMBED_CACHE_PATH, query_cache_size=EMBED_QUERY_CACHE_SIZE,
+                 backend="torch"):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.backend = backend
+        self.store = EmbeddingStore(store_path)
+        self.query_cache_size = query_cache_size
+        self.document_hits = 0
+        self.document_misses = 0
+        self.query_hits = 0
+        self.query_misses = 0
+        self._queries = OrderedDict()
+        self._query_lock = threading.Lock()
+
+    # Passed through so callers can report on the wrapped model
+    @property
+    def loaded(self):
+        return getattr(self.underlying, "loaded", True)
+
+    @property
+    def load_seconds(self):
+        return getattr(self.underlying, "load_seconds", None)
+
+    @property
+    def load_bytes(self):
+        return getattr(self.underlying, "load_bytes", None)
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{self.backend}\0{text}".encode("utf-8")).digest()
+
+    def cached(self, texts):
+        """Return cached vectors for ``texts`` (None where missing)"""
+        vectors = [self.store.get(self._key(text)) for text in texts]
+        hits = sum(vector is not None for vector in vectors)
+        self.document_hits += hits
+        self.document_misses += len(texts) - hits
+        return vectors
+
+    def remember(self, texts, vectors):
+        self.store.put_many([(self._key(text), vector) for text, vector in zip(texts, vectors)])
+
+    def embed_documents(self, texts):
+        vectors = self.cached(texts)
+        missing = [position for position, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.underlying.embed_documents([texts[position] for position in missing])
+            for position, vector in zip(missing, computed):
+                vectors[position] = vector
+            self.remember([texts[position] for position in missing], computed)
+        return vectors
+
+    def _cached_query(self, text):
+        with self._query_lock:
+            vector = self._queries.get(text)
+            if vector is not None:
+                self._queries.move_to_end(text)
+                self.query_hits += 1
+                return vector
+            self.query_misses += 1
+            return None
+
+    def _remember_query(self, text, vector):
+        with self._query_lock:
+            self._queries[text] = vector
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+
+    def embed_query(self, text):
+        vector = self._cached_query(text)
+        if vector is None:
+            vector = self.underlying.embed_query(text)
+            self._remember_query(text, vector)
+        return vector
+
+    async def aembed_query(self, text):
+        vector = self._cached_query(text)
+        if vector is None:
+            vector = await self.underlying.aembed_query(text)
+            self._remember_query(text, vector)
+        return vector
+
+    def stats(self):
+        documents = self.document_hits + self.document_misses
+        queries = self.query_hits + self.query_misses
+        return {
+            "document_entries": len(self.store),
+            "document_hits": self.document_hits,
+            "document_misses": self.document_misses,
+            "document_hit_rate": round(self.document_hits / documents, 3) if documents else 0.0,
+            "query_entries": len(self._queries),
+            "query_hits": self.query_hits,
+            "query_misses": self.query_misses,
+            "query_hit_rate": round(self.query_hits / queries, 3) if queries else 0.0,
+        }
+
+
+def embedding_backend(model_name=EMBED_MODEL, backend=None):
+    """What ``build_embeddings`` computes vectors with: "torch", "onnx-fp32" or "onnx-int8".
+
+    The vectors of each differ slightly, so the name is part of the embedding
+    cache keys and of the index settings.
+    """
+    if (backend or EMBED_BACKEND) == "onnx":
+        from legacy.onnx_embeddings import onnx_available
+        if onnx_available(model_name):
+            return "onnx-int8" if EMBED_ONNX_QUANTIZED else "onnx-fp32"
+    return "torch"
+
+
+def build_embeddings(model_name=EMBED_MODEL, backend=None, cache_path=EMBED_CACHE_PATH):
+    """Embeddings used by the app and the index builder"""
+    resolved = embedding_backend(model_name, backend)
+    if resolved == "torch":
+        if (backend or EMBED_BACKEND) == "onnx":
+            logger.warning("ONNX embeddings unavailable (install onnxruntime and run scripts/export_onnx.py), "
+                           "using the torch backend")
+        embeddings = LazyEmbeddings(model_name)
+    else:
+        from legacy.onnx_embeddings import OnnxEmbeddings
+        embeddings = OnnxEmbeddings(model_name, quantized=resolved == "onnx-int8")
+    if EMBED_BATCHING_ENABLED:
+        from legacy.batching import BatchingEmbeddings
+        embeddings = BatchingEmbeddings(embeddings)
+    if EMBED_CACHE_ENABLED:
+        embeddings = CachedEmbeddings(embeddings, model_name, store_path=cache_path, backend=resolved)
+    return embeddings
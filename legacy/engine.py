@@ -0,0 +1,158 @@
+"""
+Process-wide RAG engine shared by every chat session.
+
+The embedding model, FAISS index and LLM client are expensive to create, so
+they are built once per process and reused by all Streamlit sessions and
+threads. Sessions only keep their own ``session_id`` and UI state.
+"""
+
+import logging
+import threading
+import time
+
+from config.settings import (
+    COALESCE_ENABLED,
+    CONFIDENCE_GATE_ENABLED,
+    EXACT_CACHE_ENABLED,
+    HISTORY_PERSISTENCE_ENABLED,
+    MEMORY_MODE,
+    RERANK_ENABLED,
+    SEMANTIC_CACHE_ENABLED,
+)
+from legacy.answer_cache import ExactAnswerCache, SemanticAnswerCache
+from legacy.batching import BatchingEmbeddings
+from legacy.confidence import ConfidenceGate
+from legacy.context import ContextPacker
+from legacy.embeddings import CachedEmbeddings
+from legacy.history_store import SQLiteHistoryBackend
+from legacy.memory import ConversationMemory
+from legacy.metrics import current_rss_bytes
+from legacy.rerank import CrossEncoderReranker
+from legacy.retrieval import HybridRetriever
+from legacy.retrieval_chain import build_llm, build_retrieval_chain, load_vector_store
+from legacy.session_store import SessionStore
+from legacy.singleflight import SingleFlight
+from legacy.streaming import time_to_first_token, time_to_last_token
+
+logger = logging.getLogger(__name__)
+
+# Reference point for cold start measurements (first import happens at app startup)
+_PROCESS_STARTED = time.perf_counter()
+
+
+class RAGEngine:
+    """Holds the heavy, thread-safe parts of the chatbot: model, index and LLM client"""
+
+    # Number of engines built in this process; should stay at 1
+    instances = 0
+
+    def __init__(self):
+        started = time.perf_counter()
+        rss_before = current_rss_bytes()
+
+        self.vector_store = load_vector_store()
+        self.index_load_seconds = time.perf_counter() - started
+        self.llm = build_llm()
+        self.retriever = HybridRetriever(self.vector_store)
+        self.reranker = CrossEncoderReranker() if RERANK_ENABLED else None
+        self.context_packer = ContextPacker()
+        self.gate = ConfidenceGate() if CONFIDENCE_GATE_ENABLED else None
+        self.answer_cache = SemanticAnswerCache() if SEMANTIC_CACHE_ENABLED else None
+        self.exact_cache = ExactAnswerCache() if EXACT_CACHE_ENABLED else None
+        self.sessions = SessionStore(backend=SQLiteHistoryBackend() if HISTORY_PERSISTENCE_ENABLED else None)
+        self.memory = ConversationMemory(self.llm) if MEMORY_MODE == "summary" else None
+        self.singleflight = SingleFlight() if COALESCE_ENABLED else None
+        chain = build_retrieval_chain(
+            vector_store=self.vector_store,
+            llm=self.llm,
+            answer_cache=self.answer_cache,
+            exact_cache=self.exact_cache,
+            sessions=self.sessions,
+            memory=self.memory,
+            retriever=self.retriever,
+            reranker=self.reranker,
+            context_packer=self.context_packer,
+            gate=self.gate,
+            singleflight=self.singleflight,
+        )
+        self.chain = chain.with_listeners(on_end=self._record_answer)
+
+        # Without the embedding model, which loads on the first embed (see model_memory_bytes)
+        self.memory_bytes = max(current_rss_bytes() - rss_before, 0)
+        self.build_seconds = time.perf_counter() - started
+        self.cold_start_seconds = None
+        RAGEngine.instances += 1
+
+    def _record_answer(self, run):
+        # Only the first answer after startup is a cold start
+        if self.cold_start_seconds is None:
+            self.cold_start_seconds = time.perf_counter() - _PROCESS_STARTED
+            logger.info(
+                "Cold start to first answer: %.2fs (index load %.2fs, embedding model load %s)",
+                self.cold_start_seconds,
+                self.index_load_seconds,
+                self._model_load_text(),
+            )
+
+    def _model_load_text(self):
+        load_seconds = getattr(self.vector_store.embeddings, "load_seconds", None)
+        if load_seconds is None:
+            return "n/a"
+        return f"{load_seconds:.2f}s, {self.model_memory_bytes / (1024 * 1024):.1f} MB"
+
+    @property
+    def model_memory_bytes(self):
+        """Memory taken by loading the embedding model, or None until it is loaded"""
+        return getattr(self.vector_store.embeddings, "load_bytes", None)
+
+    def stats(self):
+        """Return engine metrics for display in the UI"""
+        stats = {
+            "engines": RAGEngine.instances,
+            "engine_memory_mb": round((self.memory_bytes + (self.model_memory_bytes or 0)) / (1024 * 1024), 1),
+            "embedding_model_memory_mb": None if self.model_memory_bytes is None
+            else round(self.model_memory_bytes / (1024 * 1024), 1),
+            "process_rss_mb": round(current_rss_bytes() / (1024 * 1024), 1),
+            "build_seconds": round(self.build_seconds, 2),
+            "index_load_seconds": round(self.index_load_seconds, 2),
+            "cold_start_seconds": None if self.cold_start_seconds is None else round(self.cold_start_seconds, 2),
+            "time_to_first_token": time_to_first_token.summary(),
+            "time_to_last_token": time_to_last_token.summary(),
+        }
+        stats.update({f"retrieval_{key}": value for key, value in self.retriever.stats().items()})
+        stats.update({f"sessions_{key}": value for key, value in self.sessions.stats().items()})
+        stats.update({f"context_{key}": value for key, value in self.context_packer.stats().items()})
+        if self.gate is not None:
+            stats.update({f"gate_{key}": value for key, value in self.gate.stats().items()})
+        if self.reranker is not None:
+            stats.update({f"rerank_{key}": value for key, value in self.reranker.stats().items()})
+        if self.singleflight is not None:
+            stats.update({f"coalesce_{key}": value for key, value in self.singleflight.stats().items()})
+        if self.memory is not None:
+            stats.update({f"memory_{key}": value for key, value in self.memory.stats().items()})
+        if self.answer_cache is not None:
+            stats.update({f"semantic_cache_{key}": value for key, value in self.answer_cache.stats().items()})
+        if self.exact_cache is not None:
+            stats.update({f"exact_cache_{key}": value for key, value in self.exact_cache.stats().items()})
+        embeddings = self.vector_store.embeddings
+        if isinstance(embeddings, CachedEmbeddings):
+            stats.update({f"embedding_cache_{key}": value for key, value in embeddings.stats().items()})
+            embeddings = embeddings.underlying
+        if isinstance(embeddings, BatchingEmbeddings):
+            stats.update({f"embedding_batch_{key}": value for key, value in embeddings.stats().items()})
+        return stats
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the shared engine, building it on first use"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            # Another thread may have built it while we waited for the lock
+            if _engine is None:
+                _engine = RAGEngine()
+    return _engine
@@ -0,0 +1,292 @@
+"""
+Durable chat history backed by SQLite in WAL mode.
+
+Appends are queued and written by a background thread in batched
+transactions, so answering a question never waits on disk. Sessions are
+restored lazily when a user comes back, and only the most recent messages
+(plus the rolling summary) are read, which keeps recovery time bounded no
+matter how long a conversation was. Writes still waiting in the queue are
+also indexed by session in memory, so a restore merges them with what is on
+disk instead of waiting for the writer.
+
+Sessions idle for longer than ``HISTORY_RETENTION_DAYS`` are deleted by the
+writer thread, so the database does not grow without bound.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from langchain_core.messages import message_to_dict, messages_from_dict
+
+from config.settings import (
+    HISTORY_BATCH_SIZE,
+    HISTORY_DB_PATH,
+    HISTORY_FLUSH_INTERVAL_SECONDS,
+    HISTORY_PRUNE_INTERVAL_SECONDS,
+    HISTORY_RESTORE_MESSAGES,
+    HISTORY_RETENTION_DAYS,
+)
+
+logger = logging.getLogger(__name__)
+
+# ``offset`` is the sequence number of the first restored message
+RestoredSession = namedtuple("RestoredSession", ["messages", "summary", "summarized", "offset"])
+
+
+class SQLiteHistoryBackend:
+    """Write-behind persistence for ``SessionHistory`` objects"""
+
+    def __init__(self, path=HISTORY_DB_PATH, flush_interval=HISTORY_FLUSH_INTERVAL_SECONDS,
+                 batch_size=HISTORY_BATCH_SIZE, restore_messages=HISTORY_RESTORE_MESSAGES,
+                 retention_days=HISTORY_RETENTION_DAYS, prune_interval=HISTORY_PRUNE_INTERVAL_SECONDS):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.restore_messages = restore_messages
+        self.retention_days = retention_days
+        self.prune_interval = prune_interval
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.pruned = 0
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._closed = False
+        # session_id -> queued but unwritten updates (see _track / _settle)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._next_prune = time.monotonic()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " session_id TEXT NOT NULL,"
+                " seq INTEGER NOT NULL,"
+                " data TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (session_id, seq))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY,"
+                " summary TEXT NOT NULL,"
+                " summarized INTEGER NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+
+        self._writer = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    # Request path: only enqueue
+
+    def append(self, session_id, start_seq, messages):
+        now = time.time()
+        for seq, message in enumerate(messages, start_seq):
+            self._enqueue(("message", session_id, seq, json.dumps(message_to_dict(message)), now))
+
+    def save_summary(self, session_id, summary, summarized):
+        self._enqueue(("summary", session_id, summary, summarized, time.time()))
+
+    def delete(self, session_id):
+        self._enqueue(("delete", session_id))
+
+    def _enqueue(self, item):
+        with self._pending_lock:
+            self._track(item)
+        self._queue.put(item)
+
+    def _track(self, item):
+        kind, session_id = item[0], item[1]
+        if kind == "delete":
+            # Earlier queued updates of the session no longer matter to a restore
+            self._pending[session_id] = {"messages": {}, "summary": None, "delete": item}
+            return
+        pending = self._pending.setdefault(session_id, {"messages": {}, "summary": None, "delete": None})
+        if kind == "message":
+            pending["messages"][item[2]] = item
+        else:
+            pending["summary"] = item
+
+    def _settle(self, batch):
+        # Forget written updates, unless a newer one for the same slot was queued meanwhile
+        with self._pending_lock:
+            for item in batch:
+                kind = item[0]
+                if kind not in ("message", "summary", "delete"):
+                    continue
+                pending = self._pending.get(item[1])
+                if pending is None:
+                    continue
+                if kind == "message":
+                    if pending["messages"].get(item[2]) is item:
+                        del pending["messages"][item[2]]
+                elif pending[kind] is item:
+                    pending[kind] = None
+                if not pending["messages"] and pending["summary"] is None and pending["delete"] is None:
+                    del self._pending[item[1]]
+
+    def flush(self, timeout=10.0):
+        """Block until everything queued so far is on disk"""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self):
+        if not self._closed:
+            self.flush()
+            self._closed = True
+            self._queue.put(None)
+            self._writer.join(timeout=10.0)
+
+    # Background writer
+
+    def _run(self):
+        while True:
+            if self.retention_days is not None and time.monotonic() >= self._next_prune:
+                self._next_prune = time.monotonic() + self.prune_interval
+                self.prune()
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+            batch = [item]
+            # Collect whatever else is already queued into the same transaction
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write(batch)
+                    return
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        waiters = [item[1] for item in batch if item[0] == "flush"]
+        try:
+            with self._connection() as connection:
+                for item in batch:
+                    kind = item[0]
+                    if kind == "message":
+                        connection.execute(
+                            "INSERT OR REPLACE INTO messages (session_id, seq, data, created_at) VALUES (?, ?, ?, ?)",
+                            item[1:],
+                        )
+                    elif kind == "summary":
+                        connection.execute(
+                            "INSERT OR REPLACE INTO sessions (session_id, summary, summarized, updated_at)"
+                            " VALUES (?, ?, ?, ?)",
+                            item[1:],
+                        )
+                    elif kind == "delete":
+                        connection.execute("DELETE FROM messages WHERE session_id = ?", (item[1],))
+                        connection.execute("DELETE FROM sessions WHERE session_id = ?", (item[1],))
+            self.written += sum(1 for item in batch if item[0] == "message")
+            self.batches += 1
+        except sqlite3.Error:
+            self.failures += 1
+            logger.exception("Failed to persist %d chat history updates", len(batch))
+        finally:
+            self._settle(batch)
+            for done in waiters:
+                done.set()
+
+    def prune(self, older_than=None):
+        """Delete sessions with no activity since ``older_than`` (default: the retention period); return how many"""
+        if older_than is None:
+            if self.retention_days is None:
+                return 0
+            older_than = time.time() - self.retention_days * 86400
+        expired = (
+            "SELECT session_id FROM ("
+            " SELECT session_id, created_at AS at FROM messages"
+            " UNION ALL SELECT session_id, updated_at FROM sessions)"
+            " GROUP BY session_id HAVING MAX(at) < ?"
+        )
+        try:
+            with self._connection() as connection:
+                count = connection.execute(f"SELECT COUNT(*) FROM ({expired})", (older_than,)).fetchone()[0]
+                if count:
+                    connection.execute(f"DELETE FROM messages WHERE session_id IN ({expired})", (older_than,))
+                    connection.execute(f"DELETE FROM sessions WHERE session_id IN ({expired})", (older_than,))
+        except sqlite3.Error:
+            logger.exception("Failed to prune expired chat history")
+            return 0
+        if count:
+            self.pruned += count
+            logger.info("Pruned %d chat sessions idle since %s", count, time.ctime(older_than))
+        return count
+
+    # Restore
+
+    def load(self, session_id):
+        """Return the summary and most recent messages of a session, or None if it is unknown"""
+        # A session evicted from memory may still have writes in the queue. Take them
+        # before reading the database: whatever the writer settles in between is on disk.
+        with self._pending_lock:
+            pending = self._pending.get(session_id)
+            queued = dict(pending["messages"]) if pending else {}
+            queued_summary = pending["summary"] if pending else None
+            deleted = pending is not None and pending["delete"] is not None
+
+        total, row = 0, None
+        connection = self._connection()
+        if not deleted:
+            total = connection.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            row = connection.execute(
+                "SELECT summary, summarized FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if queued:
+            total = max(total, max(queued) + 1)
+        if queued_summary is not None:
+            row = queued_summary[2:4]
+        if total == 0 and row is None:
+            return None
+
+        summary, summarized = row or ("", 0)
+        offset = max(0, total - self.restore_messages)
+        data = {}
+        if not deleted:
+            data.update(connection.execute(
+                "SELECT seq, data FROM messages WHERE session_id = ? AND seq >= ?", (session_id, offset)
+            ).fetchall())
+        data.update((seq, item[3]) for seq, item in queued.items() if seq >= offset)
+        messages = messages_from_dict([json.loads(data[seq]) for seq in sorted(data)])
+        return RestoredSession(messages, summary, summarized, offset)
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+            "pruned": self.pruned,
+        }
@@ -0,0 +1,348 @@
+"""
+Knowledge base ingestion and incremental re-indexing.
+
+A ``manifest.json`` next to the FAISS index records the settings the index was
+built with, a hash of the source file and a content hash per chunk. When the
+knowledge base changes only new or edited chunks are embedded and chunks that
+disappeared are deleted; the index is then rewritten in place.
+
+The manifest also records the FAISS index type and its parameters (see
+``legacy/ann.py``). Changing them rebuilds the index from the stored vectors
+without embedding anything. Flat and IVF indexes absorb edits in place; an
+HNSW graph is rebuilt whenever a chunk is deleted, which takes minutes for
+hundreds of thousands of vectors.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from config.settings import (
+    KNOWLEDGE_PATH,
+    EMBED_MODEL,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    CHUNK_STRATEGY,
+    EMBED_BATCH_SIZE,
+)
+
+from langchain_community.vectorstores import FAISS
+from langchain_community.document_loaders import TextLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from tqdm import tqdm
+
+from legacy import ann
+from legacy.embeddings import embedding_backend
+from legacy.mmap_store import delete_store, load_store, save_store, store_exists
+from legacy.sections import SectionSplitter
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_FORMAT = 1
+
+# Outcome of a sync: the store plus how many chunks were embedded, removed and kept
+SyncResult = namedtuple("SyncResult", ["store", "embedded", "removed", "unchanged", "seconds"])
+
+
+def index_params():
+    """Settings that invalidate every stored vector when they change"""
+    return {
+        "embed_model": EMBED_MODEL,
+        "embed_backend": embedding_backend(EMBED_MODEL),
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "chunk_strategy": CHUNK_STRATEGY,
+    }
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_ids(chunks):
+    """Content-addressed ids; repeated texts get an occurrence suffix so ids stay unique"""
+    seen = {}
+    ids = []
+    for chunk in chunks:
+        digest = chunk_hash(chunk.page_content)
+        count = seen.get(digest, 0)
+        seen[digest] = count + 1
+        ids.append(digest if count == 0 else f"{digest}-{count}")
+    return ids
+
+
+def kb_version(ids, params):
+    """Short fingerprint of the indexed content, used to invalidate anything derived from it"""
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8"))
+    for chunk_id in sorted(ids):
+        digest.update(chunk_id.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def split_knowledge_base(path=KNOWLEDGE_PATH):
+    loader = TextLoader(path, encoding="utf-8")
+    documents = loader.load()
+
+    # Split large information into smaller chunks for embedding
+    if CHUNK_STRATEGY == "sections":
+        splitter = SectionSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    else:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return splitter.split_documents(documents)
+
+
+def read_manifest(index_path):
+    try:
+        with open(os.path.join(index_path, MANIFEST_FILE), encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("format") != MANIFEST_FORMAT:
+        return None
+    return manifest
+
+
+def write_manifest(index_path, manifest):
+    os.makedirs(index_path, exist_ok=True)
+    path = os.path.join(index_path, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def is_up_to_date(manifest, source_path=KNOWLEDGE_PATH):
+    """True when the manifest matches the current settings and source file"""
+    return (
+        manifest is not None
+        and manifest.get("params") == index_params()
+        and ann.spec_matches(manifest.get("index"), ann.index_spec(len(manifest.get("chunks", {}))))
+        and manifest.get("source_hash") == file_hash(source_path)
+    )
+
+
+def _existing_chunks(store, manifest):
+    """Map chunk id -> docstore id for every vector that is actually in the index.
+
+    Indexes written before the manifest existed are adopted by hashing their
+    stored text, so unchanged chunks keep their vectors.
+    """
+    stored_ids = set(store.index_to_docstore_id.values())
+    if manifest is not None:
+        return {
+            chunk_id: doc_id
+            for chunk_id, doc_id in manifest.get("chunks", {}).items()
+            if doc_id in stored_ids
+        }
+
+    doc_ids = list(store.index_to_docstore_id.values())
+    documents = [store.docstore.search(doc_id) for doc_id in doc_ids]
+    return dict(zip(chunk_ids(documents), doc_ids))
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+_worker_embeddings = None
+
+
+def _init_worker(embeddings, threads):
+    global _worker_embeddings
+    _worker_embeddings = embeddings
+    # Split the cores between workers instead of letting every process use all of them
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _embed_in_worker(texts):
+    return _worker_embeddings.embed_documents(texts)
+
+
+def embed_batches(chunks, embeddings, batch_size=EMBED_BATCH_SIZE, workers=1):
+    """Yield ``(chunks, vectors)`` per batch, in order.
+
+    With ``workers > 1`` batches are embedded by a process pool; at most two
+    batches per worker are in flight so large corpora are streamed, not queued.
+    Vectors found in the embedding cache are not sent to the workers.
+    """
+    if workers <= 1:
+        for batch in _batches(chunks, batch_size):
+            yield batch, embeddings.embed_documents([chunk.page_content for chunk in batch])
+        return
+
+    cache = embeddings if hasattr(embeddings, "cached") else None
+    worker_embeddings = embeddings.underlying if cache is not None else embeddings
+
+    def submit(pool, batch):
+        texts = [chunk.page_content for chunk in batch]
+        vectors = cache.cached(texts) if cache is not None else [None] * len(texts)
+        missing = [text for text, vector in zip(texts, vectors) if vector is None]
+        future = pool.submit(_embed_in_worker, missing) if missing else None
+        return batch, vectors, missing, future
+
+    def collect(batch, vectors, missing, future):
+        if future is not None:
+            computed = future.result()
+            remaining = iter(computed)
+            vectors = [vector if vector is not None else next(remaining) for vector in vectors]
+            if cache is not None:
+                cache.remember(missing, computed)
+        return batch, vectors
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(worker_embeddings, threads)) as pool:
+        pending = deque()
+        for batch in _batches(chunks, batch_size):
+            pending.append(submit(pool, batch))
+            if len(pending) >= workers * 2:
+                yield collect(*pending.popleft())
+        while pending:
+            yield collect(*pending.popleft())
+
+
+def _update_in_place(index, spec, flat, removed_positions, added):
+    """Apply the edits made on ``flat`` to ``index`` if it already has the ``spec`` type"""
+    if index is None or ann.index_type(index) != spec["type"] \
+            or ann.quantization(index) != spec.get("quantization", "none"):
+        return False
+    new_vectors = flat.reconstruct_n(flat.ntotal - added, added) if added else []
+    return ann.update_index(index, removed_positions, new_vectors)
+
+
+def sync_index(index_path, embeddings, chunks, source_path=KNOWLEDGE_PATH, store=None,
+               rebuild=False, batch_size=EMBED_BATCH_SIZE, workers=1, checkpoint_every=0, progress=False):
+    """Bring the index at ``index_path`` in line with ``chunks`` and persist it.
+
+    Only chunks whose content hash is not indexed yet are embedded. A change of
+    embedding model or chunking settings (or ``rebuild``) forces a full rebuild.
+    With ``checkpoint_every`` the partial index is saved every N batches; its
+    manifest has no source hash, so an interrupted build resumes on the next run.
+    Checkpoints are written as flat indexes; the final index has the type chosen
+    by ``ann.index_spec`` and is the one held by the returned store.
+
+    Edits are made on a flat copy of the vectors and then applied to the
+    stored index in place when it allows it (``ann.update_index``): flat and
+    IVF indexes take deletions and additions without retraining, HNSW only
+    additions. Deleting from an HNSW index, or changing the index type, builds
+    a new index over every vector.
+
+    With no chunks at all (an empty knowledge base) there is nothing to index:
+    any stored index is deleted, only the manifest is written and the returned
+    store is None.
+    """
+    started = time.perf_counter()
+    params = index_params()
+    ids = chunk_ids(chunks)
+    manifest = read_manifest(index_path)
+
+    if store is None and not rebuild and store_exists(index_path):
+        try:
+            # Writable copy; the memory-mapped serving copy cannot be modified
+            store = load_store(index_path, embeddings, mmap_vectors=False)
+        except (OSError, RuntimeError, ValueError):
+            logger.warning("Could not load index at %s, rebuilding it", index_path)
+            store = None
+    serving_index = None
+    if store is not None:
+        # The store's id map assumes deletions renumber vectors like a flat index does;
+        # the serving index is brought in line afterwards
+        serving_index = store.index
+        store.index = ann.flat_index(store.index)
+
+    if store is not None and manifest is not None and manifest.get("params") != params:
+        logger.info("Index settings changed, rebuilding %s from scratch", index_path)
+        store = None
+        serving_index = None
+
+    kept = {}
+    removed = []
+    removed_positions = []
+    if store is not None:
+        existing = _existing_chunks(store, manifest)
+        wanted = set(ids)
+        kept = {chunk_id: doc_id for chunk_id, doc_id in existing.items() if chunk_id in wanted}
+        kept_doc_ids = set(kept.values())
+        removed_positions = [position for position, doc_id in store.index_to_docstore_id.items()
+                             if doc_id not in kept_doc_ids]
+        removed = [store.index_to_docstore_id[position] for position in removed_positions]
+        if removed:
+            store.delete(removed)
+
+    new = [(chunk_id, chunk) for chunk_id, chunk in zip(ids, chunks) if chunk_id not in kept]
+    new_ids = [chunk_id for chunk_id, _ in new]
+    chunk_map = dict(kept)
+    spec = ann.index_spec(len(ids))
+
+    def save(source_hash, write_index=True, index=None, index_spec=None):
+        if write_index:
+            save_store(store, index_path, index=index)
+        write_manifest(index_path, {
+            "format": MANIFEST_FORMAT,
+            "params": params,
+            "index": index_spec or {"type": "flat"},
+            "source_hash": source_hash,
+            "version": kb_version(ids, params),
+            "chunks": chunk_map,
+        })
+
+    with tqdm(total=len(new), unit="chunk", desc="Embedding", disable=not progress) as bar:
+        batches = embed_batches([chunk for _, chunk in new], embeddings, batch_size, workers)
+        done = 0
+        for count, (batch, vectors) in enumerate(batches, start=1):
+            batch_ids = new_ids[done:done + len(batch)]
+            done += len(batch)
+            text_embeddings = list(zip([chunk.page_content for chunk in batch], vectors))
+            metadatas = [chunk.metadata for chunk in batch]
+            if store is None:
+                store = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=batch_ids)
+            else:
+                store.add_embeddings(text_embeddings, metadatas=metadatas, ids=batch_ids)
+            chunk_map.update({chunk_id: chunk_id for chunk_id in batch_ids})
+            bar.update(len(batch))
+            if checkpoint_every and count % checkpoint_every == 0:
+                save(source_hash=None)
+
+    if store is None or not ids:
+        # Nothing to index; vectors of a previous build (or other settings) must not be served
+        store = None
+        delete_store(index_path)
+        save(source_hash=file_hash(source_path), write_index=False, index_spec=spec)
+    else:
+        # An IVF index whose list count is still close enough to the ideal one is kept
+        stored_spec = (manifest or {}).get("index", {"type": "flat"})
+        if ann.spec_matches(stored_spec, spec):
+            spec = stored_spec
+        # Rewrite the index files only if the vectors or the index type changed
+        changed = bool(new or removed) or stored_spec != spec
+        if changed and not (stored_spec == spec and (
+                serving_index is store.index
+                or _update_in_place(serving_index, spec, store.index, removed_positions, len(new)))):
+            serving_index = ann.build_index(store.index, spec)
+        save(source_hash=file_hash(source_path), write_index=changed, index=serving_index, index_spec=spec)
+        store.index = serving_index
+
+    result = SyncResult(store, len(new), len(removed), len(kept), time.perf_counter() - started)
+    logger.info(
+        "Synced index %s in %.2fs: %d embedded, %d removed, %d unchanged",
+        index_path, result.seconds, result.embedded, result.removed, result.unchanged,
+    )
+    return result
@@ -0,0 +1,182 @@
+"""
+Token-budgeted conversation memory with a rolling summary.
+
+Instead of sending the whole chat history with every question, the chain
+sees a short summary of the earlier conversation followed by the most
+recent turns, trimmed to a fixed token budget. Older turns are folded into
+the summary by the LLM in a background thread after the answer has been
+returned, so summarization never delays a reply.
+"""
+
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from config.settings import MEMORY_RECENT_TURNS, MEMORY_TOKEN_BUDGET
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+
+
+def count_tokens(text):
+    """Count tokens with the OpenAI tokenizer, or estimate ~4 characters per token without it"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            logger.warning("tiktoken encoding unavailable; estimating token counts")
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def count_message_tokens(messages):
+    # About 4 tokens of chat formatting overhead per message
+    return sum(count_tokens(message.content if isinstance(message.content, str) else str(message.content)) + 4
+               for message in messages)
+
+
+class PromptTokenRecorder:
+    """Keeps the prompt size of recent LLM calls"""
+
+    def __init__(self, max_samples=1000):
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, tokens):
+        with self._lock:
+            self._samples.append(tokens)
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"count": 0, "p50": None, "p95": None, "max": None}
+        return {
+            "count": len(samples),
+            "p50": samples[len(samples) // 2],
+            "p95": samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+            "max": samples[-1],
+        }
+
+
+# Process-wide prompt size metric
+prompt_tokens = PromptTokenRecorder()
+
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+     "You maintain a running summary of a customer support conversation with Clickatell's assistant. "
+     "Combine the existing summary with the new lines into one concise summary of at most 120 words. "
+     "Keep names, products, account details and open questions; drop greetings and filler."),
+    ("human", "Existing summary:\n{summary}\n\nNew lines:\n{lines}"),
+])
+
+
+def _format_lines(messages):
+    return "\n".join(f"{message.type}: {message.content}" for message in messages)
+
+
+class BudgetedHistory(BaseChatMessageHistory):
+    """View over a ``SessionHistory`` that exposes only the summary and recent turns"""
+
+    def __init__(self, history, memory):
+        self.history = history
+        self.memory = memory
+
+    @property
+    def messages(self):
+        return self.memory.window(self.history)
+
+    def add_messages(self, messages):
+        self.history.add_messages(messages)
+        self.memory.schedule_summary(self.history)
+
+    async def aadd_messages(self, messages):
+        self.add_messages(messages)
+
+    def clear(self):
+        self.history.clear()
+
+
+class ConversationMemory:
+    """Builds budgeted history views and summarizes older turns in the background"""
+
+    def __init__(self, llm, recent_turns=MEMORY_RECENT_TURNS, token_budget=MEMORY_TOKEN_BUDGET, executor=None):
+        self.recent_turns = recent_turns
+        self.token_budget = token_budget
+        self.summarizer = SUMMARY_PROMPT | llm | StrOutputParser()
+        self.executor = executor or ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+        self.summaries = 0
+        self.failures = 0
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def view(self, history):
+        return BudgetedHistory(history, self)
+
+    def window(self, history):
+        """Summary message plus the most recent turns that fit in the token budget"""
+        with history.lock:
+            messages = history.messages
+            summary = history.summary
+            start = max(history.summarized, len(messages) - 2 * self.recent_turns)
+
+        recent = list(messages[start:])
+        prefix = [SystemMessage(content=f"Summary of the earlier conversation: {summary}")] if summary else []
+        # Drop the oldest turns first, but always keep the last one for context
+        while len(recent) > 2 and count_message_tokens(prefix + recent) > self.token_budget:
+            recent = recent[2:]
+        return prefix + recent
+
+    def schedule_summary(self, history):
+        """Fold turns that fell out of the recent window into the summary, off the request path"""
+        with history.lock:
+            cutoff = len(history.messages) - 2 * self.recent_turns
+            if cutoff <= history.summarized:
+                return None
+        with self._lock:
+            if id(history) in self._pending:
+                return None
+            self._pending.add(id(history))
+        return self.executor.submit(self._summarize, history)
+
+    def _summarize(self, history):
+        try:
+            # Keep folding until the history is caught up; new turns may arrive meanwhile
+            while True:
+                with history.lock:
+                    cutoff = len(history.messages) - 2 * self.recent_turns
+                    if cutoff <= history.summarized:
+                        return
+                    older = history.messages[history.summarized:cutoff]
+                    summary = history.summary
+
+                text = self.summarizer.invoke({"summary": summary or "(none)", "lines": _format_lines(older)})
+
+                history.set_summary(text.strip(), cutoff)
+                self.summaries += 1
+        except Exception:
+            self.failures += 1
+            logger.exception("Conversation summarization failed")
+        finally:
+            with self._lock:
+                self._pending.discard(id(history))
+
+    def stats(self):
+        return {
+            "summaries": self.summaries,
+            "failures": self.failures,
+            "pending": len(self._pending),
+            "prompt_tokens": prompt_tokens.summary(),
+        }
@@ -0,0 +1,256 @@
+"""
+Pickle-free, memory-mapped persistence for the FAISS vector store.
+
+Every save writes a new generation directory (``store-000001``, ...) holding:
+
+- ``vectors.faiss``      FAISS index, memory-mapped when loaded for serving
+- ``docstore.jsonl``     one JSON document (text + metadata) per line
+- ``docstore.offsets``   uint64 byte offsets into ``docstore.jsonl`` (n + 1 values)
+- ``ids.json``           docstore id of every vector, in index order
+
+and then points the ``CURRENT`` file of the index directory at it with a
+single ``os.replace``. Readers resolve ``CURRENT`` once and read all four
+files from that generation, so they never mix the index of one save with the
+ids of another. The previous generation is kept for readers that resolved it
+just before the switch; older ones are deleted.
+
+Documents are decoded only when a search returns them, so loading is close to
+free and several processes share one page-cached copy of the files.
+"""
+
+import json
+import logging
+import mmap
+import os
+import shutil
+import sys
+from array import array
+
+import faiss
+from langchain_core.documents import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.faiss"
+DOCSTORE_FILE = "docstore.jsonl"
+OFFSETS_FILE = "docstore.offsets"
+IDS_FILE = "ids.json"
+STORE_FILES = (VECTORS_FILE, DOCSTORE_FILE, OFFSETS_FILE, IDS_FILE)
+
+CURRENT_FILE = "CURRENT"
+GENERATION_PREFIX = "store-"
+
+# Pickle-based files written by FAISS.save_local() before this format existed
+LEGACY_FILES = ("index.faiss", "index.pkl")
+
+# IO_FLAG_MMAP_IFC maps flat indexes too; older FAISS builds only map IVF lists
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def store_directory(path):
+    """Directory holding the current store files of the index at ``path``"""
+    try:
+        with open(os.path.join(path, CURRENT_FILE), encoding="utf-8") as current_file:
+            return os.path.join(path, current_file.read().strip())
+    except FileNotFoundError:
+        # Stores saved before generations were introduced keep their files at the top level
+        return path
+
+
+def store_exists(path):
+    directory = store_directory(path)
+    return all(os.path.isfile(os.path.join(directory, name)) for name in STORE_FILES)
+
+
+def legacy_store_exists(path):
+    return all(os.path.isfile(os.path.join(path, name)) for name in LEGACY_FILES)
+
+
+class MmapDocstore(Docstore, AddableMixin):
+    """Read-on-demand docstore backed by ``docstore.jsonl`` and its offsets file.
+
+    Additions and deletions are kept in memory on top of the mapped file until
+    the store is saved again.
+    """
+
+    def __init__(self, path, ids, directory=None):
+        # ``path`` is the index directory; the files are read from one generation of it
+        self.path = path
+        self._ids = ids
+        self._positions = None
+        self._added = {}
+        self._deleted = set()
+        directory = directory or path
+        with open(os.path.join(directory, DOCSTORE_FILE), "rb") as docstore_file:
+            self._data = _map(docstore_file)
+        with open(os.path.join(directory, OFFSETS_FILE), "rb") as offsets_file:
+            self._offsets = _read_offsets(offsets_file)
+
+    def _position(self, doc_id):
+        if self._positions is None:
+            self._positions = {stored_id: position for position, stored_id in enumerate(self._ids)}
+        return self._positions.get(doc_id)
+
+    def _read(self, position):
+        start, end = self._offsets[position], self._offsets[position + 1]
+        record = json.loads(self._data[start:end])
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def search(self, search):
+        if search in self._added:
+            return self._added[search]
+        position = self._position(search)
+        if position is None or search in self._deleted:
+            return f"ID {search} not found."
+        return self._read(position)
+
+    def add(self, texts):
+        overlapping = [doc_id for doc_id in texts if isinstance(self.search(doc_id), Document)]
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+
+    def delete(self, ids):
+        for doc_id in ids:
+            if self._added.pop(doc_id, None) is None:
+                if self._position(doc_id) is None or doc_id in self._deleted:
+                    raise ValueError(f"Tried to delete ids that does not exist: {doc_id}")
+                self._deleted.add(doc_id)
+
+
+def _map(file_obj):
+    # mmap cannot map empty files
+    if os.fstat(file_obj.fileno()).st_size == 0:
+        return b""
+    return mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _read_offsets(file_obj):
+    offsets = array("Q")
+    offsets.frombytes(file_obj.read())
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    return offsets
+
+
+def _generations(path):
+    try:
+        names = os.listdir(path)
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names
+                  if name.startswith(GENERATION_PREFIX) and name[len(GENERATION_PREFIX):].isdigit())
+
+
+def _new_generation(path):
+    generations = _generations(path)
+    number = int(generations[-1][len(GENERATION_PREFIX):]) + 1 if generations else 1
+    while True:
+        name = f"{GENERATION_PREFIX}{number:06d}"
+        try:
+            # Fails if a concurrent writer took this number
+            os.mkdir(os.path.join(path, name))
+            return name
+        except FileExistsError:
+            number += 1
+
+
+def save_store(store, path, index=None):
+    """Persist a LangChain FAISS store in the memory-mappable format, as a new generation.
+
+    ``index`` is written instead of ``store.index`` if given; it must hold the
+    same vectors in the same order (see ``legacy/ann.py``).
+    """
+    os.makedirs(path, exist_ok=True)
+    ids = [store.index_to_docstore_id[position] for position in range(store.index.ntotal)]
+    previous = store_directory(path)
+    generation = _new_generation(path)
+    directory = os.path.join(path, generation)
+
+    faiss.write_index(store.index if index is None else index, os.path.join(directory, VECTORS_FILE))
+
+    offsets = array("Q", [0])
+    with open(os.path.join(directory, DOCSTORE_FILE), "wb") as docstore_file:
+        for doc_id in ids:
+            document = store.docstore.search(doc_id)
+            line = json.dumps(
+                {"id": doc_id, "page_content": document.page_content, "metadata": document.metadata},
+                ensure_ascii=False,
+            ).encode("utf-8") + b"\n"
+            docstore_file.write(line)
+            offsets.append(offsets[-1] + len(line))
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    with open(os.path.join(directory, OFFSETS_FILE), "wb") as offsets_file:
+        offsets.tofile(offsets_file)
+
+    with open(os.path.join(directory, IDS_FILE), "w", encoding="utf-8") as ids_file:
+        json.dump(ids, ids_file)
+
+    # The switch to the new generation is this one rename
+    current = os.path.join(path, CURRENT_FILE)
+    with open(current + ".tmp", "w", encoding="utf-8") as current_file:
+        current_file.write(generation)
+    os.replace(current + ".tmp", current)
+
+    keep = {generation, os.path.basename(previous)}
+    for name in _generations(path):
+        if name not in keep:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    if previous == path:
+        # Top-level files of the pre-generation layout are no longer read
+        _remove_files(path)
+
+
+def _remove_files(directory):
+    for name in STORE_FILES:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+def delete_store(path):
+    """Remove everything written by :func:`save_store`, if anything"""
+    try:
+        os.remove(os.path.join(path, CURRENT_FILE))
+    except FileNotFoundError:
+        pass
+    for name in _generations(path):
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    _remove_files(path)
+
+
+def load_store(path, embeddings, mmap_vectors=True):
+    """Load the current generation of a store saved by :func:`save_store`.
+
+    With ``mmap_vectors`` the FAISS index is mapped read-only; such a store
+    must not be modified. Pass ``mmap_vectors=False`` to get a writable copy.
+    """
+    directory = store_directory(path)
+    vectors_path = os.path.join(directory, VECTORS_FILE)
+    index = faiss.read_index(vectors_path, _MMAP_FLAGS) if mmap_vectors else faiss.read_index(vectors_path)
+    with open(os.path.join(directory, IDS_FILE), encoding="utf-8") as ids_file:
+        ids = json.load(ids_file)
+    docstore = MmapDocstore(path, ids, directory)
+    if not index.ntotal == len(ids) == len(docstore._offsets) - 1:
+        raise ValueError(f"Index files in {directory} do not belong together: {index.ntotal} vectors, "
+                         f"{len(ids)} ids, {len(docstore._offsets) - 1} documents")
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=dict(enumerate(ids)),
+    )
+
+
+def migrate_legacy_store(path, embeddings):
+    """Convert a pickled FAISS.save_local() index to the new format, once"""
+    logger.warning("Converting pickled index in %s to the memory-mapped format", path)
+    store = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    save_store(store, path)
+    for name in LEGACY_FILES:
+        os.remove(os.path.join(path, name))
+    return store
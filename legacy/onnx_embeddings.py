@@ -0,0 +1,195 @@
+"""
+ONNX Runtime backend for the sentence-transformers embedding model.
+
+Serving a query with ``HuggingFaceEmbeddings`` imports torch and runs a
+PyTorch forward pass. This backend runs the same model exported to ONNX
+(optionally with int8 weights) through onnxruntime, with the fast
+``tokenizers`` tokenizer, and reproduces the sentence-transformers pipeline:
+mean pooling over the attention mask, then L2 normalization.
+
+Vectors match the torch backend to a cosine similarity of at least 0.999 for
+the float32 export and 0.99 for the int8 export (checked on the knowledge base
+by ``scripts/export_onnx.py``). They are still not identical, so the backend
+and precision are part of the index settings and the embedding cache keys
+(see ``embedding_backend`` in ``legacy/embeddings.py``): switching backends
+re-embeds the knowledge base once rather than mixing vectors.
+
+``onnxruntime`` is an optional dependency, only needed when
+``EMBED_BACKEND = "onnx"``; exporting additionally needs torch and onnx.
+"""
+
+import importlib.util
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config.settings import EMBED_BATCH_SIZE, EMBED_ONNX_PATH, EMBED_ONNX_QUANTIZED, EMBED_ONNX_THREADS
+from legacy.metrics import current_rss_bytes
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+CONFIG_FILE = "onnx_config.json"
+
+
+def model_file(path=EMBED_ONNX_PATH, quantized=EMBED_ONNX_QUANTIZED):
+    return os.path.join(path, QUANTIZED_MODEL_FILE if quantized else MODEL_FILE)
+
+
+def onnx_available(model_name, path=EMBED_ONNX_PATH, quantized=EMBED_ONNX_QUANTIZED):
+    """True when onnxruntime is installed and ``path`` holds an export of ``model_name``"""
+    if importlib.util.find_spec("onnxruntime") is None:
+        return False
+    if not all(os.path.isfile(name) for name in (model_file(path, quantized),
+                                                 os.path.join(path, TOKENIZER_FILE),
+                                                 os.path.join(path, CONFIG_FILE))):
+        return False
+    with open(os.path.join(path, CONFIG_FILE), encoding="utf-8") as config_file:
+        return json.load(config_file).get("model_name") == model_name
+
+
+def mean_pool(hidden_states, attention_mask, normalize=True):
+    """Average the token vectors of each text, ignoring padding, as sentence-transformers does"""
+    mask = attention_mask[:, :, None].astype(np.float32)
+    summed = (hidden_states * mask).sum(axis=1)
+    pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+    if normalize:
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+    return pooled
+
+
+class OnnxEmbeddings(Embeddings):
+    """Embeddings computed by onnxruntime, loaded on the first embed call like ``LazyEmbeddings``"""
+
+    def __init__(self, model_name, path=EMBED_ONNX_PATH, quantized=EMBED_ONNX_QUANTIZED,
+                 threads=EMBED_ONNX_THREADS, batch_size=EMBED_BATCH_SIZE):
+        self.model_name = model_name
+        self.path = path
+        self.quantized = quantized
+        self.threads = threads
+        self.batch_size = batch_size
+        self.load_seconds = None
+        self.load_bytes = None
+        self._session = None
+        self._tokenizer = None
+        self._input_names = ()
+        self._normalize = True
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._session is not None
+
+    def _load(self):
+        with self._lock:
+            if self._session is not None:
+                return
+            started = time.perf_counter()
+            rss_before = current_rss_bytes()
+            import onnxruntime
+            from tokenizers import Tokenizer
+
+            with open(os.path.join(self.path, CONFIG_FILE), encoding="utf-8") as config_file:
+                config = json.load(config_file)
+            tokenizer = Tokenizer.from_file(os.path.join(self.path, TOKENIZER_FILE))
+            tokenizer.enable_truncation(max_length=config["max_length"])
+            tokenizer.enable_padding(pad_id=config["pad_id"], pad_token=config["pad_token"])
+
+            options = onnxruntime.SessionOptions()
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if self.threads:
+                options.intra_op_num_threads = self.threads
+            session = onnxruntime.InferenceSession(model_file(self.path, self.quantized), options,
+                                                   providers=["CPUExecutionProvider"])
+
+            self._tokenizer = tokenizer
+            self._input_names = {model_input.name for model_input in session.get_inputs()}
+            self._normalize = config.get("normalize", True)
+            self.load_seconds = time.perf_counter() - started
+            self.load_bytes = max(current_rss_bytes() - rss_before, 0)
+            logger.info("Loaded ONNX embedding model %s (%s) in %.2fs",
+                        self.model_name, "int8" if self.quantized else "float32", self.load_seconds)
+            self._session = session
+
+    def __getstate__(self):
+        # Worker processes open their own session
+        return {"model_name": self.model_name, "path": self.path, "quantized": self.quantized,
+                "threads": self.threads, "batch_size": self.batch_size}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _embed(self, texts):
+        if self._session is None:
+            self._load()
+        encodings = self._tokenizer.encode_batch(texts)
+        inputs = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        inputs = {name: value for name, value in inputs.items() if name in self._input_names}
+        hidden_states = self._session.run(None, inputs)[0]
+        return mean_pool(hidden_states, inputs["attention_mask"], self._normalize)
+
+    def embed_documents(self, texts):
+        vectors = []
+        # Batches are padded to their longest text, so keep them bounded
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed(texts[start:start + self.batch_size]).tolist())
+        return vectors
+
+    def embed_query(self, text):
+        return self._embed([text])[0].tolist()
+
+
+def export_onnx(model_name, path=EMBED_ONNX_PATH, quantize=True, opset=17):
+    """Export ``model_name`` to ``path`` as float32 ONNX (and int8 with ``quantize``); returns the written files"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(path, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    tokenizer.backend_tokenizer.save(os.path.join(path, TOKENIZER_FILE))
+    normalize = any(type(module).__name__ == "Normalize" for module in model)
+
+    sample = tokenizer(["an example sentence", "another one"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "tokens"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "tokens"}
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            os.path.join(path, MODEL_FILE),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    files = [os.path.join(path, MODEL_FILE)]
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(os.path.join(path, MODEL_FILE), os.path.join(path, QUANTIZED_MODEL_FILE),
+                         weight_type=QuantType.QInt8)
+        files.append(os.path.join(path, QUANTIZED_MODEL_FILE))
+
+    with open(os.path.join(path, CONFIG_FILE), "w", encoding="utf-8") as config_file:
+        json.dump({
+            "model_name": model_name,
+            "max_length": model.max_seq_length,
+            "pad_id": tokenizer.pad_token_id,
+            "pad_token": tokenizer.pad_token,
+            "normalize": normalize,
+        }, config_file, indent=2)
+    return files
@@ -0,0 +1,134 @@
+"""
+Cross-encoder reranking of retrieved chunks.
+
+The retriever over-fetches candidates; a small CPU cross-encoder then scores
+every (question, chunk) pair in one batched forward pass, and only chunks
+above a relevance cutoff are kept (adaptive k). If scoring is predicted to
+exceed the latency budget, or the model is not loaded yet, the retriever's
+order is used unchanged so a slow reranker never delays an answer.
+"""
+
+import logging
+import threading
+import time
+
+from config.settings import (
+    RERANK_BUDGET_MS,
+    RERANK_CANDIDATES,
+    RERANK_MAX_K,
+    RERANK_MIN_SCORE,
+    RERANK_MODEL,
+    RETRIEVAL_K,
+)
+from legacy.streaming import LatencyRecorder
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """Rescores retriever hits with a cross-encoder within a latency budget"""
+
+    def __init__(self, model_name=RERANK_MODEL, candidates=RERANK_CANDIDATES, min_score=RERANK_MIN_SCORE,
+                 max_k=RERANK_MAX_K, fallback_k=RETRIEVAL_K, budget_ms=RERANK_BUDGET_MS, model=None):
+        self.model_name = model_name
+        self.candidates = candidates
+        self.min_score = min_score
+        self.max_k = max_k
+        self.fallback_k = fallback_k
+        self.budget_seconds = budget_ms / 1000.0
+        self.load_seconds = None
+        self.reranked = 0
+        self.skipped = 0
+        self.over_budget = 0
+        self.kept = 0
+        self.timings = LatencyRecorder()
+        self._model = model
+        self._failed = False
+        self._loading = None
+        self._lock = threading.Lock()
+        # Estimated cost of scoring one pair, refined after every call
+        self._seconds_per_pair = None
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def _load(self):
+        try:
+            started = time.perf_counter()
+            from sentence_transformers import CrossEncoder
+            model = CrossEncoder(self.model_name, device="cpu")
+            # The first forward pass is much slower; keep it out of the latency estimate
+            model.predict([("warm up", "warm up")], show_progress_bar=False)
+            self.load_seconds = time.perf_counter() - started
+            logger.info("Loaded reranker %s in %.2fs", self.model_name, self.load_seconds)
+            self._model = model
+        except Exception:
+            self._failed = True
+            logger.exception("Could not load reranker %s; using retrieval order", self.model_name)
+
+    def _ensure_loading(self):
+        # Load in the background; questions asked meanwhile keep the retrieval order
+        with self._lock:
+            if self._model is None and self._loading is None and not self._failed:
+                self._loading = threading.Thread(target=self._load, name="reranker-load", daemon=True)
+                self._loading.start()
+
+    def wait_until_loaded(self, timeout=None):
+        self._ensure_loading()
+        if self._loading is not None:
+            self._loading.join(timeout)
+        return self.loaded
+
+    def _fallback(self, hits):
+        self.skipped += 1
+        return hits[:self.fallback_k]
+
+    def rerank(self, question, hits):
+        """Return the hits worth sending to the LLM, best first"""
+        if not hits:
+            return hits
+        if self._model is None:
+            self._ensure_loading()
+            return self._fallback(hits)
+        if (self._seconds_per_pair is not None
+                and self._seconds_per_pair * len(hits) > self.budget_seconds):
+            # Let the estimate decay so a temporary slowdown does not disable reranking for good
+            self._seconds_per_pair *= 0.95
+            return self._fallback(hits)
+
+        started = time.perf_counter()
+        # One batched forward pass over all candidates
+        scores = self._model.predict(
+            [(question, hit.document.page_content) for hit in hits],
+            batch_size=len(hits),
+            show_progress_bar=False,
+        )
+        elapsed = time.perf_counter() - started
+        self.timings.record(elapsed)
+        per_pair = elapsed / len(hits)
+        self._seconds_per_pair = per_pair if self._seconds_per_pair is None else \
+            0.8 * self._seconds_per_pair + 0.2 * per_pair
+        if elapsed > self.budget_seconds:
+            self.over_budget += 1
+
+        ranked = sorted(zip(hits, scores), key=lambda pair: -float(pair[1]))
+        kept = [hit._replace(score=float(score)) for hit, score in ranked[:self.max_k]
+                if float(score) >= self.min_score]
+        # Always keep the best chunk so the answer still has some context
+        if not kept:
+            best, score = ranked[0]
+            kept = [best._replace(score=float(score))]
+        self.reranked += 1
+        self.kept += len(kept)
+        return kept
+
+    def stats(self):
+        return {
+            "loaded": self.loaded,
+            "reranked": self.reranked,
+            "skipped": self.skipped,
+            "over_budget": self.over_budget,
+            "latency_ms": self.timings.summary(),
+            "kept_avg": round(self.kept / self.reranked, 2) if self.reranked else None,
+        }
@@ -0,0 +1,245 @@
+"""
+Hybrid sparse + dense retrieval over the FAISS store's chunks.
+
+Dense search with MiniLM is good at paraphrases but weak on exact tokens
+such as product names ("Chat 2 Pay", "One API"), versions ("TLS 1.2+") and
+plan names. A small BM25 inverted index over the same chunks catches those,
+and the two rankings are merged with reciprocal rank fusion (RRF), which
+needs no score calibration between the two retrievers.
+
+Searches can be restricted to one knowledge base section (see
+``legacy/sections.py``): FAISS then only scores that section's vectors and
+BM25 only that section's chunks.
+"""
+
+import asyncio
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict, namedtuple
+
+import faiss
+import numpy as np
+
+from config.settings import RETRIEVAL_FETCH_K, RETRIEVAL_K, RETRIEVAL_MODE, RETRIEVAL_RRF_K
+from legacy import ann
+from legacy.streaming import LatencyRecorder
+
+logger = logging.getLogger(__name__)
+
+# One retrieved chunk. ``dense_score`` is the cosine similarity to the query
+# (None if only BM25 found it); ``score`` is the fused score used for ranking.
+Hit = namedtuple("Hit", ["document", "position", "score", "dense_score", "sparse_score"])
+
+
+class SearchResult(list):
+    """Hits for one question, plus the cosine similarities of every dense candidate (best first)"""
+
+    def __init__(self, hits, dense_scores):
+        super().__init__(hits)
+        self.dense_scores = dense_scores
+
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+
+
+def tokenize(text):
+    """Lowercase word and version tokens: "TLS 1.2+" -> ["tls", "1.2"]"""
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of texts, addressed by position"""
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(texts)
+        postings = defaultdict(list)   # term -> [(position, term frequency)]
+        lengths = np.zeros(self.size, dtype=np.float32)
+        for position, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[position] = len(tokens)
+            for term, count in Counter(tokens).items():
+                postings[term].append((position, count))
+        average = float(lengths.mean()) if self.size else 0.0
+        # Per-document length normalization, precomputed once
+        norms = self.k1 * (1 - self.b + self.b * lengths / average) if average else lengths
+        # The term frequency part of BM25 does not depend on the query, so each term keeps
+        # its positions and their weights as arrays and a query is a few vector additions
+        self._postings = {}   # term -> (positions, weights, idf)
+        for term, entries in postings.items():
+            positions = np.fromiter((position for position, _ in entries), dtype=np.int64, count=len(entries))
+            frequencies = np.fromiter((count for _, count in entries), dtype=np.float32, count=len(entries))
+            weights = frequencies * (self.k1 + 1) / (frequencies + norms[positions])
+            self._postings[term] = (positions, weights, self._idf(len(entries)))
+
+    def _idf(self, frequency):
+        return math.log(1 + (self.size - frequency + 0.5) / (frequency + 0.5))
+
+    def scores(self, query):
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            positions, weights, idf = postings
+            # A term lists each position once, so plain fancy indexing adds without collisions
+            scores[positions] += idf * weights
+        return scores
+
+    def search(self, query, k, positions=None):
+        """Return [(position, score)] of the best ``k`` matching texts, optionally only among ``positions``"""
+        scores = self.scores(query)
+        if positions is None:
+            matching = np.flatnonzero(scores)
+        else:
+            matching = positions[scores[positions] > 0]
+        if matching.size == 0:
+            return []
+        best = matching[np.argsort(-scores[matching], kind="stable")[:k]]
+        return [(int(position), float(scores[position])) for position in best]
+
+
+class HybridRetriever:
+    """Fuses FAISS and BM25 rankings of the same chunks.
+
+    ``mode="dense"`` skips BM25 and returns the FAISS order. Timings of each
+    stage are recorded for the engine metrics.
+    """
+
+    def __init__(self, vector_store, k=RETRIEVAL_K, fetch_k=RETRIEVAL_FETCH_K, rrf_k=RETRIEVAL_RRF_K,
+                 mode=RETRIEVAL_MODE):
+        self.vector_store = vector_store
+        self.k = k
+        self.fetch_k = fetch_k
+        self.rrf_k = rrf_k
+        self.mode = mode
+        self.timings = {stage: LatencyRecorder() for stage in ("dense", "sparse", "fusion", "total")}
+        self._bm25 = None
+        self._sections = None
+        self._selectors = {}
+        self._bm25_lock = threading.Lock()
+        self.filtered = 0
+        self._scanned = 0.0
+
+    def _document(self, position):
+        doc_id = self.vector_store.index_to_docstore_id[position]
+        return self.vector_store.docstore.search(doc_id)
+
+    def _build(self):
+        # Built on first use, so startup does not have to read every chunk
+        with self._bm25_lock:
+            if self._bm25 is not None:
+                return
+            started = time.perf_counter()
+            documents = [self._document(position) for position in range(self.vector_store.index.ntotal)]
+            sections = defaultdict(list)
+            for position, document in enumerate(documents):
+                section = document.metadata.get("section")
+                if section is not None:
+                    sections[section].append(position)
+            self._sections = {section: np.asarray(positions, dtype=np.int64)
+                              for section, positions in sections.items()}
+            self._bm25 = BM25Index([document.page_content for document in documents])
+            logger.info("Built BM25 index over %d chunks in %.3fs", len(documents), time.perf_counter() - started)
+
+    @property
+    def bm25(self):
+        if self._bm25 is None:
+            self._build()
+        return self._bm25
+
+    def sections(self):
+        """Names of the sections chunks are tagged with, in knowledge base order"""
+        if self._bm25 is None:
+            self._build()
+        return sorted(self._sections, key=lambda section: self._sections[section][0])
+
+    def _positions(self, section):
+        if section is None:
+            return None
+        if self._bm25 is None:
+            self._build()
+        positions = self._sections.get(section)
+        if positions is None:
+            logger.warning("Unknown section %r, searching the whole knowledge base", section)
+        return positions
+
+    def _selector(self, section, positions):
+        # FAISS copies the ids into its own set, so build each section's selector once
+        selector = self._selectors.get(section)
+        if selector is None:
+            selector = self._selectors[section] = faiss.IDSelectorBatch(positions)
+        return selector
+
+    def dense(self, query_vector, k, section=None):
+        """Return [(position, cosine similarity)] from FAISS, best first"""
+        allowed = self._positions(section)
+        k = min(k, self.vector_store.index.ntotal if allowed is None else len(allowed))
+        if k == 0:
+            return []
+        query = np.asarray([query_vector], dtype=np.float32)
+        selector = None if allowed is None else self._selector(section, allowed)
+        distances, positions = ann.search(self.vector_store.index, query, k, selector)
+        # Squared L2 distance between unit vectors: cosine = 1 - d / 2
+        return [(int(position), 1.0 - float(distance) / 2.0)
+                for position, distance in zip(positions[0], distances[0]) if position >= 0]
+
+    def search(self, query, query_vector, k=None, section=None):
+        """Return the best ``k`` chunks for a question as a ``SearchResult`` of ``Hit``.
+
+        With ``section`` only chunks tagged with that section are searched.
+        """
+        k = k or self.k
+        started = time.perf_counter()
+        allowed = self._positions(section)
+        if allowed is None:
+            section = None
+        else:
+            with self._bm25_lock:
+                self.filtered += 1
+                self._scanned += len(allowed) / max(self.vector_store.index.ntotal, 1)
+        dense = self.dense(query_vector, self.fetch_k if self.mode == "hybrid" else k, section)
+        after_dense = time.perf_counter()
+        self.timings["dense"].record(after_dense - started)
+
+        if self.mode != "hybrid":
+            hits = [Hit(self._document(position), position, similarity, similarity, None)
+                    for position, similarity in dense[:k]]
+            self.timings["total"].record(time.perf_counter() - started)
+            return SearchResult(hits, [similarity for _, similarity in dense])
+
+        sparse = self.bm25.search(query, self.fetch_k, allowed)
+        after_sparse = time.perf_counter()
+        self.timings["sparse"].record(after_sparse - after_dense)
+
+        # Reciprocal rank fusion: each ranking contributes 1 / (rrf_k + rank)
+        fused = defaultdict(float)
+        dense_scores = dict(dense)
+        sparse_scores = dict(sparse)
+        for ranking in (dense, sparse):
+            for rank, (position, _) in enumerate(ranking, 1):
+                fused[position] += 1.0 / (self.rrf_k + rank)
+        best = sorted(fused, key=lambda position: -fused[position])[:k]
+        hits = [Hit(self._document(position), position, fused[position],
+                    dense_scores.get(position), sparse_scores.get(position))
+                for position in best]
+
+        finished = time.perf_counter()
+        self.timings["fusion"].record(finished - after_sparse)
+        self.timings["total"].record(finished - started)
+        return SearchResult(hits, [similarity for _, similarity in dense])
+
+    async def asearch(self, query, query_vector, k=None, section=None):
+        # FAISS and BM25 are CPU-bound; keep them off the event loop
+        return await asyncio.to_thread(self.search, query, query_vector, k, section)
+
+    def stats(self):
+        stats = {f"{stage}_ms": recorder.summary() for stage, recorder in self.timings.items()}
+        with self._bm25_lock:
+            stats["filtered"] = self.filtered
+            stats["filtered_scanned_avg"] = round(self._scanned / self.filtered, 3) if self.filtered else None
+        return stats
@@ -4,64 +4,91 @@ load_dotenv()
 
 
 import os
+import asyncio
+import logging
+import time
 from config.settings import (
-    KNOWLEDGE_PATH,
     INDEX_PATH,
-    EMBED_MODEL,
-    CHUNK_SIZE,
-    CHUNK_OVERLAP,
+    KNOWLEDGE_PATH,
+    COALESCE_ENABLED,
+    EXACT_CACHE_ENABLED,
+    CONFIDENCE_GATE_ENABLED,
+    MEMORY_MODE,
+    RERANK_ENABLED,
+    SEMANTIC_CACHE_ENABLED,
+    TRACING_ENABLED,
 )
 
-from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import TextLoader
-from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_openai import ChatOpenAI
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import Runnable, RunnableGenerator, RunnableLambda, RunnablePassthrough
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_core.output_parsers import StrOutputParser
 
-# Ensure OpenAI API key is set
-if not os.getenv("OPENAI_API_KEY"):
-    raise ValueError("OPENAI_API_KEY not found in environment variables. Please check your .env file.")
+from legacy import tracing
+from legacy.answer_cache import ExactAnswerCache, SemanticAnswerCache, normalize_question
+from legacy.confidence import HANDOVER_MESSAGE, ConfidenceGate
+from legacy.context import ContextPacker
+from legacy.embeddings import build_embeddings
+from legacy.indexing import is_up_to_date, read_manifest, split_knowledge_base, sync_index
+from legacy.memory import ConversationMemory, count_message_tokens, count_tokens, prompt_tokens
+from legacy.mmap_store import legacy_store_exists, load_store, store_exists
+from legacy.rerank import CrossEncoderReranker
+from legacy.retrieval import HybridRetriever
+from legacy.session_store import SessionStore
+from legacy.singleflight import Broadcast, SingleFlight, history_digest
+from legacy.tracing import TracedRunnable, Tracer
+
+logger = logging.getLogger(__name__)
 
-# In-memory session storage for chat histories
-session_histories = {}
+# Bounded in-memory storage for chat histories, shared by chains that are not given their own
+session_store = SessionStore()
 
 
 # Load and index knowledge base
-def load_vector_store():
-    loader = TextLoader(KNOWLEDGE_PATH, encoding="utf-8")
-    documents = loader.load()
+# Other index and knowledge base paths (and embeddings) can be given, e.g. by scripts/bench_pipeline.py
+def load_vector_store(index_path=None, knowledge_path=None, embeddings=None):
+    started = time.perf_counter()
+    index_path = index_path or INDEX_PATH
+    knowledge_path = knowledge_path or KNOWLEDGE_PATH
 
-    # Split large information into smaller chunks for embedding
-    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-    chunks = splitter.split_documents(documents)
+    # The model is only loaded when something needs to be embedded
+    if embeddings is None:
+        embeddings = build_embeddings()
 
-    embeddings = HuggingFaceEmbeddings(model_name=EMBED_MODEL)
+    # Indexes saved by older versions are pickled. Unpickling is never done while serving:
+    # the index is rebuilt from the knowledge base, or converted with scripts/build_index.py --migrate-pickle
+    if legacy_store_exists(index_path) and not store_exists(index_path):
+        logger.warning("Ignoring the pickled index in %s and rebuilding it from %s "
+                       "(scripts/build_index.py --migrate-pickle converts it instead)", index_path, knowledge_path)
 
-    # Load existing FAISS index if available, otherwise create one
-    if os.path.exists(INDEX_PATH):
-        return FAISS.load_local(INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-    else:
-        store = FAISS.from_documents(chunks, embeddings)
-        store.save_local(INDEX_PATH)
+    # Fast path: the index on disk matches the knowledge base, skip all ingestion work
+    if store_exists(index_path) and is_up_to_date(read_manifest(index_path), knowledge_path):
+        store = load_store(index_path, embeddings)
+        logger.info("Loaded FAISS index from %s in %.3fs", index_path, time.perf_counter() - started)
         return store
 
+    # Missing or stale index: embed only the chunks that are new or changed
+    chunks = split_knowledge_base(knowledge_path)
+    if sync_index(index_path, embeddings, chunks, source_path=knowledge_path).store is None:
+        raise ValueError(f"Knowledge base {knowledge_path} is empty, there is nothing to retrieve from")
+    logger.info("Indexed %d chunks in %.2fs", len(chunks), time.perf_counter() - started)
+    # Serve the saved index memory-mapped, as on the fast path; its manifest names the knowledge base version
+    return load_store(index_path, embeddings)
 
-# Build the retrieval + LLM chain
-def build_retrieval_chain():
-    vector_store = load_vector_store()
-    retriever = vector_store.as_retriever(search_kwargs={"k": 5})
 
-    # Initialize OpenAI Chat model
-    llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
+# Initialize OpenAI Chat model
+def build_llm():
+    # Ensure OpenAI API key is set
+    if not os.getenv("OPENAI_API_KEY"):
+        raise ValueError("OPENAI_API_KEY not found in environment variables. Please check your .env file.")
+    return ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
 
 
-    # System-level prompt with tone, structure, and fallback behavior
-    prompt = ChatPromptTemplate.from_messages([
+# System-level prompt with tone, structure, and fallback behavior
+def build_prompt():
+    return ChatPromptTemplate.from_messages([
         MessagesPlaceholder(variable_name="chat_history"),
         ("system",
          "You are Clickatell’s virtual assistant.\n\n"
@@ -84,26 +111,295 @@ def build_retrieval_chain():
         ("human", "{input}")
     ])
 
+
+# Build the retrieval + LLM chain
+# The vector store, LLM and caches can be passed in so they are shared instead of rebuilt (see legacy/engine.py)
+# reranker=False turns reranking off whatever RERANK_ENABLED says (tests, benchmarks)
+def build_retrieval_chain(vector_store=None, llm=None, answer_cache=None, exact_cache=None, sessions=None,
+                          memory=None, retriever=None, reranker=None, context_packer=None, gate=None,
+                          singleflight=None, tracer=None, kb_version=None):
+    if vector_store is None:
+        vector_store = load_vector_store()
+    embeddings = vector_store.embeddings
+
+    if llm is None:
+        llm = build_llm()
+
+    if retriever is None:
+        retriever = HybridRetriever(vector_store)
+    if reranker is None:
+        reranker = CrossEncoderReranker() if RERANK_ENABLED else None
+    elif reranker is False:
+        reranker = None
+    if context_packer is None:
+        context_packer = ContextPacker()
+    if gate is None and CONFIDENCE_GATE_ENABLED:
+        gate = ConfidenceGate()
+    if sessions is None:
+        sessions = session_store
+    if memory is None and MEMORY_MODE == "summary":
+        memory = ConversationMemory(llm)
+    if singleflight is None and COALESCE_ENABLED:
+        singleflight = SingleFlight()
+    if tracer is None and TRACING_ENABLED:
+        tracer = Tracer()
+
+    if answer_cache is None and SEMANTIC_CACHE_ENABLED:
+        answer_cache = SemanticAnswerCache()
+    if exact_cache is None and EXACT_CACHE_ENABLED:
+        exact_cache = ExactAnswerCache()
+
+    # Cached answers are only valid for the knowledge base they were generated from: the version in the
+    # manifest of the index behind this store (stores built in memory have none)
+    index_path = getattr(vector_store.docstore, "path", None)
+    index_path = os.path.abspath(index_path) if index_path else ""
+    if kb_version is None:
+        kb_version = ((read_manifest(index_path) if index_path else None) or {}).get("version", "unversioned")
+    if exact_cache is not None:
+        exact_cache.purge_stale(kb_version, index_path)
+
+    prompt = build_prompt()
+
     # Build the RAG chain with retrieval
-    def format_docs(docs):
-        return "\n\n".join(doc.page_content for doc in docs)
-    
-    chain = (
+    # Hybrid search finds exact product and plan names, so fewer chunks are needed than with FAISS alone.
+    # With the reranker, more candidates are fetched and only the relevant ones are kept.
+    # An optional "section" in the input restricts the search to that knowledge base section.
+    def trace_hits(results):
+        # Which chunks were retrieved and how they scored, for the request's trace
+        if tracing.current() is not None:
+            ids = retriever.vector_store.index_to_docstore_id
+            tracing.annotate(chunks=[
+                {"id": ids[hit.position], "score": round(hit.score, 4),
+                 "dense_score": None if hit.dense_score is None else round(hit.dense_score, 4)}
+                for hit in results
+            ])
+        return results
+
+    def search(x, query_vector):
+        k = None if reranker is None else reranker.candidates
+        with tracing.span("retrieval"):
+            results = retriever.search(x["input"], query_vector, k=k, section=x.get("section"))
+        return trace_hits(results)
+
+    async def asearch(x, query_vector):
+        k = None if reranker is None else reranker.candidates
+        with tracing.span("retrieval"):
+            results = await retriever.asearch(x["input"], query_vector, k=k, section=x.get("section"))
+        return trace_hits(results)
+
+    # Record the size of every prompt sent to the LLM, overall and per session
+    def record_prompt(prompt_value, config):
+        tokens = count_message_tokens(prompt_value.to_messages())
+        prompt_tokens.record(tokens)
+        session_id = config.get("configurable", {}).get("session_id")
+        if session_id is not None and session_id in sessions:
+            sessions(session_id).prompt_tokens.append(tokens)
+        tracing.annotate(prompt_tokens=tokens)
+        tracing.mark("llm")
+        return prompt_value
+
+    async def arecord_prompt(prompt_value, config):
+        return record_prompt(prompt_value, config)
+
+    # Time to first token and to the last one are measured from the LLM call; parsing is the time
+    # each chunk spends in the output parser
+    def time_llm(chunks):
+        first = True
+        for chunk in chunks:
+            if first:
+                tracing.add_since("llm_first_token", "llm")
+                first = False
+            tracing.mark("parsing")
+            yield chunk
+        tracing.add_since("llm", "llm")
+
+    async def atime_llm(chunks):
+        first = True
+        async for chunk in chunks:
+            if first:
+                tracing.add_since("llm_first_token", "llm")
+                first = False
+            tracing.mark("parsing")
+            yield chunk
+        tracing.add_since("llm", "llm")
+
+    def time_parsing(texts):
+        for text in texts:
+            tracing.add_since("parsing", "parsing")
+            yield text
+
+    async def atime_parsing(texts):
+        async for text in texts:
+            tracing.add_since("parsing", "parsing")
+            yield text
+
+    generate = (
             {
                 "input": lambda x: x["input"],
                 "chat_history": lambda x: x["chat_history"],
-                "context": lambda x: format_docs(retriever.get_relevant_documents(x["input"]))
+                "context": lambda x: x["context"]
             }
             | prompt
+            | RunnableLambda(record_prompt, afunc=arecord_prompt)
             | llm
-            | StrOutputParser()
     )
+    if tracer is None:
+        generate = generate | StrOutputParser()
+    else:
+        generate = (generate
+                    | RunnableGenerator(time_llm, atime_llm)
+                    | StrOutputParser()
+                    | RunnableGenerator(time_parsing, atime_parsing))
+
+    def store_answer(question, query_vector, response):
+        if exact_cache is not None:
+            exact_cache.store(question, response, kb_version, index_path)
+        if answer_cache is not None:
+            answer_cache.store(query_vector, response, kb_version)
+
+    # Serve repeated questions from the answer caches instead of calling the LLM:
+    # exact matches first (no embedding needed), then semantically close questions
+    def cacheable(x):
+        # Follow-up questions depend on the conversation and filtered ones on the section,
+        # so only standalone, unfiltered questions are cached
+        return not x["chat_history"] and not x.get("section")
+
+    def exact_answer(x):
+        if cacheable(x) and exact_cache is not None:
+            cached = exact_cache.lookup(x["input"], kb_version)
+            if cached is not None:
+                tracing.annotate(outcome="exact_cache")
+            return cached
+        return None
+
+    def semantic_answer(x, query_vector):
+        if not cacheable(x) or answer_cache is None:
+            return None
+        cached = answer_cache.lookup(query_vector, kb_version)
+        if cached is not None:
+            tracing.annotate(outcome="semantic_cache")
+            if exact_cache is not None:
+                exact_cache.store(x["input"], cached, kb_version, index_path)
+        return cached
+
+    def respond(x, query_vector, results):
+        # Weak retrieval means the knowledge base cannot answer: hand over without calling the LLM.
+        # Follow-ups ("tell me more") lean on the conversation rather than retrieval, so they are not gated.
+        if gate is not None and not x["chat_history"]:
+            with tracing.span("gate"):
+                decision = gate.check(x["input"], results.dense_scores, query_vector)
+            if not decision.answerable:
+                tracing.annotate(outcome="handover")
+                return HANDOVER_MESSAGE
+
+        hits = results
+        if reranker is not None:
+            with tracing.span("rerank"):
+                hits = reranker.rerank(x["input"], results)
+        with tracing.span("context"):
+            context = context_packer.pack(hits)
+        if tracing.current() is not None:
+            tracing.annotate(context_tokens=count_tokens(context))
+        run = RunnablePassthrough.assign(context=lambda _: context) | generate
+        if not cacheable(x):
+            return run
+        return run.with_listeners(
+            on_end=lambda result: store_answer(x["input"], query_vector, result.outputs["output"])
+        )
+
+    # The question is embedded once and reused for the cache lookup and the search
+    def lead(x):
+        with tracing.span("embedding"):
+            query_vector = embeddings.embed_query(x["input"])
+        cached = semantic_answer(x, query_vector)
+        if cached is not None:
+            return cached
+        return respond(x, query_vector, search(x, query_vector))
 
+    # Async variant used by ainvoke()/astream(): embedding and search run off the event loop
+    # and the LLM call is awaited, so one process can serve many concurrent conversations
+    async def alead(x):
+        with tracing.span("embedding"):
+            query_vector = await embeddings.aembed_query(x["input"])
+        cached = semantic_answer(x, query_vector)
+        if cached is not None:
+            return cached
+        results = await asearch(x, query_vector)
+        return await asyncio.to_thread(respond, x, query_vector, results)
+
+    # Identical questions asked while the first is still being answered follow its flight
+    # instead of running their own retrieval and LLM call
+    def flight_key(x):
+        return kb_version, x.get("section") or "", history_digest(x["chat_history"]), normalize_question(x["input"])
+
+    def broadcast(key, flight, result):
+        # The leader publishes its answer to the flight: token by token when streamed, whole when invoked
+        if not isinstance(result, Runnable):
+            flight.publish(result)
+            singleflight.finish(key, flight)
+            return result
+        return Broadcast(singleflight, key, flight, result)
+
+    def follow(flight):
+        def stream(x):
+            yield from flight
+
+        async def astream(x):
+            async for token in flight:
+                yield token
+
+        return RunnableLambda(stream, afunc=astream)
+
+    def answer(x):
+        cached = exact_answer(x)
+        if cached is not None:
+            return cached
+        if singleflight is None:
+            return lead(x)
+        key = flight_key(x)
+        flight, leader = singleflight.join(key)
+        if not leader:
+            tracing.annotate(outcome="coalesced")
+            return follow(flight)
+        try:
+            return broadcast(key, flight, lead(x))
+        except BaseException as e:
+            singleflight.finish(key, flight, e)
+            raise
+
+    async def aanswer(x):
+        cached = exact_answer(x)
+        if cached is not None:
+            return cached
+        if singleflight is None:
+            return await alead(x)
+        key = flight_key(x)
+        flight, leader = singleflight.join(key)
+        if not leader:
+            tracing.annotate(outcome="coalesced")
+            return follow(flight)
+        try:
+            return broadcast(key, flight, await alead(x))
+        except BaseException as e:
+            singleflight.finish(key, flight, e)
+            raise
+
+    chain = RunnableLambda(answer, afunc=aanswer)
+
+    def load_history(session_id):
+        with tracing.span("history_load"):
+            # With budgeted memory the chain sees a summary plus recent turns instead of the full history
+            return sessions(session_id) if memory is None else memory.view(sessions(session_id))
 
     # Wrap the chain with message history (memory) support
-    return RunnableWithMessageHistory(
+    chain = RunnableWithMessageHistory(
         runnable=chain,
-        get_session_history=lambda session_id: session_histories.setdefault(session_id, ChatMessageHistory()),
+        get_session_history=load_history,
         input_messages_key="input",
         history_messages_key="chat_history"
     )
+    if tracer is None:
+        return chain
+
+    # Every request gets a trace, completed (logged and added to the metrics) once its answer is complete
+    return TracedRunnable(chain, tracer, count_tokens)
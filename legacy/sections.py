@@ -0,0 +1,79 @@
+"""
+Structure-aware splitting of the knowledge base.
+
+The knowledge base is organised as "Section N: Title" blocks underlined with
+dashes, some of which contain topics underlined with tildes. A generic
+character splitter cuts across those boundaries, so one chunk can mix pricing
+with troubleshooting. This splitter keeps every chunk inside a single topic
+(or section) and records where it came from in the chunk's metadata, which
+the retriever uses to search a single section.
+"""
+
+import re
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+from config.settings import CHUNK_OVERLAP, CHUNK_SIZE
+
+# Name given to the text before the first "Section N:" heading
+PREAMBLE_SECTION = "Introduction"
+
+_SECTION = re.compile(r"^Section\s+(\d+):\s*(.+?)\s*$")
+_SECTION_RULE = re.compile(r"^-{3,}\s*$")
+_TOPIC_RULE = re.compile(r"^~{3,}\s*$")
+
+
+def _blocks(text):
+    """Yield ``(section_number, section, topic, text)`` for every topic or untitled part of a section"""
+    number, section, topic = 0, PREAMBLE_SECTION, None
+    lines = []
+
+    def block():
+        body = "\n".join(lines).strip()
+        return (number, section, topic, body) if body else None
+
+    all_lines = text.splitlines()
+    for i, line in enumerate(all_lines):
+        following = all_lines[i + 1] if i + 1 < len(all_lines) else ""
+        heading = _SECTION.match(line)
+        if heading and _SECTION_RULE.match(following):
+            current = block()
+            if current:
+                yield current
+            number, section, topic = int(heading.group(1)), heading.group(2), None
+            lines = []
+        elif line.strip() and _TOPIC_RULE.match(following):
+            # A section heading with no text of its own is dropped; the chunks' metadata names the section
+            if any(text.strip() for text in lines[2:]):
+                yield block()
+            lines = []
+            topic = line.strip()
+        elif line.strip() == "---":
+            # Separator between sections, carries no content
+            continue
+        lines.append(line)
+    current = block()
+    if current:
+        yield current
+
+
+class SectionSplitter:
+    """Splits documents without crossing section or topic boundaries.
+
+    Blocks longer than ``chunk_size`` are split further with the usual
+    recursive splitter, still within the block. Each chunk's metadata gets
+    ``section``, ``section_number`` and ``topic`` (None outside topics).
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+        self._splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    def split_documents(self, documents):
+        chunks = []
+        for document in documents:
+            for number, section, topic, text in _blocks(document.page_content):
+                metadata = dict(document.metadata, section=section, section_number=number, topic=topic)
+                chunks.extend(Document(page_content=part, metadata=dict(metadata))
+                              for part in self._splitter.split_text(text))
+        return chunks
@@ -0,0 +1,208 @@
+"""
+Bounded in-memory store for per-session chat histories.
+
+Sessions are kept in least-recently-used order. A session idle for longer
+than the TTL is dropped, and when the store is full the least recently used
+session is evicted, so a long-running server holds at most ``max_sessions``
+histories. Each history has its own lock, so concurrent turns in different
+sessions never wait on each other.
+
+With a persistence backend (see legacy/history_store.py) every appended
+message is also queued for disk, and a session that is not in memory is
+restored from the backend the first time it is asked for again.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.chat_history import InMemoryChatMessageHistory
+from pydantic import Field, PrivateAttr
+
+from config.settings import SESSION_IDLE_TTL_SECONDS, SESSION_MAX_SESSIONS
+
+
+def message_bytes(message):
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return len(content.encode("utf-8"))
+
+
+class SessionHistory(InMemoryChatMessageHistory):
+    """Chat history whose updates are serialized by a per-session lock.
+
+    ``summary`` and ``summarized`` are maintained by the token-budgeted memory
+    (see legacy/memory.py): the first ``summarized`` messages are folded into
+    ``summary``. ``prompt_tokens`` holds the prompt size of each answered turn.
+    """
+
+    summary: str = ""
+    summarized: int = 0
+    prompt_tokens: list = Field(default_factory=list)
+
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+    _bytes: int = PrivateAttr(default=0)
+    _session_id: str = PrivateAttr(default=None)
+    _backend: object = PrivateAttr(default=None)
+    _offset: int = PrivateAttr(default=0)
+
+    def attach(self, session_id, backend, restored=None):
+        """Persist future changes to ``backend``, starting from a restored snapshot if given"""
+        with self._lock:
+            self._session_id = session_id
+            self._backend = backend
+            if restored is not None:
+                self._offset = restored.offset
+                self.messages = list(restored.messages)
+                self.summary = restored.summary
+                self.summarized = max(0, restored.summarized - restored.offset)
+                self._bytes = sum(message_bytes(message) for message in self.messages)
+
+    @property
+    def lock(self):
+        return self._lock
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def add_messages(self, messages):
+        with self._lock:
+            # Replace the list instead of appending so readers keep a consistent snapshot
+            start = self._offset + len(self.messages)
+            self.messages = self.messages + list(messages)
+            self._bytes += sum(message_bytes(message) for message in messages)
+            if self._backend is not None:
+                self._backend.append(self._session_id, start, messages)
+
+    def set_summary(self, summary, summarized):
+        """Record that the first ``summarized`` messages are now covered by ``summary``"""
+        with self._lock:
+            self.summary = summary
+            self.summarized = summarized
+            if self._backend is not None:
+                self._backend.save_summary(self._session_id, summary, self._offset + summarized)
+
+    async def aadd_messages(self, messages):
+        self.add_messages(messages)
+
+    def clear(self):
+        with self._lock:
+            self.messages = []
+            self.summary = ""
+            self.summarized = 0
+            self._bytes = 0
+            self._offset = 0
+            if self._backend is not None:
+                self._backend.delete(self._session_id)
+
+    async def aclear(self):
+        self.clear()
+
+
+class SessionStore:
+    """Maps session ids to histories with LRU capacity and idle-TTL eviction.
+
+    Instances are callable, so they can be passed directly as the
+    ``get_session_history`` argument of ``RunnableWithMessageHistory``.
+    """
+
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS, idle_ttl_seconds=SESSION_IDLE_TTL_SECONDS,
+                 history_factory=SessionHistory, backend=None):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.history_factory = history_factory
+        self.backend = backend
+        self.created = 0
+        self.restored = 0
+        self.restore_seconds = 0.0
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+        self._sessions = OrderedDict()  # session_id -> (history, last_used)
+        self._lock = threading.Lock()
+
+    def _evict_idle(self, now):
+        if self.idle_ttl_seconds is None:
+            return
+        # Sessions are ordered by last use, so idle ones are at the front
+        while self._sessions:
+            session_id, (_, last_used) = next(iter(self._sessions.items()))
+            if now - last_used <= self.idle_ttl_seconds:
+                break
+            del self._sessions[session_id]
+            self.evicted_idle += 1
+
+    def get(self, session_id):
+        """Return the history for ``session_id``, restoring or creating it if needed"""
+        with self._lock:
+            self._evict_idle(time.monotonic())
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                return self._touch(session_id, entry[0])
+
+        # Read from disk without holding the store lock, so other sessions are not blocked
+        history = self._new_history(session_id)
+
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                # Another thread restored it first
+                return self._touch(session_id, entry[0])
+            self.created += 1
+            self._touch(session_id, history)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted_capacity += 1
+            return history
+
+    def _touch(self, session_id, history):
+        self._sessions[session_id] = (history, time.monotonic())
+        self._sessions.move_to_end(session_id)
+        return history
+
+    def _new_history(self, session_id):
+        history = self.history_factory()
+        if self.backend is None:
+            return history
+        started = time.perf_counter()
+        restored = self.backend.load(session_id)
+        history.attach(session_id, self.backend, restored)
+        if restored is not None:
+            self.restored += 1
+            self.restore_seconds += time.perf_counter() - started
+        return history
+
+    __call__ = get
+
+    def discard(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def evict_idle(self):
+        """Drop idle sessions now instead of waiting for the next access"""
+        with self._lock:
+            self._evict_idle(time.monotonic())
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            histories = [history for history, _ in self._sessions.values()]
+            stats = {
+                "live": len(histories),
+                "created": self.created,
+                "restored": self.restored,
+                "restore_ms_avg": round(self.restore_seconds * 1000 / self.restored, 2) if self.restored else None,
+                "evicted_idle": self.evicted_idle,
+                "evicted_capacity": self.evicted_capacity,
+                "messages": sum(len(history.messages) for history in histories),
+                "bytes": sum(getattr(history, "size_bytes", 0) for history in histories),
+            }
+        if self.backend is not None:
+            stats.update({f"persist_{key}": value for key, value in self.backend.stats().items()})
+        return stats
@@ -0,0 +1,206 @@
+"""
+Single-flight coalescing of identical in-flight questions.
+
+When many users send the same question at the same moment (a sidebar quick
+query during a campaign), only the first request, the leader, runs
+retrieval and the LLM. Requests that arrive while it is running follow its
+flight: they receive the same tokens as they are generated, replayed from the
+start, so streaming and non-streaming callers both work. Once the answer is
+complete the flight is closed; later repeats are served by the answer caches.
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+
+from langchain_core.runnables import Runnable
+
+
+def history_digest(messages):
+    """Short fingerprint of a conversation, so only equivalent histories share a flight"""
+    if not messages:
+        return ""
+    payload = json.dumps([(message.type, message.content) for message in messages], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class FlightFailed(RuntimeError):
+    """The leader's answer failed, or it stopped before the answer was complete"""
+
+
+class Flight:
+    """Tokens of one answer being generated, readable by any number of subscribers"""
+
+    def __init__(self):
+        self.tokens = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+        self._condition = threading.Condition()
+        self._waiters = []   # (event loop, asyncio.Event) of async subscribers
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, []
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def publish(self, token):
+        with self._condition:
+            self.tokens.append(token)
+            self._condition.notify_all()
+            self._wake()
+
+    def finish(self, error=None):
+        with self._condition:
+            if self.done:
+                return
+            self.done = True
+            self.error = error
+            self._condition.notify_all()
+            self._wake()
+
+    def __iter__(self):
+        position = 0
+        while True:
+            with self._condition:
+                while position >= len(self.tokens) and not self.done:
+                    self._condition.wait()
+                tokens = self.tokens[position:]
+                finished = self.done
+            yield from tokens
+            position += len(tokens)
+            if finished and position >= len(self.tokens):
+                if self.error is not None:
+                    raise FlightFailed("The shared answer could not be completed") from self.error
+                return
+
+    async def __aiter__(self):
+        position = 0
+        loop = asyncio.get_running_loop()
+        while True:
+            event = None
+            with self._condition:
+                if position >= len(self.tokens) and not self.done:
+                    event = asyncio.Event()
+                    self._waiters.append((loop, event))
+            if event is not None:
+                await event.wait()
+                continue
+            with self._condition:
+                tokens = self.tokens[position:]
+                finished = self.done
+            for token in tokens:
+                yield token
+            position += len(tokens)
+            if finished and position >= len(self.tokens):
+                if self.error is not None:
+                    raise FlightFailed("The shared answer could not be completed") from self.error
+                return
+
+
+class Broadcast(Runnable):
+    """Runs the leader's answer and publishes it to the flight of its followers.
+
+    Streaming publishes every token as it is generated; ``invoke`` stays one
+    non-streaming call and publishes the whole answer when it is complete.
+    """
+
+    def __init__(self, singleflight, key, flight, runnable):
+        self.singleflight = singleflight
+        self.key = key
+        self.flight = flight
+        self.runnable = runnable
+
+    def _stopped(self):
+        return FlightFailed("The leading request stopped before its answer was complete")
+
+    def invoke(self, input, config=None, **kwargs):
+        error = self._stopped()
+        try:
+            answer = self.runnable.invoke(input, config, **kwargs)
+            self.flight.publish(answer)
+            error = None
+            return answer
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.singleflight.finish(self.key, self.flight, error)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        error = self._stopped()
+        try:
+            answer = await self.runnable.ainvoke(input, config, **kwargs)
+            self.flight.publish(answer)
+            error = None
+            return answer
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.singleflight.finish(self.key, self.flight, error)
+
+    def stream(self, input, config=None, **kwargs):
+        error = self._stopped()
+        try:
+            for token in self.runnable.stream(input, config, **kwargs):
+                self.flight.publish(token)
+                yield token
+            error = None
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.singleflight.finish(self.key, self.flight, error)
+
+    async def astream(self, input, config=None, **kwargs):
+        error = self._stopped()
+        try:
+            async for token in self.runnable.astream(input, config, **kwargs):
+                self.flight.publish(token)
+                yield token
+            error = None
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.singleflight.finish(self.key, self.flight, error)
+
+
+class SingleFlight:
+    """Registry of in-flight answers keyed by question, history and knowledge base version"""
+
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        """Return ``(flight, is_leader)``; the leader must eventually call :meth:`finish`"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                self.followers += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self.leaders += 1
+            return flight, True
+
+    def finish(self, key, flight, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.finish(error)
+
+    def stats(self):
+        with self._lock:
+            requests = self.leaders + self.followers
+            return {
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "calls_saved": self.followers,
+                "saved_rate": round(self.followers / requests, 3) if requests else 0.0,
+            }
@@ -0,0 +1,111 @@
+"""
+Token streaming from the retrieval chain to the UIs.
+
+``AnswerStream`` iterates over the text of an answer as the LLM produces it,
+records time-to-first-token and still supports fallback detection: output is
+held back while it could be the start of a fallback phrase, so the handover
+message never flashes up as a normal answer.
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class LatencyRecorder:
+    """Keeps the most recent samples of a latency metric"""
+
+    def __init__(self, max_samples=1000):
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def percentile(self, fraction):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def summary(self):
+        p50 = self.percentile(0.50)
+        p95 = self.percentile(0.95)
+        return {
+            "count": self.count,
+            "p50_ms": None if p50 is None else round(p50 * 1000, 1),
+            "p95_ms": None if p95 is None else round(p95 * 1000, 1),
+        }
+
+
+# Process-wide streaming metrics
+time_to_first_token = LatencyRecorder()
+time_to_last_token = LatencyRecorder()
+
+
+def _fallback_text(text):
+    # The prompt asks for the fallback sentence in italics
+    return text.lower().lstrip(" \n*_")
+
+
+class AnswerStream:
+    """Streams one answer from a ``RunnableWithMessageHistory`` chain.
+
+    Iterating yields text chunks ready to display. Afterwards ``text`` holds
+    the full answer, ``is_fallback`` tells whether it asked for a live agent and
+    ``time_to_first_token`` is the latency of the first streamed token.
+    With ``section`` retrieval is restricted to that knowledge base section.
+    """
+
+    def __init__(self, chain, question, session_id, fallback_keywords, section=None):
+        self.chain = chain
+        self.question = question
+        self.session_id = session_id
+        self.section = section
+        self.fallback_keywords = [keyword.lower() for keyword in fallback_keywords]
+        self.text = ""
+        self.is_fallback = False
+        self.time_to_first_token = None
+
+    def _may_be_fallback(self):
+        text = _fallback_text(self.text)
+        return any(keyword.startswith(text) for keyword in self.fallback_keywords)
+
+    def _contains_fallback(self):
+        text = self.text.lower()
+        return any(keyword in text for keyword in self.fallback_keywords)
+
+    def __iter__(self):
+        started = time.perf_counter()
+        holding = True
+
+        inputs = {"input": self.question}
+        if self.section:
+            inputs["section"] = self.section
+
+        # The stream is always consumed to the end so the chat history records the answer
+        for token in self.chain.stream(
+                inputs,
+                config={"configurable": {"session_id": self.session_id}}
+        ):
+            if self.time_to_first_token is None:
+                self.time_to_first_token = time.perf_counter() - started
+                time_to_first_token.record(self.time_to_first_token)
+            self.text += token
+
+            if self.is_fallback or self._contains_fallback():
+                self.is_fallback = True
+            elif holding:
+                if not self._may_be_fallback():
+                    holding = False
+                    yield self.text
+            else:
+                yield token
+
+        time_to_last_token.record(time.perf_counter() - started)
+        if holding and not self.is_fallback and self.text:
+            yield self.text
@@ -0,0 +1,214 @@
+"""
+Per-request tracing of the retrieval chain.
+
+Every answer gets a ``Trace`` holding how long each stage took (history
+load, query embedding, retrieval, reranking, context formatting, LLM time to
+first token and total, output parsing), which chunks were retrieved with
+their scores, and the prompt, context and answer token counts. When the
+answer is complete the trace is logged as one JSON line and its timings are
+added to the Prometheus histograms in ``legacy/metrics.py``. The question
+itself is left out unless ``TRACE_LOG_QUESTIONS`` is set, since users type
+personal data into it.
+
+The active trace is kept in a context variable, so stages running in worker
+threads or other tasks of the same request record into it, and code outside
+a traced request pays for nothing but a lookup.
+"""
+
+import contextvars
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+
+from langchain_core.runnables import Runnable
+
+from config.settings import TRACE_LOG_QUESTIONS
+from legacy import metrics
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("rag_trace", default=None)
+
+
+class Trace:
+    """Timings and attributes of one request"""
+
+    def __init__(self, session_id=None, question=None, section=None):
+        self.request_id = uuid.uuid4().hex[:16]
+        self.session_id = session_id
+        self.question = question
+        self.section = section
+        self.started = time.perf_counter()
+        self.spans = {}         # stage -> seconds
+        self.attributes = {}
+        self._marks = {}
+
+    def add(self, stage, seconds):
+        # Stages that run more than once per request (such as parsing each token) add up
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    def record(self):
+        record = {"request_id": self.request_id, "session_id": self.session_id}
+        if self.question is not None:
+            record["question"] = self.question
+        return {
+            **record,
+            "section": self.section,
+            "spans_ms": {stage: round(seconds * 1000, 3) for stage, seconds in self.spans.items()},
+            **self.attributes,
+        }
+
+
+def current():
+    """The trace of the request being answered, or None"""
+    return _current.get()
+
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block as ``stage`` of the current trace"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(stage, time.perf_counter() - started)
+
+
+def annotate(**attributes):
+    """Attach attributes (retrieved chunks, token counts, cache hits...) to the current trace"""
+    trace = _current.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+
+
+def mark(name):
+    """Remember now as the start of something that ends in another function"""
+    trace = _current.get()
+    if trace is not None:
+        trace._marks[name] = time.perf_counter()
+
+
+def add_since(stage, name):
+    """Add the time since ``mark(name)`` to ``stage``"""
+    trace = _current.get()
+    if trace is not None and name in trace._marks:
+        trace.add(stage, time.perf_counter() - trace._marks[name])
+
+
+class Tracer:
+    """Starts and completes traces and exports them as JSON logs and histograms"""
+
+    def __init__(self, registry=None, log_questions=TRACE_LOG_QUESTIONS):
+        self.log_questions = log_questions
+        registry = registry or metrics.registry
+        self.stage_seconds = registry.histogram(
+            "rag_stage_seconds", "Time spent in each stage of answering a question", labels=("stage",))
+        self.tokens = registry.histogram(
+            "rag_tokens", "Tokens per request in the prompt, the retrieved context and the answer",
+            labels=("kind",), buckets=metrics.TOKEN_BUCKETS)
+        self.requests = registry.counter(
+            "rag_requests", "Answered requests by how the answer was produced", labels=("outcome",))
+
+    def start(self, session_id=None, question=None, section=None):
+        """Make a new trace the current one (in this context) and return it"""
+        trace = Trace(session_id, question if self.log_questions else None, section)
+        _current.set(trace)
+        return trace
+
+    def finish(self, trace, error=None):
+        """Complete ``trace``: log it as JSON and add it to the metrics"""
+        if _current.get() is trace:
+            _current.set(None)
+        trace.spans["total"] = time.perf_counter() - trace.started
+        if error is not None:
+            trace.attributes["outcome"] = "error"
+            trace.attributes["error"] = type(error).__name__
+        outcome = trace.attributes.setdefault("outcome", "answered")
+
+        for stage, seconds in trace.spans.items():
+            self.stage_seconds.observe(seconds, stage)
+        for kind in ("prompt", "context", "answer"):
+            tokens = trace.attributes.get(f"{kind}_tokens")
+            if tokens is not None:
+                self.tokens.observe(tokens, kind)
+        self.requests.inc(outcome)
+        logger.info(json.dumps(trace.record(), default=str))
+
+
+class TracedRunnable(Runnable):
+    """Runs a chain with a trace per request, completed once its answer is complete.
+
+    ``invoke`` stays a single non-streaming call of the chain; only ``stream``
+    streams it, so time to first token is only meaningful for streamed answers.
+    ``count_tokens``, if given, adds the answer's token count to the trace.
+    """
+
+    def __init__(self, runnable, tracer, count_tokens=None):
+        self.runnable = runnable
+        self.tracer = tracer
+        self.count_tokens = count_tokens
+
+    def _start(self, input, config):
+        session_id = (config or {}).get("configurable", {}).get("session_id")
+        return self.tracer.start(session_id, input.get("input"), input.get("section"))
+
+    def _finish(self, trace, answer, error):
+        if self.count_tokens is not None:
+            trace.attributes["answer_tokens"] = self.count_tokens(answer if isinstance(answer, str) else "")
+        self.tracer.finish(trace, error)
+
+    def invoke(self, input, config=None, **kwargs):
+        trace = self._start(input, config)
+        answer, error = "", None
+        try:
+            answer = self.runnable.invoke(input, config, **kwargs)
+            return answer
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(trace, answer, error)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        trace = self._start(input, config)
+        answer, error = "", None
+        try:
+            answer = await self.runnable.ainvoke(input, config, **kwargs)
+            return answer
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(trace, answer, error)
+
+    def stream(self, input, config=None, **kwargs):
+        trace = self._start(input, config)
+        answer, error = "", None
+        try:
+            for token in self.runnable.stream(input, config, **kwargs):
+                answer += token
+                yield token
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(trace, answer, error)
+
+    async def astream(self, input, config=None, **kwargs):
+        trace = self._start(input, config)
+        answer, error = "", None
+        try:
+            async for token in self.runnable.astream(input, config, **kwargs):
+                answer += token
+                yield token
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(trace, answer, error)
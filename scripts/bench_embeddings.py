@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Compare the embedding backends: torch (sentence-transformers) and ONNX float32/int8.
+
+Each backend runs in its own process so load time and resident memory are
+measured from a clean start. Reports model load time, single-query latency
+(p50/p95/p99), document throughput in batches and process RSS.
+
+Usage:
+    python scripts/bench_embeddings.py
+    python scripts/bench_embeddings.py --queries 500 --documents 2000 --backends torch onnx-int8
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+# Add parent directory to path
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+import numpy as np
+
+from config.settings import EMBED_MODEL
+
+BACKENDS = ("torch", "onnx-float32", "onnx-int8")
+
+
+def build(backend, model_name):
+    if backend == "torch":
+        from legacy.embeddings import LazyEmbeddings
+        return LazyEmbeddings(model_name)
+    from legacy.onnx_embeddings import OnnxEmbeddings
+    return OnnxEmbeddings(model_name, quantized=backend == "onnx-int8")
+
+
+def measure(backend, model_name, queries, documents, batch_size, results):
+    from legacy.indexing import split_knowledge_base
+    from legacy.metrics import current_rss_bytes
+
+    texts = [chunk.page_content for chunk in split_knowledge_base()]
+    questions = [text.splitlines()[-1][:120] for text in texts]
+    rss_before = current_rss_bytes()
+    embeddings = build(backend, model_name)
+
+    started = time.perf_counter()
+    embeddings.embed_query("warm up")
+    load_seconds = time.perf_counter() - started
+
+    latencies = []
+    for i in range(queries):
+        started = time.perf_counter()
+        embeddings.embed_query(f"{questions[i % len(questions)]} {i}")
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    corpus = [texts[i % len(texts)] + f" {i}" for i in range(documents)]
+    started = time.perf_counter()
+    for start in range(0, len(corpus), batch_size):
+        embeddings.embed_documents(corpus[start:start + batch_size])
+    throughput = len(corpus) / (time.perf_counter() - started)
+
+    results.put({
+        "backend": backend,
+        "load_s": round(load_seconds, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "docs_per_s": round(throughput, 1),
+        "rss_mb": round(current_rss_bytes() / (1024 * 1024), 1),
+        "model_rss_mb": round((current_rss_bytes() - rss_before) / (1024 * 1024), 1),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the embedding backends")
+    parser.add_argument("--model", default=EMBED_MODEL)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--queries", type=int, default=200, help="Single-query embeddings to time")
+    parser.add_argument("--documents", type=int, default=1000, help="Documents embedded for throughput")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    for backend in args.backends:
+        results = context.Queue()
+        process = context.Process(target=measure, args=(backend, args.model, args.queries,
+                                                        args.documents, args.batch_size, results))
+        process.start()
+        process.join()
+        if process.exitcode != 0 or results.empty():
+            print(f"{backend}: failed (exit code {process.exitcode})")
+            continue
+        rows.append(results.get())
+
+    print(f"{'backend':<13} {'load s':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} "
+          f"{'docs/s':>8} {'RSS MB':>7} {'model MB':>9}")
+    for row in rows:
+        print(f"{row['backend']:<13} {row['load_s']:>7} {row['p50_ms']:>7} {row['p95_ms']:>7} {row['p99_ms']:>7} "
+              f"{row['docs_per_s']:>8} {row['rss_mb']:>7} {row['model_rss_mb']:>9}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(rows, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
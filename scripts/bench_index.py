@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark the FAISS index types and vector quantizations on corpora of growing size.
+
+For each corpus size every index type (flat, HNSW, IVF) and code format
+(float32, fp16, int8, binary) is built from the same vectors with the
+parameters from config/settings.py. Queries are run one at a time, like chat
+questions, and each variant reports recall@k against exact search, p50/p99
+query latency, build time and memory. "RAM MB" is what has to stay resident to
+search (the codes); quantized variants also keep the float32 vectors for
+rescoring in the memory-mapped file, counted in "file MB".
+
+Vectors are synthetic unit vectors with cluster structure similar to sentence
+embeddings, so no model is needed. With --index the vectors of a built index
+are used instead (sizes larger than the index are skipped).
+
+Usage:
+    python scripts/bench_index.py
+    python scripts/bench_index.py --sizes 10000 100000 --queries 500 --k 10
+    python scripts/bench_index.py --types flat --quantizations none int8 binary
+    python scripts/bench_index.py --index vector_store/faiss_index
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add parent directory to path
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+import faiss
+import numpy as np
+
+from legacy import ann, mmap_store
+
+
+def synthetic_vectors(size, dimension, seed=0):
+    """Unit vectors drawn around random topic centres"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((max(1, size // 100), dimension)).astype(np.float32)
+    data = centres[rng.integers(0, len(centres), size)] + 0.6 * rng.standard_normal((size, dimension)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def index_vectors(path):
+    return ann.vectors(faiss.read_index(os.path.join(mmap_store.store_directory(path), mmap_store.VECTORS_FILE)))
+
+
+def make_queries(data, count, seed=1):
+    # Questions land near, not on, the chunks that answer them
+    rng = np.random.default_rng(seed)
+    queries = data[rng.integers(0, len(data), count)] + 0.05 * rng.standard_normal((count, data.shape[1]))
+    queries = queries.astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def run(index, queries, k):
+    latencies = []
+    results = []
+    for query in queries:
+        started = time.perf_counter()
+        _, positions = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - started)
+        results.append(positions[0])
+    return np.array(results), np.array(latencies) * 1000
+
+
+def resident_mb(index):
+    # The rescoring vectors are read from the mapped file only for the candidates
+    searched = faiss.downcast_index(index.base_index) if isinstance(index, faiss.IndexRefine) else index
+    return len(faiss.serialize_index(searched)) / (1024 * 1024)
+
+
+def recall_at_k(results, exact):
+    return float(np.mean([len(set(found) & set(truth)) / len(truth) for found, truth in zip(results, exact)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark flat, HNSW and IVF indexes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Corpus sizes")
+    parser.add_argument("--dimension", type=int, default=384, help="Vector size (all-MiniLM-L6-v2: 384)")
+    parser.add_argument("--queries", type=int, default=300, help="Queries per index")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--index", help="Use the vectors of this index directory instead of synthetic ones")
+    parser.add_argument("--types", nargs="+", default=list(ann.INDEX_TYPES), choices=ann.INDEX_TYPES)
+    parser.add_argument("--quantizations", nargs="+", default=list(ann.QUANTIZATIONS), choices=ann.QUANTIZATIONS)
+    args = parser.parse_args()
+
+    source = index_vectors(args.index) if args.index else synthetic_vectors(max(args.sizes), args.dimension)
+    faiss.omp_set_num_threads(1)   # one query per request, as in the app
+
+    print(f"{'vectors':>8} {'type':<5} {'codes':<7} {'params':<58} {'recall@' + str(args.k):>9} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'build s':>8} {'RAM MB':>8} {'file MB':>8}")
+    for size in args.sizes:
+        if size > len(source):
+            print(f"{size:>8} skipped: only {len(source)} vectors available")
+            continue
+        data = np.ascontiguousarray(source[:size])
+        queries = make_queries(data, args.queries)
+        flat = faiss.IndexFlatL2(data.shape[1])
+        flat.add(data)
+        exact, _ = run(flat, queries, args.k)
+
+        for index_type in args.types:
+            for codes in args.quantizations:
+                spec = ann.index_spec(size, index_type, codes)
+                if spec["type"] != index_type:
+                    continue   # binary codes are only scanned flat
+                started = time.perf_counter()
+                index = ann.build_index(flat, spec)
+                build_seconds = time.perf_counter() - started
+                results, latencies = run(index, queries, args.k)
+                params = ", ".join(f"{key}={value}" for key, value in spec.items()
+                                   if key not in ("type", "quantization"))
+                file_mb = len(faiss.serialize_index(index)) / (1024 * 1024)
+                print(f"{size:>8} {index_type:<5} {codes:<7} {params or '-':<58} "
+                      f"{recall_at_k(results, exact):>9.3f} "
+                      f"{np.percentile(latencies, 50):>8.3f} {np.percentile(latencies, 99):>8.3f} "
+                      f"{build_seconds:>8.2f} {resident_mb(index):>8.1f} {file_mb:>8.1f}")
+
+    print()
+    print(f"With INDEX_TYPE = 'auto': flat below {ann.INDEX_HNSW_MIN_VECTORS} vectors, "
+          f"HNSW below {ann.INDEX_IVF_MIN_VECTORS}, IVF above.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Benchmark every stage of answering a question, offline, on corpora of growing size.
+
+The real ingestion and serving path is used: ``load_vector_store`` builds or
+loads the FAISS index, questions are embedded by the configured model and
+searched with the hybrid retriever, but answers come from the local
+``FakeChatModel`` with a configurable time to first token and token rate, so
+no API key or network is needed and generation time is controlled.
+
+For each corpus size the script reports p50/p95/p99 of:
+
+- cold start: a fresh process loading the index and answering one question
+  (split into import, index load and first answer)
+- query embedding, search, reranking, prompt assembly (context packing and
+  prompt formatting), generation (time to first token and total) and output
+  parsing, timed one stage at a time
+- end to end: the same questions through ``build_retrieval_chain()``, with
+  the answer caches left empty
+
+The demo knowledge base is repeated, with renumbered sections and every line
+made unique, until it splits into the requested number of chunks. Indexes,
+scaled knowledge bases and the embedding cache are kept in --workdir, so a
+second run only measures loading. Results are written as JSON to compare runs.
+
+Usage:
+    python scripts/bench_pipeline.py
+    python scripts/bench_pipeline.py --chunks 0 10000 100000 --queries 200 --llm-latency 0.4
+    python scripts/bench_pipeline.py --fake-embeddings --no-rerank --output before.json
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+# Add parent directory to path
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+import numpy as np
+
+from config.settings import EMBED_MODEL, KNOWLEDGE_PATH
+
+DEFAULT_WORKDIR = os.path.join("vector_store", "bench")
+
+# About the length of a typical answer from the chatbot
+RESPONSE = (
+    "Clickatell offers three ways to get started:\n"
+    "1. **One API** sends SMS and WhatsApp messages from a single RESTful endpoint.\n"
+    "2. **Chat 2 Pay** lets customers pay through secure links inside the chat.\n"
+    "3. **Chat Desk** gives live agents one inbox for every channel.\n"
+    "Let me know if you would like details on pricing or how to sign up."
+)
+
+STAGES = ("cold_start", "cold_start_import", "cold_start_index_load", "cold_start_first_answer",
+          "query_embedding", "search", "bm25", "rerank", "prompt_assembly", "generation_first_token",
+          "generation", "parsing", "end_to_end")
+
+_SECTION = re.compile(r"^Section\s+(\d+):")
+_RULE = re.compile(r"^\s*(-{3,}|~{3,}|={3,})\s*$")
+
+
+def scale_knowledge_base(target_chunks, base_chunks, workdir):
+    """Path of a knowledge base that splits into about ``target_chunks`` chunks (0 = the demo file)"""
+    copies = math.ceil(target_chunks / base_chunks)
+    if copies <= 1:
+        return KNOWLEDGE_PATH
+    with open(KNOWLEDGE_PATH, encoding="utf-8") as knowledge_file:
+        lines = knowledge_file.read().splitlines()
+    first_section = next(i for i, line in enumerate(lines) if _SECTION.match(line))
+    preamble, body = lines[:first_section], lines[first_section:]
+    sections = max(int(_SECTION.match(line).group(1)) for line in body if _SECTION.match(line))
+
+    path = os.path.join(workdir, f"knowledge_{target_chunks}.txt")
+    with open(path, "w", encoding="utf-8") as scaled_file:
+        scaled_file.write("\n".join(preamble + body) + "\n")
+        for copy in range(1, copies):
+            out = []
+            for line in body:
+                heading = _SECTION.match(line)
+                if heading:
+                    line = f"Section {int(heading.group(1)) + copy * sections}:{line[heading.end():]} (edition {copy})"
+                elif line.strip() and line.strip() != "---" and not _RULE.match(line):
+                    # Every chunk must differ, or the copies would share vectors and cache entries
+                    line = f"{line} [edition {copy}]"
+                out.append(line)
+            scaled_file.write("\n" + "\n".join(out) + "\n")
+    return path
+
+
+def make_embeddings(options):
+    if options["fake_embeddings"]:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        return DeterministicFakeEmbedding(size=options["dimension"])
+    from legacy.embeddings import build_embeddings
+    return build_embeddings(cache_path=options["embedding_cache"])
+
+
+def make_llm(options):
+    from legacy.fake_llm import FakeChatModel
+    return FakeChatModel(response=RESPONSE, latency=options["llm_latency"],
+                         tokens_per_second=options["llm_tokens_per_second"])
+
+
+def make_chain(store, options, answers_path, retriever=None, reranker=None, context_packer=None, llm=None):
+    from legacy.answer_cache import ExactAnswerCache, SemanticAnswerCache
+    from legacy.retrieval_chain import build_retrieval_chain
+    from legacy.session_store import SessionStore
+
+    return build_retrieval_chain(
+        vector_store=store,
+        llm=llm or make_llm(options),
+        # A semantic cache that keeps nothing: every question is answered
+        answer_cache=SemanticAnswerCache(max_entries=0),
+        exact_cache=ExactAnswerCache(answers_path),
+        sessions=SessionStore(),
+        retriever=retriever,
+        # False keeps the chain from creating its own reranker
+        reranker=reranker or make_reranker(options) or False,
+        context_packer=context_packer,
+    )
+
+
+def make_reranker(options):
+    if not options["rerank"]:
+        return None
+    from legacy.rerank import CrossEncoderReranker
+    return CrossEncoderReranker()
+
+
+def cold_start(options, question, answers_path, results):
+    """Runs in a fresh process: load the index and answer one question"""
+    started = time.perf_counter()
+    from legacy.retrieval_chain import load_vector_store
+    imported = time.perf_counter()
+    store = load_vector_store(options["index_path"], options["knowledge_path"], make_embeddings(options))
+    loaded = time.perf_counter()
+    chain = make_chain(store, options, answers_path)
+    chain.invoke({"input": question}, config={"configurable": {"session_id": "cold-start"}})
+    answered = time.perf_counter()
+    results.put({
+        "cold_start_import": imported - started,
+        "cold_start_index_load": loaded - imported,
+        "cold_start_first_answer": answered - loaded,
+    })
+
+
+def make_questions(store, count, seed=0):
+    """Questions about random chunks of the corpus, each one different so no cache can answer it"""
+    rng = np.random.default_rng(seed)
+    questions = []
+    for i, position in enumerate(rng.integers(0, store.index.ntotal, count)):
+        document = store.docstore.search(store.index_to_docstore_id[int(position)])
+        lines = [line.strip(" -*#") for line in document.page_content.splitlines()
+                 if line.strip() and not _RULE.match(line)]
+        topic = lines[int(rng.integers(0, len(lines)))][:80] if lines else "Clickatell"
+        questions.append(f"What does the knowledge base say about {topic}? ({i})")
+    return questions
+
+
+def summary(seconds):
+    if not seconds:
+        return None
+    milliseconds = np.asarray(seconds) * 1000
+    return {
+        "count": len(milliseconds),
+        "mean_ms": round(float(np.mean(milliseconds)), 3),
+        "p50_ms": round(float(np.percentile(milliseconds, 50)), 3),
+        "p95_ms": round(float(np.percentile(milliseconds, 95)), 3),
+        "p99_ms": round(float(np.percentile(milliseconds, 99)), 3),
+    }
+
+
+def run_stages(store, options, questions, answers_path):
+    from langchain_core.output_parsers import StrOutputParser
+
+    from legacy.confidence import HANDOVER_MESSAGE
+    from legacy.context import ContextPacker
+    from legacy.retrieval import HybridRetriever
+    from legacy.retrieval_chain import build_prompt
+
+    embeddings = store.embeddings
+    retriever = HybridRetriever(store)
+    reranker = make_reranker(options)
+    context_packer = ContextPacker()
+    prompt = build_prompt()
+    llm = make_llm(options)
+    parser = StrOutputParser()
+    timings = {stage: [] for stage in STAGES}
+
+    # Load the model and build BM25 before timing; both are part of the cold start
+    warm_up = questions[0] + " (warm up)"
+    retriever.search(warm_up, embeddings.embed_query(warm_up))
+
+    for question in questions:
+        started = time.perf_counter()
+        query_vector = embeddings.embed_query(question)
+        embedded = time.perf_counter()
+        results = retriever.search(question, query_vector, k=None if reranker is None else reranker.candidates)
+        searched = time.perf_counter()
+        hits = results if reranker is None else reranker.rerank(question, results)
+        reranked = time.perf_counter()
+        context = context_packer.pack(hits)
+        prompt_value = prompt.invoke({"input": question, "chat_history": [], "context": context})
+        assembled = time.perf_counter()
+        chunks = []
+        first_token = None
+        for chunk in llm.stream(prompt_value):
+            if first_token is None:
+                first_token = time.perf_counter()
+            chunks.append(chunk)
+        generated = time.perf_counter()
+        "".join(parser.invoke(chunk) for chunk in chunks)
+        parsed = time.perf_counter()
+
+        timings["query_embedding"].append(embedded - started)
+        timings["search"].append(searched - embedded)
+        if reranker is not None:
+            timings["rerank"].append(reranked - searched)
+        timings["prompt_assembly"].append(assembled - reranked)
+        timings["generation_first_token"].append(first_token - assembled)
+        timings["generation"].append(generated - assembled)
+        timings["parsing"].append(parsed - generated)
+        if retriever.mode == "hybrid":
+            # BM25 on its own, the sparse half of the search stage
+            sparse_started = time.perf_counter()
+            retriever.bm25.search(question, retriever.fetch_k)
+            timings["bm25"].append(time.perf_counter() - sparse_started)
+
+    chain = make_chain(store, options, answers_path, retriever=retriever, reranker=reranker,
+                       context_packer=context_packer, llm=llm)
+    handovers = 0
+    for i, question in enumerate(questions):
+        question = question.replace("What does the knowledge base say about", "Tell me about", 1)
+        started = time.perf_counter()
+        answer = chain.invoke({"input": question}, config={"configurable": {"session_id": f"bench-{i}"}})
+        timings["end_to_end"].append(time.perf_counter() - started)
+        handovers += answer == HANDOVER_MESSAGE
+    return timings, handovers
+
+
+def run_cold_starts(options, question, count, tmp_dir):
+    context = multiprocessing.get_context("spawn")
+    timings = {stage: [] for stage in STAGES if stage.startswith("cold_start")}
+    for i in range(count):
+        results = context.Queue()
+        started = time.perf_counter()
+        process = context.Process(target=cold_start,
+                                  args=(options, question, os.path.join(tmp_dir, f"cold_{i}.sqlite3"), results))
+        process.start()
+        process.join()
+        elapsed = time.perf_counter() - started
+        if process.exitcode != 0 or results.empty():
+            print(f"  cold start {i + 1}: failed (exit code {process.exitcode})")
+            continue
+        timings["cold_start"].append(elapsed)
+        for stage, seconds in results.get().items():
+            timings[stage].append(seconds)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the answer pipeline stage by stage with a fake LLM")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[0, 1000, 10000, 100000],
+                        help="Corpus sizes in chunks; 0 = the demo knowledge base as it is")
+    parser.add_argument("--queries", type=int, default=100, help="Questions timed per corpus size")
+    parser.add_argument("--cold-starts", type=int, default=3, help="Fresh processes started per corpus size")
+    parser.add_argument("--llm-latency", type=float, default=0.1, help="Fake LLM time to first token (seconds)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200.0,
+                        help="Fake LLM token rate; 0 returns all tokens at once")
+    parser.add_argument("--fake-embeddings", action="store_true",
+                        help="Hash-based vectors instead of the embedding model (no model download)")
+    parser.add_argument("--dimension", type=int, default=384, help="Vector size with --fake-embeddings")
+    parser.add_argument("--no-rerank", action="store_true", help="Skip the cross-encoder reranker")
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR, help="Where indexes and scaled corpora are kept")
+    parser.add_argument("--rebuild", action="store_true", help="Delete the indexes in --workdir first")
+    parser.add_argument("--output", help="JSON results file (default: <workdir>/pipeline.json)")
+    args = parser.parse_args()
+
+    from legacy.indexing import read_manifest, split_knowledge_base
+    from legacy.retrieval_chain import load_vector_store
+
+    os.makedirs(args.workdir, exist_ok=True)
+    base_chunks = len(split_knowledge_base())
+    embedding_name = f"fake-{args.dimension}" if args.fake_embeddings else EMBED_MODEL
+    settings = {
+        "embeddings": embedding_name,
+        "rerank": not args.no_rerank,
+        "llm_latency": args.llm_latency,
+        "llm_tokens_per_second": args.llm_tokens_per_second,
+        "queries": args.queries,
+        "cold_starts": args.cold_starts,
+    }
+    runs = []
+
+    print(f"{'chunks':>8} {'stage':<24} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for target in args.chunks:
+            knowledge_path = scale_knowledge_base(target, base_chunks, args.workdir)
+            index_path = os.path.join(args.workdir, f"index_{'fake_' if args.fake_embeddings else ''}{target}")
+            if args.rebuild:
+                shutil.rmtree(index_path, ignore_errors=True)
+            options = {
+                "index_path": index_path,
+                "knowledge_path": knowledge_path,
+                "fake_embeddings": args.fake_embeddings,
+                "dimension": args.dimension,
+                "embedding_cache": os.path.join(args.workdir, "embedding_cache.bin"),
+                "llm_latency": args.llm_latency,
+                "llm_tokens_per_second": args.llm_tokens_per_second,
+                "rerank": not args.no_rerank,
+            }
+
+            built = read_manifest(index_path) is None
+            started = time.perf_counter()
+            store = load_vector_store(index_path, knowledge_path, make_embeddings(options))
+            index_seconds = time.perf_counter() - started
+
+            questions = make_questions(store, args.queries)
+            timings, handovers = run_stages(store, options, questions, os.path.join(tmp_dir, f"answers_{target}.sqlite3"))
+            timings.update(run_cold_starts(options, questions[0], args.cold_starts, tmp_dir))
+
+            stages = {stage: summary(timings[stage]) for stage in STAGES if timings[stage]}
+            runs.append({
+                "target_chunks": target,
+                "chunks": store.index.ntotal,
+                "knowledge_mb": round(os.path.getsize(knowledge_path) / (1024 * 1024), 2),
+                "index": (read_manifest(index_path) or {}).get("index"),
+                "index_built": built,
+                "index_seconds": round(index_seconds, 2),
+                "handovers": handovers,
+                "stages": stages,
+            })
+            for stage, result in stages.items():
+                print(f"{store.index.ntotal:>8} {stage:<24} {result['p50_ms']:>9.3f} "
+                      f"{result['p95_ms']:>9.3f} {result['p99_ms']:>9.3f}")
+            print(f"{store.index.ntotal:>8} index {'built' if built else 'loaded'} in {index_seconds:.2f}s "
+                  f"({runs[-1]['index']}), {handovers} handovers")
+
+    output = args.output or os.path.join(args.workdir, "pipeline.json")
+    with open(output, "w", encoding="utf-8") as json_file:
+        json.dump({"settings": settings, "runs": runs}, json_file, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
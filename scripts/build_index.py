@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Build or update the FAISS index for the knowledge base.
+
+Chunks are embedded in batches, optionally across a pool of worker processes.
+Only new or changed chunks are embedded. With --checkpoint-every the partial
+index is saved while building, so an interrupted run resumes where it stopped
+when the command is run again.
+
+Indexes pickled by older versions (index.faiss + index.pkl) are ignored by the
+app, which rebuilds them. --migrate-pickle converts one instead, keeping its
+vectors; it unpickles the file, so only use it on an index you built yourself.
+
+Usage:
+    python scripts/build_index.py --workers 4 --batch-size 128 --checkpoint-every 10
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+# Add parent directory to path
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+from config.settings import KNOWLEDGE_PATH, INDEX_PATH, EMBED_MODEL, EMBED_BATCH_SIZE
+from legacy.embeddings import build_embeddings
+from legacy.indexing import split_knowledge_base, sync_index
+from legacy.mmap_store import legacy_store_exists, migrate_legacy_store, store_exists
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the knowledge base FAISS index")
+    parser.add_argument("--source", default=KNOWLEDGE_PATH, help="Knowledge base text file")
+    parser.add_argument("--index", default=INDEX_PATH, help="Index directory")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE,
+                        help="Chunks per embedding call")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Embedding worker processes (1 embeds in this process)")
+    parser.add_argument("--checkpoint-every", type=int, default=10,
+                        help="Save the partial index every N batches (0 disables resume)")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Ignore the existing index and embed everything again")
+    parser.add_argument("--migrate-pickle", action="store_true",
+                        help="Convert a pickled index written by older versions (trusted files only)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logging.getLogger("faiss.loader").setLevel(logging.WARNING)
+
+    if args.migrate_pickle:
+        if legacy_store_exists(args.index) and not store_exists(args.index):
+            migrate_legacy_store(args.index, build_embeddings())
+        else:
+            print(f"No pickled index to convert in {args.index}")
+
+    print(f"Splitting {args.source}...")
+    chunks = split_knowledge_base(args.source)
+    print(f"{len(chunks)} chunks, embedding with {EMBED_MODEL} "
+          f"(batch size {args.batch_size}, {args.workers} worker(s))")
+
+    try:
+        result = sync_index(
+            args.index,
+            build_embeddings(),
+            chunks,
+            source_path=args.source,
+            rebuild=args.rebuild,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            checkpoint_every=args.checkpoint_every,
+            progress=True,
+        )
+    except KeyboardInterrupt:
+        print("\nInterrupted. Run the command again to resume from the last checkpoint.")
+        sys.exit(1)
+
+    throughput = result.embedded / result.seconds if result.seconds > 0 else 0.0
+    print("=" * 50)
+    print(f"Embedded:   {result.embedded} chunks")
+    print(f"Removed:    {result.removed} chunks")
+    print(f"Unchanged:  {result.unchanged} chunks")
+    print(f"Time:       {result.seconds:.2f}s ({throughput:.1f} chunks/s)")
+    print(f"Index:      {args.index} ({result.store.index.ntotal} vectors)")
+
+
+if __name__ == "__main__":
+    main()
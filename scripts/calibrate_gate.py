@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Calibrate the confidence gate thresholds on a labelled question set.
+
+Each line of the question file is JSON with a ``question`` and whether the
+knowledge base can answer it (``answerable``). The script retrieves every
+question, prints its top similarity and margin, and suggests the
+CONFIDENCE_MIN_TOP_SCORE / CONFIDENCE_MIN_MARGIN values for config/settings.py.
+The gate ships disabled; enable it once the thresholds come from this script.
+
+Usage:
+    python scripts/calibrate_gate.py
+    python scripts/calibrate_gate.py --questions data/eval/gate_questions.jsonl --min-recall 0.95
+"""
+
+import argparse
+import json
+import os
+import sys
+
+# Add parent directory to path
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+from config.settings import CONFIDENCE_MIN_MARGIN, CONFIDENCE_MIN_TOP_SCORE
+
+DEFAULT_QUESTIONS = os.path.join("data", "eval", "gate_questions.jsonl")
+
+
+def load_questions(path):
+    with open(path, encoding="utf-8") as questions_file:
+        return [json.loads(line) for line in questions_file if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the retrieval confidence gate")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="Labelled questions (JSON lines)")
+    parser.add_argument("--min-recall", type=float, default=0.95,
+                        help="Share of answerable questions that must still reach the LLM")
+    args = parser.parse_args()
+
+    from legacy.confidence import calibrate, retrieval_scores
+    from legacy.retrieval import HybridRetriever
+    from legacy.retrieval_chain import load_vector_store
+
+    store = load_vector_store()
+    retriever = HybridRetriever(store)
+    samples = []
+    print(f"{'top':>6} {'margin':>7}  label        question")
+    for item in load_questions(args.questions):
+        results = retriever.search(item["question"], store.embeddings.embed_query(item["question"]))
+        top, margin = retrieval_scores(results.dense_scores)
+        samples.append((top, margin, item["answerable"]))
+        label = "answerable" if item["answerable"] else "handover"
+        print(f"{top:6.3f} {margin:7.3f}  {label:<11}  {item['question']}")
+
+    min_top, min_margin, accuracy, recall = calibrate(samples, args.min_recall)
+    print()
+    print(f"Current:   CONFIDENCE_MIN_TOP_SCORE = {CONFIDENCE_MIN_TOP_SCORE}, "
+          f"CONFIDENCE_MIN_MARGIN = {CONFIDENCE_MIN_MARGIN}")
+    if accuracy is None:
+        print("No thresholds reach the requested recall")
+        return
+    print(f"Suggested: CONFIDENCE_MIN_TOP_SCORE = {min_top:.3f}, CONFIDENCE_MIN_MARGIN = {min_margin:.3f}")
+    print(f"           accuracy {accuracy:.0%}, answerable questions passed {recall:.0%}")
+    print("Put these values in config/settings.py, with the accuracy and recall, and set CONFIDENCE_GATE_ENABLED = True")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Compare dense and hybrid retrieval on a labelled question set.
+
+Each line of the question file is JSON with a ``question`` and the
+``expected`` phrases; a retrieved chunk is relevant if it contains one of
+them. Reports precision@k, hit rate@k and mean per-query latency.
+
+Usage:
+    python scripts/eval_retrieval.py
+    python scripts/eval_retrieval.py --questions data/eval/retrieval_questions.jsonl --k 3
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# Add parent directory to path
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+from config.settings import RETRIEVAL_K
+
+DEFAULT_QUESTIONS = os.path.join("data", "eval", "retrieval_questions.jsonl")
+
+
+def load_questions(path):
+    with open(path, encoding="utf-8") as questions_file:
+        return [json.loads(line) for line in questions_file if line.strip()]
+
+
+def is_relevant(document, expected):
+    return any(phrase.lower() in document.page_content.lower() for phrase in expected)
+
+
+def evaluate(retriever, embeddings, questions, k):
+    relevant = hits = 0
+    elapsed = 0.0
+    for item in questions:
+        query_vector = embeddings.embed_query(item["question"])
+        started = time.perf_counter()
+        results = retriever.search(item["question"], query_vector, k=k)
+        elapsed += time.perf_counter() - started
+        matches = sum(is_relevant(hit.document, item["expected"]) for hit in results)
+        relevant += matches
+        hits += matches > 0
+    count = len(questions)
+    return {
+        "precision": relevant / (count * k),
+        "hit_rate": hits / count,
+        "latency_ms": elapsed * 1000 / count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="Labelled questions (JSON lines)")
+    parser.add_argument("--k", type=int, default=RETRIEVAL_K, help="Chunks retrieved per question")
+    args = parser.parse_args()
+
+    from legacy.retrieval import HybridRetriever
+    from legacy.retrieval_chain import load_vector_store
+
+    questions = load_questions(args.questions)
+    store = load_vector_store()
+
+    print(f"{len(questions)} questions, k={args.k}")
+    for mode in ("dense", "hybrid"):
+        retriever = HybridRetriever(store, k=args.k, mode=mode)
+        result = evaluate(retriever, store.embeddings, questions, args.k)
+        print(f"  {mode:<7} precision@{args.k} {result['precision']:.2f}   "
+              f"hit@{args.k} {result['hit_rate']:.2f}   {result['latency_ms']:.2f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
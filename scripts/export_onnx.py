@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Export the embedding model to ONNX (float32 and int8) and check it against torch.
+
+The knowledge base chunks and a few questions are embedded with both
+backends; the script prints the lowest cosine similarity per export and fails
+if it is below the tolerance documented in legacy/onnx_embeddings.py. The
+index is re-embedded with the new backend on the next start, since the
+backend is part of its settings.
+
+Requires torch, onnx and onnxruntime. Afterwards set EMBED_BACKEND = "onnx"
+in config/settings.py.
+
+Usage:
+    python scripts/export_onnx.py
+    python scripts/export_onnx.py --output vector_store/onnx_model --no-quantize
+"""
+
+import argparse
+import os
+import sys
+
+# Add parent directory to path
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+import numpy as np
+
+from config.settings import EMBED_MODEL, EMBED_ONNX_PATH
+
+# Lowest acceptable cosine similarity to the torch vectors
+TOLERANCE = {False: 0.999, True: 0.99}
+
+QUESTIONS = [
+    "What is Clickatell?",
+    "How do I send an SMS with One API?",
+    "Which plan includes Chat 2 Pay?",
+    "Is support available 24/7?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX")
+    parser.add_argument("--model", default=EMBED_MODEL)
+    parser.add_argument("--output", default=EMBED_ONNX_PATH)
+    parser.add_argument("--no-quantize", action="store_true", help="Skip the int8 export")
+    args = parser.parse_args()
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+    from legacy.indexing import split_knowledge_base
+    from legacy.onnx_embeddings import OnnxEmbeddings, export_onnx
+
+    for path in export_onnx(args.model, args.output, quantize=not args.no_quantize):
+        print(f"Wrote {path} ({os.path.getsize(path) / (1024 * 1024):.1f} MB)")
+
+    texts = [chunk.page_content for chunk in split_knowledge_base()] + QUESTIONS
+    reference = np.array(HuggingFaceEmbeddings(model_name=args.model).embed_documents(texts))
+    failed = False
+    for quantized in ([False] if args.no_quantize else [False, True]):
+        vectors = np.array(OnnxEmbeddings(args.model, args.output, quantized=quantized).embed_documents(texts))
+        cosine = (vectors * reference).sum(axis=1) / (
+            np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1))
+        label = "int8" if quantized else "float32"
+        ok = cosine.min() >= TOLERANCE[quantized]
+        failed = failed or not ok
+        print(f"{label:<8} cosine to torch: min {cosine.min():.5f}, mean {cosine.mean():.5f} "
+              f"(tolerance {TOLERANCE[quantized]}) {'OK' if ok else 'TOO FAR'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Pre-populate the answer caches from a list of questions.
+
+Each question is asked once in a fresh session, so the answer is stored in the
+persistent exact-match cache for the current knowledge base version.
+
+Usage:
+    python scripts/warm_cache.py                      # sidebar quick questions
+    python scripts/warm_cache.py questions.txt        # one question per line
+"""
+
+import os
+import sys
+import time
+import uuid
+
+# Add parent directory to path
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+# Quick questions offered in the Streamlit sidebar
+DEFAULT_QUESTIONS = [
+    "What is Clickatell's mission?",
+    "How do I authenticate API requests?",
+    "What services are in Chat Commerce Platform?",
+    "Who is the CEO of Clickatell?",
+    "What does the Interact plan include?",
+]
+
+
+def load_questions(path):
+    with open(path, encoding="utf-8") as questions_file:
+        return [line.strip() for line in questions_file if line.strip() and not line.startswith("#")]
+
+
+def main():
+    questions = load_questions(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_QUESTIONS
+
+    from legacy.engine import get_engine
+    engine = get_engine()
+
+    print(f"Warming answer cache with {len(questions)} questions...")
+    for question in questions:
+        started = time.perf_counter()
+        try:
+            engine.chain.invoke(
+                {"input": question},
+                config={"configurable": {"session_id": f"warmup-{uuid.uuid4().hex}"}}
+            )
+            print(f"  {time.perf_counter() - started:6.2f}s  {question}")
+        except Exception as e:
+            print(f"  failed   {question}: {e}")
+
+    if engine.exact_cache is not None:
+        print(f"Cached answers: {engine.exact_cache.stats()['entries']}")
+
+
+if __name__ == "__main__":
+    main()
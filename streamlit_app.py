@@ -1,6 +1,8 @@
 import streamlit as st
-from legacy.retrieval_chain import build_retrieval_chain
+from legacy.engine import get_engine
+from legacy.streaming import AnswerStream
 from datetime import datetime
+import uuid
 import plotly.graph_objects as go
 import plotly.express as px
 
@@ -114,9 +116,10 @@ def initialize_session_state():
         st.session_state.messages = []
     if 'qa_chain' not in st.session_state:
         with st.spinner("🚀 Initializing Clickatell AI Assistant..."):
-            st.session_state.qa_chain = build_retrieval_chain()
+            # The engine is shared by every session; only the chain reference is stored here
+            st.session_state.qa_chain = get_engine().chain
     if 'session_id' not in st.session_state:
-        st.session_state.session_id = "user-session"
+        st.session_state.session_id = f"user-{uuid.uuid4().hex}"
     if 'total_queries' not in st.session_state:
         st.session_state.total_queries = 0
     if 'processing' not in st.session_state:
@@ -131,7 +134,26 @@ def display_header():
     </div>
     """, unsafe_allow_html=True)
 
-def process_user_input(user_input):
+FALLBACK_KEYWORDS = ["I'm not confident I can assist with that"]
+
+def stream_response(user_input, placeholder):
+    """Render the answer token by token in a chat bubble and return the full text"""
+    answer = AnswerStream(st.session_state.qa_chain, user_input, st.session_state.session_id, FALLBACK_KEYWORDS)
+    shown = ""
+    for text in answer:
+        shown += text
+        placeholder.markdown(f"""
+        <div class="user-message">
+            <strong>You:</strong> {user_input}
+        </div>
+        <div class="bot-message">
+            <strong>🤖 Clickatell Assistant:</strong><br>
+            {shown}▌
+        </div>
+        """, unsafe_allow_html=True)
+    return answer.text
+
+def process_user_input(user_input, placeholder=None):
     """Process user input and generate response"""
     if st.session_state.processing:
         return
@@ -141,10 +163,13 @@ def process_user_input(user_input):
     st.session_state.total_queries += 1
     
     try:
-        response = st.session_state.qa_chain.invoke(
-            {"input": user_input},
-            config={"configurable": {"session_id": st.session_state.session_id}}
-        )
+        if placeholder is not None:
+            response = stream_response(user_input, placeholder)
+        else:
+            response = st.session_state.qa_chain.invoke(
+                {"input": user_input},
+                config={"configurable": {"session_id": st.session_state.session_id}}
+            )
         
         if "I'm not confident I can assist with that" in response:
             response = "🤝 I'm not confident I can assist with that. Let me connect you to a live agent for better support."
@@ -158,7 +183,7 @@ def process_user_input(user_input):
     finally:
         st.session_state.processing = False
 
-def display_sidebar():
+def display_sidebar(stream_placeholder=None):
     """Display the modern sidebar"""
     with st.sidebar:
         st.markdown("### 🎯 Quick Actions")
@@ -174,7 +199,7 @@ def display_sidebar():
         st.markdown("**💡 Try these questions:**")
         for i, query in enumerate(quick_queries):
             if st.button(query, key=f"quick_{i}"):
-                process_user_input(query)
+                process_user_input(query, stream_placeholder)
                 st.rerun()
         
         st.divider()
@@ -186,9 +211,21 @@ def display_sidebar():
         with col2:
             st.metric("Messages", len(st.session_state.messages))
         
+        engine_stats = get_engine().stats()
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("RAG Engines", engine_stats["engines"])
+        with col2:
+            st.metric("Engine Memory", f"{engine_stats['engine_memory_mb']} MB")
+        if engine_stats["cold_start_seconds"] is not None:
+            st.metric("Cold Start to First Answer", f"{engine_stats['cold_start_seconds']} s")
+        
         if st.button("🗑️ Clear Chat", type="secondary"):
             st.session_state.messages = []
             st.session_state.total_queries = 0
+            # Free the old conversation's history now instead of waiting for it to expire
+            get_engine().sessions.discard(st.session_state.session_id)
+            st.session_state.session_id = f"user-{uuid.uuid4().hex}"
             st.rerun()
 
 def main():
@@ -217,6 +254,9 @@ def main():
                     </div>
                     """, unsafe_allow_html=True)
         
+        # Answers stream into this slot until the page reruns
+        stream_placeholder = st.empty()
+        
         # Show processing indicator
         if st.session_state.processing:
             with st.spinner("🤔 Thinking..."):
@@ -240,11 +280,11 @@ def main():
             )
             
             if submitted and user_input.strip() and not st.session_state.processing:
-                process_user_input(user_input.strip())
+                process_user_input(user_input.strip(), stream_placeholder)
                 st.rerun()
     
     with col2:
-        display_sidebar()
+        display_sidebar(stream_placeholder)
     
     st.markdown("---")
     st.markdown("""
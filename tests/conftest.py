@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Shared fixtures: retrieval chains over small in-memory indexes.
+
+Every component the chain would otherwise take from the process-wide
+defaults (answer caches, session store, memory, gate, coalescing, tracing
+metrics) is created per chain, and reranking is off, so tests do not share
+state or download models.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from legacy.answer_cache import ExactAnswerCache, SemanticAnswerCache
+from legacy.confidence import ConfidenceGate
+from legacy.memory import ConversationMemory
+from legacy.metrics import Registry
+from legacy.retrieval_chain import build_retrieval_chain
+from legacy.session_store import SessionStore
+from legacy.singleflight import SingleFlight
+from legacy.tracing import Tracer
+
+DEFAULT_TEXTS = ("Clickatell's mission is chat commerce.",)
+
+
+@pytest.fixture
+def make_store():
+    """Factory for a FAISS store over ``texts``"""
+    def make(texts=DEFAULT_TEXTS, embeddings=None):
+        embeddings = embeddings or DeterministicFakeEmbedding(size=16)
+        return FAISS.from_documents([Document(page_content=text) for text in texts], embeddings)
+    return make
+
+
+@pytest.fixture
+def make_chain(tmp_path, make_store):
+    """Factory for a chain with isolated components; keyword arguments replace any of them"""
+    def make(llm, vector_store=None, texts=DEFAULT_TEXTS, **components):
+        options = {
+            "vector_store": vector_store or make_store(texts),
+            "llm": llm,
+            "reranker": False,
+            "answer_cache": SemanticAnswerCache(),
+            "exact_cache": ExactAnswerCache(str(tmp_path / "answers.sqlite3")),
+            "sessions": SessionStore(),
+            "memory": ConversationMemory(llm),
+            "gate": ConfidenceGate(),
+            "singleflight": SingleFlight(),
+            "tracer": Tracer(Registry()),
+        }
+        options.update(components)
+        return build_retrieval_chain(**options)
+    return make
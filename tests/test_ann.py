@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tests for FAISS index type selection and construction
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+
+from legacy import ann
+
+
+def make_flat(size=2000, dimension=16):
+    data = np.random.default_rng(0).standard_normal((size, dimension)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    index = faiss.IndexFlatL2(dimension)
+    index.add(data)
+    return index, data
+
+
+def test_auto_type_follows_corpus_size():
+    assert ann.index_spec(100, "auto")["type"] == "flat"
+    assert ann.index_spec(ann.INDEX_HNSW_MIN_VECTORS, "auto")["type"] == "hnsw"
+    assert ann.index_spec(ann.INDEX_IVF_MIN_VECTORS, "auto")["type"] == "ivf"
+
+
+def test_ivf_clusters_fit_the_training_data():
+    spec = ann.index_spec(1000, "ivf")
+
+    assert spec["nlist"] * 39 <= 1000
+    assert spec["nprobe"] <= spec["nlist"]
+
+
+def test_built_indexes_keep_vector_order_and_find_neighbours():
+    flat, data = make_flat()
+
+    for index_type in ("hnsw", "ivf"):
+        index = ann.build_index(flat, ann.index_spec(len(data), index_type))
+        assert ann.index_type(index) == index_type
+        _, positions = index.search(data[:20], 1)
+        assert (positions[:, 0] == np.arange(20)).mean() >= 0.9, index_type
+        assert np.allclose(ann.vectors(ann.flat_index(index)), data)
+
+
+def test_search_parameters_apply_a_filter():
+    flat, data = make_flat()
+    index = ann.build_index(flat, ann.index_spec(len(data), "hnsw"))
+    allowed = np.arange(0, len(data), 2, dtype=np.int64)
+
+    _, positions = index.search(data[:1], 5, params=ann.search_parameters(index, faiss.IDSelectorBatch(allowed)))
+
+    assert all(position % 2 == 0 for position in positions[0])
+
+
+def test_quantized_indexes_rescore_to_exact_results():
+    flat, data = make_flat()
+    queries = data[:20] + 0.01
+    _, exact = flat.search(queries, 5)
+
+    for codes in ("fp16", "int8", "binary"):
+        index = ann.build_index(flat, ann.index_spec(len(data), "flat", codes))
+        assert ann.quantization(index) == codes
+        _, positions = index.search(queries, 5)
+        assert (positions[:, 0] == exact[:, 0]).all(), codes
+        assert np.allclose(ann.vectors(index), data), "Full-precision vectors are kept for rescoring"
+
+
+def test_binary_codes_support_filtered_search():
+    flat, data = make_flat()
+    index = ann.build_index(flat, ann.index_spec(len(data), "hnsw", "binary"))
+    allowed = np.arange(1, len(data), 2, dtype=np.int64)
+
+    _, positions = ann.search(index, data[:1], 5, faiss.IDSelectorBatch(allowed))
+
+    assert ann.index_type(index) == "flat", "Binary codes are always scanned in full"
+    assert all(position % 2 == 1 for position in positions[0])
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Tests for the answer caches in front of the LLM
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_community.vectorstores import FAISS
+
+from legacy.answer_cache import ExactAnswerCache, SemanticAnswerCache, normalize_question
+
+
+def test_semantic_cache_matches_close_questions_only():
+    cache = SemanticAnswerCache(max_distance=0.1)
+    cache.store([1.0, 0.0], "Our mission is chat commerce.", "v1")
+
+    assert cache.lookup([0.99, 0.05], "v1") == "Our mission is chat commerce."
+    assert cache.lookup([0.0, 1.0], "v1") is None, "Unrelated question should miss"
+    assert cache.lookup([1.0, 0.0], "v2") is None, "Answers from another KB version are stale"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_semantic_cache_evicts_least_recently_used():
+    cache = SemanticAnswerCache(max_distance=0.01, max_entries=2)
+    cache.store([1.0, 0.0, 0.0], "a", "v1")
+    cache.store([0.0, 1.0, 0.0], "b", "v1")
+    cache.lookup([1.0, 0.0, 0.0], "v1")
+    cache.store([0.0, 0.0, 1.0], "c", "v1")
+
+    assert cache.lookup([1.0, 0.0, 0.0], "v1") == "a"
+    assert cache.lookup([0.0, 1.0, 0.0], "v1") is None
+
+
+def test_semantic_cache_expires_entries():
+    cache = SemanticAnswerCache(max_distance=0.01, ttl_seconds=-1)
+    cache.store([1.0, 0.0], "a", "v1")
+
+    assert cache.lookup([1.0, 0.0], "v1") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_exact_cache_normalizes_and_persists(tmp_path):
+    path = str(tmp_path / "answers.sqlite3")
+    ExactAnswerCache(path).store("What is Clickatell's mission?", "Chat commerce.", "v1")
+
+    # A second instance stands in for another process or a restart
+    cache = ExactAnswerCache(path)
+    assert normalize_question("  WHAT is   Clickatell's mission ") == "what is clickatells mission"
+    assert cache.lookup("what is clickatells mission", "v1") == "Chat commerce."
+    assert cache.lookup("What is Clickatell's mission?", "v2") is None
+
+    assert cache.purge_stale("v2") == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_purge_only_touches_its_own_index(tmp_path):
+    cache = ExactAnswerCache(str(tmp_path / "answers.sqlite3"))
+    cache.store("What is Prepaid?", "Pay as you go.", "a1", index_path="/indexes/a")
+    cache.store("What is One API?", "A REST API.", "b1", index_path="/indexes/b")
+
+    assert cache.purge_stale("a2", index_path="/indexes/a") == 1
+    assert cache.lookup("What is One API?", "b1") == "A REST API."
+
+
+def test_chain_skips_llm_for_repeated_question(tmp_path):
+    from legacy.retrieval_chain import build_retrieval_chain
+
+    embeddings = DeterministicFakeEmbedding(size=16)
+    store = FAISS.from_documents([Document(page_content="Clickatell's mission is chat commerce.")], embeddings)
+    llm = FakeListChatModel(responses=["Chat commerce for everyone.", "second call"])
+    semantic_cache = SemanticAnswerCache()
+    exact_cache = ExactAnswerCache(str(tmp_path / "answers.sqlite3"))
+    chain = build_retrieval_chain(vector_store=store, llm=llm, answer_cache=semantic_cache, exact_cache=exact_cache,
+                                  reranker=False)
+
+    first = chain.invoke({"input": "What is Clickatell's mission?"}, config={"configurable": {"session_id": "a"}})
+    second = chain.invoke({"input": "what is clickatell's mission"}, config={"configurable": {"session_id": "b"}})
+
+    assert first == second == "Chat commerce for everyone."
+    assert exact_cache.stats()["hits"] == 1
+    assert semantic_cache.stats()["misses"] == 1, "Exact hits should not need an embedding lookup"
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Tests for the async ASGI chat API, run against a local fake LLM
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api import create_app
+from legacy.fake_llm import FakeChatModel
+from legacy.metrics import Registry
+from legacy.tracing import Tracer
+
+
+async def request(app, method, path, payload=None):
+    """Drive the ASGI app with an in-memory request and collect the response"""
+    body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app({"type": "http", "method": method, "path": path}, receive, send)
+    status = sent[0]["status"]
+    content = b"".join(message.get("body", b"") for message in sent[1:])
+    return status, content
+
+
+def test_chat_returns_answer_and_keeps_history(make_chain):
+    llm = FakeChatModel(response="Chat commerce for everyone.")
+    app = create_app(make_chain(llm))
+
+    async def run():
+        first = await request(app, "POST", "/chat", {"message": "What is the mission?", "session_id": "s1"})
+        second = await request(app, "POST", "/chat", {"message": "Tell me more", "session_id": "s1"})
+        return first, second
+
+    (status, content), (second_status, _) = asyncio.run(run())
+
+    assert status == second_status == 200
+    payload = json.loads(content)
+    assert payload == {"session_id": "s1", "answer": "Chat commerce for everyone.", "fallback": False}
+    assert llm.calls == 2
+
+
+def test_chat_streams_tokens(make_chain):
+    llm = FakeChatModel(response="Chat commerce for everyone.", tokens_per_second=1000)
+    app = create_app(make_chain(llm))
+
+    status, content = asyncio.run(
+        request(app, "POST", "/chat", {"message": "What is the mission?", "stream": True})
+    )
+
+    lines = [json.loads(line) for line in content.decode("utf-8").splitlines()]
+    assert status == 200
+    assert len(lines) > 2, "Tokens should arrive as separate lines"
+    assert "".join(line.get("token", "") for line in lines) == "Chat commerce for everyone."
+    assert lines[-1]["done"] is True
+
+
+def test_concurrent_requests_overlap_on_llm_wait(make_chain):
+    """Many conversations waiting on the LLM must be served concurrently, not one by one"""
+    llm = FakeChatModel(latency=0.2)
+    app = create_app(make_chain(llm))
+
+    async def run():
+        return await asyncio.gather(*[
+            request(app, "POST", "/chat", {"message": f"Question {n}?", "session_id": f"user-{n}"})
+            for n in range(100)
+        ])
+
+    started = time.perf_counter()
+    responses = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+
+    assert all(status == 200 for status, _ in responses)
+    assert elapsed < 5.0, f"100 requests took {elapsed:.1f}s; they should overlap (20s if serial)"
+
+
+def test_invalid_requests_are_rejected(make_chain):
+    app = create_app(make_chain(FakeChatModel()))
+
+    async def run():
+        return (
+            await request(app, "POST", "/chat", {"session_id": "s1"}),
+            await request(app, "GET", "/chat"),
+            await request(app, "GET", "/missing"),
+            await request(app, "GET", "/health"),
+        )
+
+    missing_message, wrong_method, not_found, health = asyncio.run(run())
+
+    assert missing_message[0] == 400
+    assert wrong_method[0] == 405
+    assert not_found[0] == 404
+    assert health[0] == 200
+
+
+def test_metrics_endpoint_exports_stage_histograms(make_chain):
+    llm = FakeChatModel(response="Chat commerce for everyone.")
+    registry = Registry()
+    app = create_app(make_chain(llm, tracer=Tracer(registry)), registry=registry)
+
+    async def run():
+        await request(app, "POST", "/chat", {"message": "What is the mission?"})
+        return await request(app, "GET", "/metrics")
+
+    status, content = asyncio.run(run())
+
+    text = content.decode("utf-8")
+    assert status == 200
+    assert "# TYPE rag_stage_seconds histogram" in text
+    assert 'rag_stage_seconds_bucket{stage="llm_first_token",le="+Inf"}' in text
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Tests for micro-batching of query embeddings
+"""
+
+import asyncio
+import os
+import pickle
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from legacy.batching import BatchingEmbeddings
+
+
+class SlowEmbeddings(DeterministicFakeEmbedding):
+    """Fake model whose every call costs a fixed time, whatever the batch size"""
+    delay: float = 0.02
+    batch_sizes: list = []
+
+    def embed_documents(self, texts):
+        self.batch_sizes.append(len(texts))
+        time.sleep(self.delay)
+        if "fail" in texts:
+            raise RuntimeError("model error")
+        return super().embed_documents(texts)
+
+
+def test_concurrent_queries_share_model_calls():
+    model = SlowEmbeddings(size=8, batch_sizes=[])
+    batcher = BatchingEmbeddings(model, max_batch_size=8, max_wait_ms=5)
+    texts = [f"question {i}" for i in range(32)]
+    results = {}
+
+    def ask(text):
+        results[text] = batcher.embed_query(text)
+
+    threads = [threading.Thread(target=ask, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(results[text] == model.embed_query(text) for text in texts), "Each caller gets its own vector"
+    assert sum(model.batch_sizes) == 32
+    stats = batcher.stats()
+    assert stats["queries"] == 32
+    assert stats["batches"] < 32 / 2, "Concurrent queries should be embedded together"
+    assert stats["batch_size_max"] <= 8
+
+
+def test_single_query_is_not_delayed():
+    model = SlowEmbeddings(size=8, delay=0.0, batch_sizes=[])
+    batcher = BatchingEmbeddings(model, max_wait_ms=200)
+
+    started = time.perf_counter()
+    batcher.embed_query("alone")
+    batcher.embed_query("alone again")
+
+    assert time.perf_counter() - started < 0.2, "Low traffic should not wait for a batch to fill"
+    assert batcher.stats()["batch_size_avg"] == 1
+
+
+def test_model_errors_reach_every_caller_in_the_batch():
+    batcher = BatchingEmbeddings(SlowEmbeddings(size=8, batch_sizes=[]))
+
+    with pytest.raises(RuntimeError):
+        batcher.embed_query("fail")
+    assert batcher.embed_query("fine") is not None, "The worker keeps running after an error"
+
+
+def test_async_queries_are_batched():
+    model = SlowEmbeddings(size=8, batch_sizes=[])
+    batcher = BatchingEmbeddings(model, max_wait_ms=5)
+
+    async def ask_all():
+        return await asyncio.gather(*(batcher.aembed_query(f"q{i}") for i in range(10)))
+
+    vectors = asyncio.run(ask_all())
+
+    assert vectors == [model.embed_query(f"q{i}") for i in range(10)]
+    assert batcher.stats()["batches"] <= 2
+
+
+def test_batcher_can_be_sent_to_worker_processes():
+    batcher = BatchingEmbeddings(DeterministicFakeEmbedding(size=8), max_batch_size=4)
+    batcher.embed_query("start the worker thread")
+
+    copy = pickle.loads(pickle.dumps(batcher))
+
+    assert copy.max_batch_size == 4
+    assert copy.embed_documents(["a"]) == batcher.embed_documents(["a"])
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for the pre-generation retrieval confidence gate
+"""
+
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from legacy.confidence import HANDOVER_MESSAGE, ConfidenceGate, calibrate
+from legacy.fake_llm import FakeChatModel
+
+
+class UnitFakeEmbedding(Embeddings):
+    """Deterministic random embeddings scaled to unit length, like MiniLM's"""
+
+    def __init__(self, size=32):
+        self.inner = DeterministicFakeEmbedding(size=size)
+
+    def _unit(self, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._unit(vector) for vector in self.inner.embed_documents(texts)]
+
+    def embed_query(self, text):
+        return self._unit(self.inner.embed_query(text))
+
+
+def test_gate_decisions():
+    gate = ConfidenceGate(min_top_score=0.5, min_margin=0.1)
+
+    assert gate.check("q", [0.8, 0.3, 0.2]).answerable
+    assert gate.check("q", [0.4, 0.3]).reason == "low_similarity"
+    assert gate.check("q", [0.6, 0.58, 0.57]).reason == "low_margin"
+    assert gate.check("q", []).reason == "no_candidates"
+    assert gate.stats()["handed_over"] == 3
+
+
+
+def test_gate_logs_user_text_only_at_debug(caplog):
+    gate = ConfidenceGate(min_top_score=0.5, min_margin=0.1)
+
+    with caplog.at_level(logging.INFO, logger="legacy.confidence"):
+        gate.check("my account number is 12345", [0.8, 0.3])
+    assert "top=0.800" in caplog.text
+    assert "12345" not in caplog.text
+
+    with caplog.at_level(logging.DEBUG, logger="legacy.confidence"):
+        gate.check("my account number is 12345", [0.8, 0.3])
+    assert "12345" in caplog.text
+
+def test_gate_ignores_unnormalized_embeddings():
+    gate = ConfidenceGate(min_top_score=0.5)
+
+    decision = gate.check("q", [-12.0, -15.0], query_vector=[3.0, 4.0])
+
+    assert decision.answerable
+    assert decision.reason == "unnormalized"
+
+
+def test_calibration_separates_labelled_questions():
+    samples = [(0.7, 0.3, True), (0.6, 0.2, True), (0.55, 0.25, True),
+               (0.3, 0.05, False), (0.25, 0.02, False), (0.5, 0.01, False)]
+
+    min_top, min_margin, accuracy, recall = calibrate(samples, min_recall=1.0)
+
+    assert accuracy == 1.0 and recall == 1.0
+    for top, margin, label in samples:
+        assert (top >= min_top and margin >= min_margin) == label
+
+
+def test_chain_hands_over_without_calling_llm(make_chain, make_store):
+    store = make_store(("One API sends SMS", "Chat Desk for agents", "Founded in 2000"), UnitFakeEmbedding())
+    llm = FakeChatModel(response="One API is a REST API.")
+    chain = make_chain(llm, vector_store=store, gate=ConfidenceGate(min_top_score=0.5, min_margin=0.1))
+
+    unrelated = chain.invoke({"input": "What is the share price?"}, config={"configurable": {"session_id": "a"}})
+    related = chain.invoke({"input": "One API sends SMS"}, config={"configurable": {"session_id": "b"}})
+
+    assert unrelated == HANDOVER_MESSAGE
+    assert related == "One API is a REST API."
+    assert llm.calls == 1, "The LLM should only be called for the answerable question"
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for context deduplication and token-budgeted packing
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from legacy.context import ContextPacker, overlap_length
+from legacy.memory import count_tokens
+from legacy.retrieval import Hit
+
+
+def hit(text, source="kb.txt", dense_score=0.8):
+    return Hit(Document(page_content=text, metadata={"source": source}), 0, 1.0, dense_score, None)
+
+
+def test_overlap_length():
+    shared = "gamma delta epsilon zeta"
+    assert overlap_length("alpha beta " + shared, shared + " eta theta") == len(shared)
+    assert overlap_length("no shared text here at all", "completely different words") == 0
+
+
+def test_adjacent_chunks_are_stitched_without_repeating_overlap():
+    text = " ".join(f"Sentence number {n} about Clickatell messaging." for n in range(30))
+    first, second = RecursiveCharacterTextSplitter(chunk_size=600, chunk_overlap=80).split_text(text)[:2]
+    packer = ContextPacker(token_budget=10000)
+
+    context = packer.pack([hit(second), hit(first)])
+
+    assert context == text[:len(context)], "Chunks should be joined back into the original text"
+    assert packer.stats()["tokens_saved"] > 0
+
+
+def test_duplicates_and_weak_hits_are_dropped():
+    packer = ContextPacker(token_budget=10000, min_similarity=0.3)
+
+    context = packer.pack([
+        hit("Chat Desk is the live agent interface."),
+        hit("Chat Desk is the live agent interface.", source="copy.txt"),
+        hit("Unrelated text about the weather.", dense_score=0.1),
+    ])
+
+    assert context == "Chat Desk is the live agent interface."
+
+
+def test_budget_is_filled_in_relevance_order():
+    best = "Chat 2 Pay sends payment links. " * 20
+    second = "One API sends SMS and WhatsApp. " * 20
+    third = "Short note."
+    budget = count_tokens(best) + count_tokens(third) + 5
+    packer = ContextPacker(token_budget=budget)
+
+    context = packer.pack([hit(best, source="a"), hit(second, source="b"), hit(third, source="c")])
+
+    assert context.startswith(best.strip())
+    assert "One API" not in context, "A block that does not fit is skipped"
+    assert context.endswith(third)
+    assert count_tokens(context) <= budget
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for the embedding caches
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from legacy.embeddings import CachedEmbeddings, EmbeddingStore
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Fake embeddings that remember how many texts reached the model"""
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls += 1
+        return super().embed_query(text)
+
+
+def test_document_vectors_are_reused_across_instances(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    model = CountingEmbeddings(size=8)
+    first = CachedEmbeddings(model, "model-a", store_path=path)
+    expected = first.embed_documents(["alpha", "beta"])
+
+    # A new instance reads the file written by the first one, as after a restart
+    second = CachedEmbeddings(model, "model-a", store_path=path)
+    vectors = second.embed_documents(["beta", "alpha", "gamma"])
+
+    assert model.calls == 3, "Only 'gamma' should reach the model the second time"
+    # Vectors are stored as float32
+    assert np.allclose(vectors[:2], [expected[1], expected[0]], atol=1e-6)
+    assert second.stats()["document_hits"] == 2
+    assert second.stats()["document_hit_rate"] == round(2 / 3, 3)
+
+
+def test_cache_keys_include_model_name(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    model = CountingEmbeddings(size=8)
+    CachedEmbeddings(model, "model-a", store_path=path).embed_documents(["alpha"])
+    CachedEmbeddings(model, "model-b", store_path=path).embed_documents(["alpha"])
+
+    assert model.calls == 2
+
+
+
+def test_cache_keys_include_backend(tmp_path, monkeypatch):
+    from legacy import embeddings, onnx_embeddings
+
+    path = str(tmp_path / "cache.bin")
+    model = CountingEmbeddings(size=8)
+    for backend in ("torch", "onnx-fp32", "onnx-int8"):
+        CachedEmbeddings(model, "model-a", store_path=path, backend=backend).embed_documents(["alpha"])
+    assert model.calls == 3
+
+    monkeypatch.setattr(onnx_embeddings, "onnx_available", lambda model_name: True)
+    monkeypatch.setattr(embeddings, "EMBED_ONNX_QUANTIZED", False)
+    assert embeddings.embedding_backend("model-a", "onnx") == "onnx-fp32"
+    assert embeddings.embedding_backend("model-a", "torch") == "torch"
+
+def test_truncated_record_is_ignored(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    model = CountingEmbeddings(size=8)
+    CachedEmbeddings(model, "model-a", store_path=path).embed_documents(["alpha", "beta"])
+    with open(path, "ab") as cache_file:
+        cache_file.write(b"partial")
+
+    cache = CachedEmbeddings(model, "model-a", store_path=path)
+    cache.embed_documents(["alpha", "beta"])
+
+    assert cache.stats()["document_hits"] == 2
+
+    # Records appended after the partial one are read back from the right rows
+    expected = cache.embed_documents(["gamma"])
+    reopened = CachedEmbeddings(model, "model-a", store_path=path)
+    assert np.allclose(reopened.embed_documents(["gamma"]), expected, atol=1e-6)
+    assert reopened.stats()["document_hits"] == 1
+
+
+def test_store_is_indexed_lazily_and_shared_between_writers(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    model = CountingEmbeddings(size=8)
+    CachedEmbeddings(model, "model-a", store_path=path).embed_documents(["alpha"])
+
+    # Opening the cache and embedding queries never reads the key index
+    cache = CachedEmbeddings(model, "model-a", store_path=path)
+    cache.embed_query("a question")
+    assert cache.store._rows is None
+    assert len(cache.store) == 1
+
+    # Two writers that both start before the file exists keep each other's records
+    first, second = EmbeddingStore(str(tmp_path / "shared.bin")), EmbeddingStore(str(tmp_path / "shared.bin"))
+    first._load(), second._load()
+    first.put_many([(b"a" * 32, [1.0] * 4)])
+    second.put_many([(b"b" * 32, [2.0] * 4)])
+    reopened = EmbeddingStore(str(tmp_path / "shared.bin"))
+    assert reopened.get(b"a" * 32) == [1.0] * 4
+    assert reopened.get(b"b" * 32) == [2.0] * 4
+
+def test_query_lru_is_bounded(tmp_path):
+    model = CountingEmbeddings(size=8)
+    cache = CachedEmbeddings(model, "model-a", store_path=str(tmp_path / "cache.bin"), query_cache_size=2)
+
+    for text in ["a", "b", "a", "c", "b"]:
+        cache.embed_query(text)
+
+    stats = cache.stats()
+    assert stats["query_hits"] == 1 and stats["query_misses"] == 4
+    assert stats["query_entries"] == 2
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Tests for the process-wide shared RAG engine
+"""
+
+import os
+import sys
+import threading
+from unittest.mock import Mock, patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from legacy import engine
+
+
+def test_engine_built_once_across_threads():
+    """Concurrent sessions must share a single engine"""
+    engine._engine = None
+    engine.RAGEngine.instances = 0
+    chain = Mock()
+
+    with patch.object(engine, "load_vector_store", return_value=Mock(embeddings=Mock(load_bytes=None))) as load_store, \
+            patch.object(engine, "build_llm", return_value=Mock()), \
+            patch.object(engine, "EXACT_CACHE_ENABLED", False), \
+            patch.object(engine, "HISTORY_PERSISTENCE_ENABLED", False), \
+            patch.object(engine, "build_retrieval_chain", return_value=chain):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(engine.get_engine())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len({id(result) for result in results}) == 1, "Sessions should share one engine"
+    assert load_store.call_count == 1, "Vector store should be loaded once"
+    assert results[0].chain is chain.with_listeners.return_value
+    assert results[0].stats()["engines"] == 1
+    engine._engine = None
+
+
+def test_engine_memory_includes_lazily_loaded_model():
+    """The embedding model loads on the first embed, after the engine was measured"""
+    embeddings = Mock(load_bytes=None)
+    with patch.object(engine, "load_vector_store", return_value=Mock(embeddings=embeddings)), \
+            patch.object(engine, "build_llm", return_value=Mock()), \
+            patch.object(engine, "EXACT_CACHE_ENABLED", False), \
+            patch.object(engine, "HISTORY_PERSISTENCE_ENABLED", False), \
+            patch.object(engine, "build_retrieval_chain", return_value=Mock()):
+        rag_engine = engine.RAGEngine()
+    before = rag_engine.stats()
+    assert before["embedding_model_memory_mb"] is None
+
+    embeddings.load_bytes = 90 * 1024 * 1024
+    after = rag_engine.stats()
+    assert after["embedding_model_memory_mb"] == 90.0
+    assert abs(after["engine_memory_mb"] - before["engine_memory_mb"] - 90.0) < 0.2
+
+
+def test_rss_is_reported():
+    """Memory metric should be available on Linux"""
+    assert engine.current_rss_bytes() > 0
+
+
+def test_persisted_index_skips_ingestion(tmp_path):
+    """With an index on disk, startup must not load, split or embed the knowledge base"""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    from legacy import retrieval_chain
+    from legacy.indexing import split_knowledge_base, sync_index
+
+    index_path = str(tmp_path / "faiss_index")
+    sync_index(index_path, DeterministicFakeEmbedding(size=8), split_knowledge_base())
+
+    with patch.object(retrieval_chain, "INDEX_PATH", index_path), \
+            patch.object(retrieval_chain, "split_knowledge_base", side_effect=AssertionError("ingestion ran")):
+        store = retrieval_chain.load_vector_store()
+
+    assert store.index.ntotal > 0
+    assert not store.embeddings.loaded, "Embedding model should load lazily on first query"
+
+
+
+def test_pickled_index_is_rebuilt_not_unpickled(tmp_path):
+    """Startup must never unpickle an index left by an older version"""
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    from legacy import retrieval_chain
+
+    index_path = str(tmp_path / "faiss_index")
+    embeddings = DeterministicFakeEmbedding(size=8)
+    FAISS.from_documents([Document(page_content="old")], embeddings).save_local(index_path)
+
+    with patch.object(FAISS, "load_local", side_effect=AssertionError("pickle loaded")):
+        store = retrieval_chain.load_vector_store(index_path, embeddings=embeddings)
+
+    assert store.index.ntotal > 1, "The index should be rebuilt from the knowledge base"
+
+def test_vector_store_for_another_knowledge_base(tmp_path):
+    """An explicit index and knowledge base path must not touch the app's index"""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    from legacy import retrieval_chain
+    from legacy.indexing import read_manifest
+
+    knowledge_path = tmp_path / "knowledge.txt"
+    knowledge_path.write_text("Section 1: Pricing\n------------------\nPrepaid is pay-as-you-go.\n", encoding="utf-8")
+    index_path = str(tmp_path / "faiss_index")
+
+    store = retrieval_chain.load_vector_store(index_path, str(knowledge_path), DeterministicFakeEmbedding(size=8))
+
+    assert store.index.ntotal == 1
+    assert read_manifest(index_path) is not None
+
+
+def test_chain_versions_answers_by_its_own_index(tmp_path):
+    """The exact cache must use the version of the index behind the store, not the app's index"""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    from legacy import retrieval_chain
+    from legacy.answer_cache import ExactAnswerCache, SemanticAnswerCache
+    from legacy.fake_llm import FakeChatModel
+    from legacy.indexing import read_manifest
+
+    knowledge_path = tmp_path / "knowledge.txt"
+    knowledge_path.write_text("Section 1: Pricing\n------------------\nPrepaid is pay-as-you-go.\n", encoding="utf-8")
+    index_path = str(tmp_path / "faiss_index")
+    store = retrieval_chain.load_vector_store(index_path, str(knowledge_path), DeterministicFakeEmbedding(size=8))
+    exact_cache = ExactAnswerCache(str(tmp_path / "answers.sqlite3"))
+    exact_cache.store("What is One API?", "Another index's answer.", "other", index_path="/another/index")
+
+    chain = retrieval_chain.build_retrieval_chain(vector_store=store, llm=FakeChatModel(response="Pay as you go."),
+                                                  answer_cache=SemanticAnswerCache(), exact_cache=exact_cache,
+                                                  reranker=False)
+    chain.invoke({"input": "What is Prepaid?"}, config={"configurable": {"session_id": "versioned"}})
+
+    assert exact_cache.lookup("What is Prepaid?", read_manifest(index_path)["version"]) == "Pay as you go."
+    assert exact_cache.lookup("What is One API?", "other") == "Another index's answer."
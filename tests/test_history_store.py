@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests for durable, write-behind chat history persistence
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from legacy.history_store import SQLiteHistoryBackend
+from legacy.session_store import SessionStore
+
+
+def add_turns(history, count, start=0):
+    for n in range(start, start + count):
+        history.add_messages([HumanMessage(content=f"question {n}"), AIMessage(content=f"answer {n}")])
+
+
+def test_history_survives_restart(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    backend = SQLiteHistoryBackend(path)
+    add_turns(SessionStore(backend=backend)("alice"), 2)
+    backend.close()
+
+    # A new process: nothing in memory, the session is restored on first use
+    restarted = SessionStore(backend=SQLiteHistoryBackend(path))
+    history = restarted("alice")
+
+    assert [message.content for message in history.messages] == [
+        "question 0", "answer 0", "question 1", "answer 1",
+    ]
+    assert isinstance(history.messages[0], HumanMessage)
+    assert restarted.stats()["restored"] == 1
+
+
+def test_appends_are_written_in_background_batches(tmp_path):
+    backend = SQLiteHistoryBackend(str(tmp_path / "history.sqlite3"), flush_interval=60)
+    add_turns(SessionStore(backend=backend)("bob"), 50)
+
+    assert backend.flush()
+    stats = backend.stats()
+    assert stats["written"] == 100
+    assert stats["batches"] < 10, "Queued messages should share transactions"
+
+
+def test_restore_is_bounded_and_keeps_appending(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    backend = SQLiteHistoryBackend(path, restore_messages=4)
+    history = SessionStore(backend=backend)("carol")
+    add_turns(history, 10)
+    history.set_summary("Carol asked about pricing.", 12)
+    backend.close()
+
+    backend = SQLiteHistoryBackend(path, restore_messages=4)
+    history = SessionStore(backend=backend)("carol")
+    assert [message.content for message in history.messages] == [
+        "question 8", "answer 8", "question 9", "answer 9",
+    ]
+    assert history.summary == "Carol asked about pricing."
+    assert history.summarized == 0
+
+    # New turns continue the stored sequence instead of overwriting it
+    add_turns(history, 1, start=10)
+    backend.close()
+    history = SessionStore(backend=SQLiteHistoryBackend(path, restore_messages=100))("carol")
+    assert len(history.messages) == 22
+    assert history.messages[-1].content == "answer 10"
+
+
+def test_restore_merges_queued_writes_without_waiting_for_disk(tmp_path):
+    backend = SQLiteHistoryBackend(str(tmp_path / "history.sqlite3"))
+    add_turns(SessionStore(backend=backend)("dave"), 1)
+    assert backend.flush()
+
+    # Hold the writer so the next updates stay queued
+    release = threading.Event()
+    write = backend._write
+    backend._write = lambda batch: (release.wait(10), write(batch))
+    backend.flush = lambda timeout=10.0: pytest.fail("load must not wait for the writer")
+    history = SessionStore(backend=backend)("dave")
+    add_turns(history, 1, start=1)
+    history.set_summary("Dave asked twice.", 2)
+
+    restored = SessionStore(backend=backend)("dave")
+    assert [message.content for message in restored.messages] == [
+        "question 0", "answer 0", "question 1", "answer 1",
+    ]
+    assert restored.summary == "Dave asked twice."
+    release.set()
+    del backend.flush
+    assert backend.flush()
+
+
+def test_idle_sessions_are_pruned(tmp_path):
+    backend = SQLiteHistoryBackend(str(tmp_path / "history.sqlite3"))
+    sessions = SessionStore(backend=backend)
+    add_turns(sessions("erin"), 1)
+    assert backend.flush()
+    time.sleep(0.01)
+    cutoff = time.time()
+    time.sleep(0.01)
+    add_turns(sessions("frank"), 1)
+
+    assert backend.flush()
+    assert backend.prune(older_than=time.time() - 60) == 0
+    assert backend.prune(older_than=cutoff) == 1
+    assert backend.load("erin") is None
+    assert backend.load("frank") is not None
+    assert backend.stats()["pruned"] == 1
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Tests for content-hashed incremental re-indexing
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from legacy import indexing
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Fake embeddings that remember how many texts were embedded"""
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+def make_chunks(texts):
+    return [Document(page_content=text, metadata={"source": "kb.txt"}) for text in texts]
+
+
+def test_only_changed_chunks_are_embedded(tmp_path):
+    source = tmp_path / "kb.txt"
+    source.write_text("v1")
+    index_path = str(tmp_path / "index")
+    embeddings = CountingEmbeddings(size=8)
+
+    indexing.sync_index(index_path, embeddings, make_chunks(["alpha", "beta", "gamma"]), source_path=str(source))
+    assert embeddings.embedded == 3
+    first = indexing.read_manifest(index_path)
+
+    source.write_text("v2")
+    embeddings.embedded = 0
+    store = indexing.sync_index(index_path, embeddings, make_chunks(["alpha", "beta", "delta"]), source_path=str(source)).store
+
+    assert embeddings.embedded == 1, "Only the new chunk should be embedded"
+    assert store.index.ntotal == 3
+    contents = {store.docstore.search(doc_id).page_content for doc_id in store.index_to_docstore_id.values()}
+    assert contents == {"alpha", "beta", "delta"}
+
+    manifest = indexing.read_manifest(index_path)
+    assert manifest["version"] != first["version"]
+    assert indexing.is_up_to_date(manifest, source_path=str(source))
+
+
+def test_unchanged_knowledge_base_embeds_nothing(tmp_path):
+    source = tmp_path / "kb.txt"
+    source.write_text("v1")
+    index_path = str(tmp_path / "index")
+    embeddings = CountingEmbeddings(size=8)
+    chunks = make_chunks(["alpha", "alpha", "beta"])
+
+    indexing.sync_index(index_path, embeddings, chunks, source_path=str(source))
+    embeddings.embedded = 0
+    store = indexing.sync_index(index_path, embeddings, chunks, source_path=str(source)).store
+
+    assert embeddings.embedded == 0
+    assert store.index.ntotal == 3, "Repeated chunks keep separate entries"
+
+
+def test_settings_change_forces_rebuild(tmp_path, monkeypatch):
+    source = tmp_path / "kb.txt"
+    source.write_text("v1")
+    index_path = str(tmp_path / "index")
+    embeddings = CountingEmbeddings(size=8)
+    chunks = make_chunks(["alpha", "beta"])
+
+    indexing.sync_index(index_path, embeddings, chunks, source_path=str(source))
+    monkeypatch.setattr(indexing, "CHUNK_SIZE", 123)
+    embeddings.embedded = 0
+    indexing.sync_index(index_path, embeddings, chunks, source_path=str(source))
+
+    assert embeddings.embedded == 2
+
+
+
+def test_empty_knowledge_base_writes_only_a_manifest(tmp_path, monkeypatch):
+    source = tmp_path / "kb.txt"
+    source.write_text("")
+    index_path = str(tmp_path / "new" / "index")
+    embeddings = CountingEmbeddings(size=8)
+
+    result = indexing.sync_index(index_path, embeddings, [], source_path=str(source))
+    assert result.store is None
+    assert indexing.read_manifest(index_path)["chunks"] == {}
+
+    # Settings change with nothing left to embed: the old vectors are dropped, not saved
+    source.write_text("v1")
+    indexing.sync_index(index_path, embeddings, make_chunks(["alpha"]), source_path=str(source))
+    monkeypatch.setattr(indexing, "CHUNK_SIZE", 123)
+    source.write_text("")
+    result = indexing.sync_index(index_path, embeddings, [], source_path=str(source))
+    assert result.store is None
+    assert not indexing.store_exists(index_path)
+    assert indexing.is_up_to_date(indexing.read_manifest(index_path), str(source))
+
+
+def test_backend_change_forces_rebuild(tmp_path, monkeypatch):
+    source = tmp_path / "kb.txt"
+    source.write_text("v1")
+    index_path = str(tmp_path / "index")
+    embeddings = CountingEmbeddings(size=8)
+    chunks = make_chunks(["alpha", "beta"])
+
+    indexing.sync_index(index_path, embeddings, chunks, source_path=str(source))
+    monkeypatch.setattr(indexing, "embedding_backend", lambda model_name: "onnx-int8")
+    assert not indexing.is_up_to_date(indexing.read_manifest(index_path), source_path=str(source))
+    embeddings.embedded = 0
+    indexing.sync_index(index_path, embeddings, chunks, source_path=str(source))
+
+    assert embeddings.embedded == 2
+    assert indexing.read_manifest(index_path)["params"]["embed_backend"] == "onnx-int8"
+
+class FailingEmbeddings(CountingEmbeddings):
+    """Simulates an interrupted build by failing after a number of texts"""
+    fail_after: int = 0
+
+    def embed_documents(self, texts):
+        if self.embedded + len(texts) > self.fail_after:
+            raise KeyboardInterrupt
+        return super().embed_documents(texts)
+
+
+def test_interrupted_build_resumes_from_checkpoint(tmp_path):
+    source = tmp_path / "kb.txt"
+    source.write_text("v1")
+    index_path = str(tmp_path / "index")
+    chunks = make_chunks([f"chunk {number}" for number in range(10)])
+
+    failing = FailingEmbeddings(size=8, fail_after=6)
+    try:
+        indexing.sync_index(index_path, failing, chunks, source_path=str(source),
+                            batch_size=2, checkpoint_every=1)
+    except KeyboardInterrupt:
+        pass
+    assert not indexing.is_up_to_date(indexing.read_manifest(index_path), source_path=str(source))
+
+    embeddings = CountingEmbeddings(size=8)
+    result = indexing.sync_index(index_path, embeddings, chunks, source_path=str(source), batch_size=2)
+
+    assert result.unchanged == 6 and embeddings.embedded == 4, "Checkpointed batches should not be embedded again"
+    assert result.store.index.ntotal == 10
+
+
+def test_process_pool_matches_single_process(tmp_path):
+    chunks = make_chunks([f"chunk {number}" for number in range(9)])
+    embeddings = DeterministicFakeEmbedding(size=8)
+
+    serial = [vector for _, vectors in indexing.embed_batches(chunks, embeddings, batch_size=2) for vector in vectors]
+    pooled = [vector for _, vectors in indexing.embed_batches(chunks, embeddings, batch_size=2, workers=2)
+              for vector in vectors]
+
+    assert pooled == serial
+
+
+def test_index_type_change_rebuilds_without_embedding(tmp_path):
+    from unittest.mock import patch
+
+    from legacy import ann
+    from legacy.mmap_store import load_store
+
+    source = tmp_path / "kb.txt"
+    source.write_text("v1")
+    index_path = str(tmp_path / "index")
+    embeddings = CountingEmbeddings(size=8)
+    chunks = make_chunks([f"chunk {i}" for i in range(50)])
+    flat_store = indexing.sync_index(index_path, embeddings, chunks, source_path=str(source)).store
+    query = embeddings.embed_query("chunk 7")
+    expected = [document.page_content for document in flat_store.similarity_search_by_vector(query, k=3)]
+
+    embeddings.embedded = 0
+    with patch.object(ann, "INDEX_TYPE", "hnsw"):
+        assert not indexing.is_up_to_date(indexing.read_manifest(index_path), source_path=str(source))
+        indexing.sync_index(index_path, embeddings, chunks, source_path=str(source))
+        manifest = indexing.read_manifest(index_path)
+        assert indexing.is_up_to_date(manifest, source_path=str(source))
+
+    assert embeddings.embedded == 0, "Changing the index type must not re-embed chunks"
+    assert manifest["index"]["type"] == "hnsw"
+    store = load_store(index_path, embeddings)
+    assert ann.index_type(store.index) == "hnsw"
+    assert [document.page_content for document in store.similarity_search_by_vector(query, k=3)] == expected
+
+
+def test_ivf_and_hnsw_indexes_are_edited_in_place(tmp_path):
+    from unittest.mock import patch
+
+    from legacy import ann
+    from legacy.mmap_store import load_store
+
+    source = tmp_path / "kb.txt"
+    index_path = str(tmp_path / "index")
+    embeddings = CountingEmbeddings(size=8)
+    texts = [f"chunk {i}" for i in range(300)]
+
+    for index_type in ("ivf", "hnsw"):
+        with patch.object(ann, "INDEX_TYPE", index_type):
+            source.write_text("v1")
+            indexing.sync_index(index_path, embeddings, make_chunks(texts), source_path=str(source), rebuild=True)
+            trained = ann.build_index
+            with patch.object(ann, "build_index", side_effect=AssertionError("index was rebuilt")):
+                # IVF takes deletions and additions; HNSW only additions
+                edited = texts + ["chunk new"] if index_type == "hnsw" else texts[10:] + ["chunk new"]
+                source.write_text("v2")
+                indexing.sync_index(index_path, embeddings, make_chunks(edited), source_path=str(source))
+            if index_type == "hnsw":
+                # A deletion cannot be applied to the graph and rebuilds it
+                with patch.object(ann, "build_index", wraps=trained) as build:
+                    edited = edited[10:]
+                    source.write_text("v3")
+                    indexing.sync_index(index_path, embeddings, make_chunks(edited), source_path=str(source))
+                assert build.call_count == 1
+
+            assert indexing.is_up_to_date(indexing.read_manifest(index_path), source_path=str(source))
+            store = load_store(index_path, embeddings)
+            assert ann.index_type(store.index) == index_type
+            assert store.index.ntotal == len(edited)
+            for text in (edited[0], edited[len(edited) // 2], "chunk new"):
+                found = store.similarity_search_by_vector(embeddings.embed_query(text), k=1)
+                assert found[0].page_content == text
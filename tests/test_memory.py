@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for token-budgeted conversation memory
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from legacy.fake_llm import FakeChatModel
+from legacy.memory import ConversationMemory, count_message_tokens
+from legacy.session_store import SessionHistory, SessionStore
+
+
+def add_turns(history, count, start=0):
+    for n in range(start, start + count):
+        history.add_messages([HumanMessage(content=f"question {n}"), AIMessage(content=f"answer {n}")])
+
+
+def test_window_keeps_recent_turns_and_summary():
+    memory = ConversationMemory(FakeChatModel(response="They asked about pricing."), recent_turns=2)
+    history = SessionHistory()
+    add_turns(history, 5)
+
+    memory.schedule_summary(history).result()
+    window = memory.window(history)
+
+    assert isinstance(window[0], SystemMessage)
+    assert "pricing" in window[0].content
+    assert [message.content for message in window[1:]] == ["question 3", "answer 3", "question 4", "answer 4"]
+    assert history.summarized == 6
+
+
+def test_window_respects_token_budget():
+    memory = ConversationMemory(FakeChatModel(), recent_turns=10, token_budget=60)
+    history = SessionHistory()
+    history.add_messages([HumanMessage(content="word " * 40), AIMessage(content="ok")])
+    add_turns(history, 3)
+
+    window = memory.window(history)
+
+    assert count_message_tokens(window) <= 60
+    assert window[-1].content == "answer 2", "Most recent turn must always be kept"
+
+
+def test_summary_runs_off_the_request_path():
+    """Adding messages must return before the summarizer has finished"""
+    llm = FakeChatModel(response="summary", latency=0.5)
+    memory = ConversationMemory(llm, recent_turns=1, executor=ThreadPoolExecutor(max_workers=1))
+    view = memory.view(SessionHistory())
+
+    view.add_messages([HumanMessage(content="q0"), AIMessage(content="a0")])
+    view.add_messages([HumanMessage(content="q1"), AIMessage(content="a1")])
+
+    assert view.history.summary == "", "Summary should still be computing"
+    memory.executor.shutdown(wait=True)
+    assert view.history.summary == "summary"
+
+
+def test_prompt_tokens_stay_flat_in_long_conversations(make_chain):
+    llm = FakeChatModel(response="A fairly detailed answer about Clickatell products and pricing plans.")
+    sessions = SessionStore()
+    memory = ConversationMemory(llm, recent_turns=2, executor=ThreadPoolExecutor(max_workers=1))
+    chain = make_chain(llm, texts=("Clickatell offers chat commerce.",), sessions=sessions, memory=memory)
+
+    for n in range(12):
+        chain.invoke({"input": f"Follow-up question number {n}?"}, config={"configurable": {"session_id": "long"}})
+        memory.executor.submit(lambda: None).result()   # let the background summary catch up
+
+    tokens = sessions("long").prompt_tokens
+    assert len(tokens) == 12
+    assert max(tokens[4:]) - min(tokens[4:]) < 20, f"Prompt size should plateau, got {tokens}"
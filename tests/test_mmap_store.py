@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for the memory-mapped, pickle-free index format
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+
+from legacy import mmap_store
+
+
+def build_store(texts):
+    documents = [Document(page_content=text, metadata={"n": number}) for number, text in enumerate(texts)]
+    return FAISS.from_documents(documents, DeterministicFakeEmbedding(size=8), ids=list(texts))
+
+
+def test_round_trip_preserves_search_results(tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=8)
+    store = build_store(["alpha", "beta", "gamma", "déjà vu"])
+    mmap_store.save_store(store, str(tmp_path))
+
+    loaded = mmap_store.load_store(str(tmp_path), embeddings)
+
+    assert not os.path.exists(tmp_path / "index.pkl")
+    for query in ["alpha", "déjà vu"]:
+        expected = store.similarity_search_with_score(query, k=2)
+        actual = loaded.similarity_search_with_score(query, k=2)
+        assert [(doc.page_content, doc.metadata) for doc, _ in actual] == \
+            [(doc.page_content, doc.metadata) for doc, _ in expected]
+
+
+def test_writable_copy_supports_add_and_delete(tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=8)
+    mmap_store.save_store(build_store(["alpha", "beta"]), str(tmp_path))
+
+    store = mmap_store.load_store(str(tmp_path), embeddings, mmap_vectors=False)
+    store.delete(["alpha"])
+    store.add_texts(["gamma"], ids=["gamma"])
+    mmap_store.save_store(store, str(tmp_path))
+
+    reloaded = mmap_store.load_store(str(tmp_path), embeddings)
+    contents = sorted(reloaded.docstore.search(doc_id).page_content
+                      for doc_id in reloaded.index_to_docstore_id.values())
+    assert contents == ["beta", "gamma"]
+    assert isinstance(reloaded.docstore.search("alpha"), str)
+
+
+def test_pickled_index_is_migrated_once(tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=8)
+    build_store(["alpha", "beta"]).save_local(str(tmp_path))
+    assert mmap_store.legacy_store_exists(str(tmp_path))
+
+    mmap_store.migrate_legacy_store(str(tmp_path), embeddings)
+
+    assert mmap_store.store_exists(str(tmp_path))
+    assert not mmap_store.legacy_store_exists(str(tmp_path))
+    assert mmap_store.load_store(str(tmp_path), embeddings).index.ntotal == 2
+
+
+def test_saves_switch_generations_atomically(tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=8)
+    path = str(tmp_path)
+    mmap_store.save_store(build_store(["alpha", "beta"]), path)
+    serving = mmap_store.load_store(path, embeddings)
+
+    for texts in (["alpha", "beta", "gamma"], ["delta"]):
+        mmap_store.save_store(build_store(texts), path)
+
+    # Only the current generation and the one before it are kept
+    assert mmap_store._generations(path) == ["store-000002", "store-000003"]
+    assert mmap_store.load_store(path, embeddings).index.ntotal == 1
+    # A reader that loaded an earlier generation keeps a consistent view
+    assert serving.docstore.search("beta").page_content == "beta"
+
+
+def test_files_from_different_saves_are_rejected(tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=8)
+    path = str(tmp_path)
+    mmap_store.save_store(build_store(["alpha", "beta"]), path)
+    mmap_store.save_store(build_store(["alpha", "beta", "gamma"]), path)
+    old, new = (os.path.join(path, name) for name in mmap_store._generations(path))
+    os.replace(os.path.join(old, mmap_store.IDS_FILE), os.path.join(new, mmap_store.IDS_FILE))
+
+    with pytest.raises(ValueError, match="do not belong together"):
+        mmap_store.load_store(path, embeddings)
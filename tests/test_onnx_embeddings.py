@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Tests for the ONNX Runtime embedding backend
+"""
+
+import json
+import os
+import pickle
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from legacy import onnx_embeddings
+from legacy.embeddings import LazyEmbeddings, build_embeddings
+
+
+def test_mean_pool_ignores_padding_and_normalizes():
+    hidden = np.array([[[1.0, 0.0], [3.0, 0.0], [100.0, 100.0]]], dtype=np.float32)
+    mask = np.array([[1, 1, 0]])
+
+    pooled = onnx_embeddings.mean_pool(hidden, mask)
+
+    assert np.allclose(pooled, [[1.0, 0.0]])
+    assert np.allclose(onnx_embeddings.mean_pool(hidden, mask, normalize=False), [[2.0, 0.0]])
+
+
+def test_export_for_another_model_is_not_used(tmp_path):
+    for name in (onnx_embeddings.MODEL_FILE, onnx_embeddings.TOKENIZER_FILE):
+        (tmp_path / name).write_text("")
+    (tmp_path / onnx_embeddings.CONFIG_FILE).write_text(json.dumps({"model_name": "other/model"}))
+
+    assert not onnx_embeddings.onnx_available("sentence-transformers/all-MiniLM-L6-v2", str(tmp_path),
+                                              quantized=False)
+
+
+def test_missing_export_falls_back_to_torch():
+    embeddings = build_embeddings(backend="onnx")
+
+    while hasattr(embeddings, "underlying"):   # caching and batching wrappers
+        embeddings = embeddings.underlying
+    if not onnx_embeddings.onnx_available(embeddings.model_name):
+        assert isinstance(embeddings, LazyEmbeddings)
+    assert not embeddings.loaded
+
+
+def test_workers_receive_settings_not_sessions():
+    embeddings = onnx_embeddings.OnnxEmbeddings("model", path="/tmp/export", quantized=False, threads=2)
+
+    copy = pickle.loads(pickle.dumps(embeddings))
+
+    assert (copy.model_name, copy.path, copy.quantized, copy.threads) == ("model", "/tmp/export", False, 2)
+    assert not copy.loaded
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for cross-encoder reranking with adaptive k and a latency budget
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+
+from legacy.rerank import CrossEncoderReranker
+from legacy.retrieval import Hit
+
+
+class FakeCrossEncoder:
+    """Scores a pair by the share of question words found in the chunk"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=None):
+        self.calls.append(len(pairs))
+        time.sleep(self.delay * len(pairs))
+        scores = []
+        for question, text in pairs:
+            words = question.lower().split()
+            scores.append(sum(word in text.lower() for word in words) / len(words))
+        return scores
+
+
+def make_hits(texts):
+    return [Hit(Document(page_content=text), position, 1.0 / (position + 1), None, None)
+            for position, text in enumerate(texts)]
+
+
+HITS = make_hits([
+    "Chat Desk is a live agent interface",
+    "Prepaid is pay-as-you-go messaging",
+    "Chat 2 Pay sends payment links in chat",
+    "Founded in 2000",
+])
+
+
+def test_rerank_orders_by_relevance_and_cuts_off():
+    model = FakeCrossEncoder()
+    reranker = CrossEncoderReranker(model=model, min_score=0.5, max_k=3)
+
+    kept = reranker.rerank("chat 2 pay payment", HITS)
+
+    assert [hit.document.page_content for hit in kept] == ["Chat 2 Pay sends payment links in chat"]
+    assert model.calls == [4], "All candidates should be scored in one batch"
+
+
+def test_best_hit_kept_when_nothing_passes_cutoff():
+    reranker = CrossEncoderReranker(model=FakeCrossEncoder(), min_score=0.9)
+
+    kept = reranker.rerank("founded year 2000 exactly", HITS)
+
+    assert [hit.document.page_content for hit in kept] == ["Founded in 2000"]
+
+
+def test_slow_reranker_falls_back_to_retrieval_order():
+    model = FakeCrossEncoder(delay=0.02)
+    reranker = CrossEncoderReranker(model=model, budget_ms=40, fallback_k=2)
+
+    reranker.rerank("chat 2 pay", HITS)      # measured: ~80 ms for 4 pairs, over budget
+    kept = reranker.rerank("chat 2 pay", HITS)
+
+    assert [hit.position for hit in kept] == [0, 1]
+    assert len(model.calls) == 1, "Reranking predicted to exceed the budget should be skipped"
+    assert reranker.stats()["over_budget"] == 1
+    assert reranker.stats()["skipped"] == 1
+
+
+def test_unloaded_model_uses_retrieval_order():
+    reranker = CrossEncoderReranker(model_name="missing/model", fallback_k=3)
+    reranker._failed = True   # as if loading had already failed
+
+    kept = reranker.rerank("chat 2 pay", HITS)
+
+    assert kept == HITS[:3]
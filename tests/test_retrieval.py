@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Tests for hybrid BM25 + FAISS retrieval
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from legacy.indexing import split_knowledge_base
+from legacy.retrieval import BM25Index, HybridRetriever, tokenize
+
+QUESTIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "data", "eval", "retrieval_questions.jsonl")
+
+
+def test_tokenize_keeps_versions():
+    assert tokenize("HTTPS, TLS 1.2+ and One API") == ["https", "tls", "1.2", "and", "one", "api"]
+
+
+def test_bm25_prefers_rare_exact_terms():
+    index = BM25Index([
+        "Chat Flow: workflow builder for chat automation",
+        "Chat 2 Pay: in-chat payments via secure links",
+        "Chat Desk: live agent interface for chat support",
+    ])
+
+    assert index.search("chat 2 pay payments", k=1)[0][0] == 1
+    assert index.search("unrelated words", k=3) == []
+
+
+def test_bm25_scores_match_okapi_formula():
+    """The vectorized scores equal BM25 computed term by term"""
+    texts = ["one api one endpoint", "chat desk for chat support agents", "one chat inbox", ""]
+    index = BM25Index(texts)
+    lengths = [len(tokenize(text)) for text in texts]
+    average = sum(lengths) / len(lengths)
+
+    expected = []
+    for text, length in zip(texts, lengths):
+        tokens = tokenize(text)
+        score = 0.0
+        for term in {"one", "chat", "missing"}:
+            frequency = tokens.count(term)
+            if not frequency:
+                continue
+            documents = sum(term in tokenize(other) for other in texts)
+            idf = np.log(1 + (len(texts) - documents + 0.5) / (documents + 0.5))
+            norm = index.k1 * (1 - index.b + index.b * length / average)
+            score += idf * frequency * (index.k1 + 1) / (frequency + norm)
+        expected.append(score)
+
+    assert np.allclose(index.scores("one chat missing chat"), expected, atol=1e-5)
+
+
+def test_dense_scores_are_cosine_similarities():
+    vectors = [[1.0, 0.0], [0.0, 1.0]]
+    store = FAISS.from_embeddings(
+        [("first", vectors[0]), ("second", vectors[1])], DeterministicFakeEmbedding(size=2)
+    )
+    retriever = HybridRetriever(store, mode="dense")
+
+    hits = retriever.search("first", np.array([1.0, 0.0]), k=2)
+
+    assert [hit.document.page_content for hit in hits] == ["first", "second"]
+    assert abs(hits[0].dense_score - 1.0) < 1e-6
+    assert abs(hits[1].dense_score) < 1e-6
+
+
+def test_hybrid_improves_precision_on_exact_tokens():
+    """With an embedding that carries no meaning, only the sparse side can find the right chunk"""
+    embeddings = DeterministicFakeEmbedding(size=32)
+    store = FAISS.from_documents(split_knowledge_base(), embeddings)
+    with open(QUESTIONS, encoding="utf-8") as questions_file:
+        questions = [json.loads(line) for line in questions_file if line.strip()]
+
+    def precision(mode):
+        retriever = HybridRetriever(store, k=3, mode=mode)
+        relevant = 0
+        for item in questions:
+            hits = retriever.search(item["question"], embeddings.embed_query(item["question"]))
+            relevant += sum(any(phrase.lower() in hit.document.page_content.lower() for phrase in item["expected"])
+                            for hit in hits)
+        return relevant / (3 * len(questions))
+
+    assert precision("hybrid") > precision("dense")
+
+
+def test_stage_timings_are_recorded():
+    store = FAISS.from_documents([Document(page_content="One API sends SMS")], DeterministicFakeEmbedding(size=8))
+    retriever = HybridRetriever(store)
+
+    retriever.search("One API", store.embeddings.embed_query("One API"))
+
+    stats = retriever.stats()
+    assert stats["dense_ms"]["count"] == stats["sparse_ms"]["count"] == stats["fusion_ms"]["count"] == 1
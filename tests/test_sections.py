@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests for section-aware chunking and section-filtered retrieval
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from legacy.indexing import split_knowledge_base
+from legacy.retrieval import HybridRetriever
+from legacy.sections import PREAMBLE_SECTION, SectionSplitter
+
+TEXT = """Knowledge Base
+==============
+Intro text.
+
+---
+
+Section 1: Company Overview
+---------------------------
+- Founded: 2000
+
+---
+
+Section 2: FAQs
+---------------
+
+Billing
+~~~~~~~
+- Can I get a refund? Case-by-case.
+
+Support
+~~~~~~~
+- Is support 24/7? Yes.
+"""
+
+
+def test_chunks_never_cross_sections():
+    chunks = SectionSplitter(chunk_size=600, chunk_overlap=0).split_documents(
+        [Document(page_content=TEXT, metadata={"source": "kb.txt"})]
+    )
+
+    tags = [(chunk.metadata["section"], chunk.metadata["topic"]) for chunk in chunks]
+    assert tags == [(PREAMBLE_SECTION, None), ("Company Overview", None), ("FAQs", "Billing"), ("FAQs", "Support")]
+    assert chunks[1].page_content.startswith("Section 1: Company Overview")
+    assert "Section 2" not in chunks[1].page_content
+    assert "24/7" not in chunks[2].page_content
+    assert all(chunk.metadata["source"] == "kb.txt" for chunk in chunks)
+    assert all("---" != line for chunk in chunks for line in chunk.page_content.splitlines())
+
+
+def test_long_sections_are_split_within_the_section():
+    text = "Section 1: Pricing\n------------------\n" + "\n".join(f"- Plan {i} costs money" for i in range(40))
+
+    chunks = SectionSplitter(chunk_size=200, chunk_overlap=20).split_documents([Document(page_content=text)])
+
+    assert len(chunks) > 1
+    assert all(len(chunk.page_content) <= 200 for chunk in chunks)
+    assert {chunk.metadata["section_number"] for chunk in chunks} == {1}
+
+
+def test_filtered_search_only_returns_the_section():
+    embeddings = DeterministicFakeEmbedding(size=32)
+    store = FAISS.from_documents(split_knowledge_base(), embeddings)
+    retriever = HybridRetriever(store, k=3)
+    question = "How do I top up my balance?"
+
+    hits = retriever.search(question, embeddings.embed_query(question), section="Pricing and Plans")
+
+    assert "Pricing and Plans" in retriever.sections()
+    assert hits and all(hit.document.metadata["section"] == "Pricing and Plans" for hit in hits)
+    assert retriever.stats()["filtered"] == 1
+    assert retriever.stats()["filtered_scanned_avg"] < 0.5
+
+
+def test_unknown_section_searches_everything():
+    embeddings = DeterministicFakeEmbedding(size=8)
+    store = FAISS.from_documents([Document(page_content="One API sends SMS", metadata={"section": "Products"})],
+                                 embeddings)
+    retriever = HybridRetriever(store)
+
+    hits = retriever.search("One API", embeddings.embed_query("One API"), section="Nonexistent")
+
+    assert len(hits) == 1
+    assert retriever.stats()["filtered"] == 0
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for the bounded chat history store
+"""
+
+import os
+import sys
+import threading
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from legacy import session_store
+from legacy.session_store import SessionStore
+
+
+def test_same_session_returns_same_history():
+    store = SessionStore(max_sessions=10, idle_ttl_seconds=60)
+    history = store("alice")
+    history.add_messages([HumanMessage(content="hi"), AIMessage(content="hello")])
+
+    assert store("alice") is history
+    assert store.stats()["messages"] == 2
+    assert store.stats()["bytes"] == len("hi") + len("hello")
+
+
+def test_least_recently_used_session_evicted_at_capacity():
+    store = SessionStore(max_sessions=2, idle_ttl_seconds=None)
+    store("a")
+    store("b")
+    store("a")
+    store("c")
+
+    assert "a" in store and "c" in store
+    assert "b" not in store
+    assert store.stats()["evicted_capacity"] == 1
+
+
+def test_idle_sessions_expire():
+    store = SessionStore(max_sessions=10, idle_ttl_seconds=60)
+    with patch.object(session_store.time, "monotonic", return_value=1000.0):
+        store("old")
+    with patch.object(session_store.time, "monotonic", return_value=1030.0):
+        store("recent")
+    with patch.object(session_store.time, "monotonic", return_value=1070.0):
+        store.evict_idle()
+
+    assert "old" not in store
+    assert "recent" in store
+    assert store.stats()["evicted_idle"] == 1
+
+
+def test_concurrent_appends_are_not_lost():
+    store = SessionStore()
+    history = store("shared")
+
+    def append():
+        for n in range(200):
+            history.add_messages([HumanMessage(content=str(n))])
+
+    threads = [threading.Thread(target=append) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(history.messages) == 1600
+
+
+def test_chain_uses_store_for_history(make_chain):
+    from langchain_community.chat_models import FakeListChatModel
+
+    store = SessionStore(max_sessions=1, idle_ttl_seconds=None)
+    llm = FakeListChatModel(responses=["one", "two"])
+    chain = make_chain(llm, texts=("Clickatell",), sessions=store)
+
+    chain.invoke({"input": "first"}, config={"configurable": {"session_id": "a"}})
+    chain.invoke({"input": "second"}, config={"configurable": {"session_id": "b"}})
+
+    assert len(store) == 1, "Older session should have been evicted"
+    assert [message.content for message in store("b").messages] == ["second", "two"]
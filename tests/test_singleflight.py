@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Tests for single-flight coalescing of identical in-flight questions
+"""
+
+import asyncio
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from legacy.fake_llm import FakeChatModel
+from legacy.singleflight import Flight, FlightFailed, SingleFlight
+
+SNIPPET = ("One API sends SMS and WhatsApp messages.",)
+
+
+def test_late_subscribers_replay_every_token():
+    flight = Flight()
+    flight.publish("One ")
+    received = []
+    reader = threading.Thread(target=lambda: received.extend(flight))
+    reader.start()
+    flight.publish("API")
+    flight.finish()
+    reader.join()
+
+    assert received == ["One ", "API"]
+    assert list(flight) == ["One ", "API"]
+
+
+def test_leader_errors_reach_followers():
+    flight = Flight()
+    flight.finish(ValueError("LLM down"))
+
+    with pytest.raises(FlightFailed):
+        list(flight)
+
+
+def test_concurrent_identical_questions_share_one_llm_call(make_chain):
+    llm = FakeChatModel(response="One API is a REST API.", latency=0.3)
+    singleflight = SingleFlight()
+    chain = make_chain(llm, texts=SNIPPET, singleflight=singleflight)
+    answers = []
+
+    def ask(session_id, question):
+        answers.append(chain.invoke({"input": question}, config={"configurable": {"session_id": session_id}}))
+
+    threads = [threading.Thread(target=ask, args=(f"user-{i}", "What is One API?" if i % 2 else "what is one api"))
+               for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert answers == ["One API is a REST API."] * 8
+    assert llm.calls == 1, "Followers must not call the LLM"
+    assert singleflight.stats()["calls_saved"] == 7
+    assert singleflight.stats()["in_flight"] == 0
+
+
+def test_streaming_followers_receive_the_whole_answer(make_chain):
+    llm = FakeChatModel(response="Chat 2 Pay sends payment links in chat.", latency=0.1, tokens_per_second=50)
+    singleflight = SingleFlight()
+    chain = make_chain(llm, texts=SNIPPET, singleflight=singleflight)
+
+    async def stream(session_id, delay):
+        await asyncio.sleep(delay)
+        config = {"configurable": {"session_id": session_id}}
+        return [token async for token in chain.astream({"input": "What is Chat 2 Pay?"}, config=config)]
+
+    async def run():
+        # The last request joins while the leader is already streaming
+        return await asyncio.gather(*(stream(f"user-{i}", delay) for i, delay in enumerate([0, 0.01, 0.02, 0.15])))
+
+    streams = asyncio.run(run())
+
+    assert all("".join(tokens) == llm.response for tokens in streams)
+    assert all(len(tokens) > 1 for tokens in streams), "Followers should stream token by token"
+    assert llm.calls == 1
+    assert singleflight.stats()["calls_saved"] == 3
+
+
+def test_different_histories_do_not_share_a_flight(make_chain):
+    llm = FakeChatModel(response="It costs nothing to start.", latency=0.2)
+    singleflight = SingleFlight()
+    chain = make_chain(llm, texts=SNIPPET, singleflight=singleflight)
+    chain.invoke({"input": "Tell me about Prepaid"}, config={"configurable": {"session_id": "returning"}})
+    llm.calls = 0
+
+    threads = [threading.Thread(target=chain.invoke, args=({"input": "How much is it?"},),
+                                kwargs={"config": {"configurable": {"session_id": session_id}}})
+               for session_id in ("returning", "new")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert llm.calls == 2
+    assert singleflight.stats()["calls_saved"] == 0
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming answers with fallback detection
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from legacy import streaming
+from legacy.streaming import AnswerStream
+
+FALLBACK_KEYWORDS = ["i'm not confident", "let me connect you to a live agent"]
+
+
+class FakeChain:
+    """Streams a fixed answer a few characters at a time"""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.calls = []
+
+    def stream(self, inputs, config=None):
+        self.calls.append((inputs, config))
+        for start in range(0, len(self.answer), 3):
+            yield self.answer[start:start + 3]
+
+
+def test_normal_answer_streams_progressively():
+    chain = FakeChain("Clickatell was founded in 2000.")
+    answer = AnswerStream(chain, "When was Clickatell founded?", "session-1", FALLBACK_KEYWORDS)
+
+    chunks = list(answer)
+
+    assert len(chunks) > 1, "Answer should arrive in several chunks"
+    assert "".join(chunks) == answer.text == "Clickatell was founded in 2000."
+    assert not answer.is_fallback
+    assert answer.time_to_first_token is not None
+    assert chain.calls[0][1] == {"configurable": {"session_id": "session-1"}}
+
+
+def test_fallback_answer_is_never_displayed():
+    chain = FakeChain("*I'm not confident I can assist with that. Let me connect you to a live agent.*")
+    answer = AnswerStream(chain, "What is the share price?", "session-1", FALLBACK_KEYWORDS)
+
+    assert list(answer) == []
+    assert answer.is_fallback
+    assert answer.text.startswith("*I'm not confident")
+
+
+def test_answer_starting_like_fallback_is_released():
+    chain = FakeChain("I'm happy to help: the API uses TLS 1.2+.")
+    answer = AnswerStream(chain, "Which TLS version?", "session-1", FALLBACK_KEYWORDS)
+
+    assert "".join(answer) == "I'm happy to help: the API uses TLS 1.2+."
+    assert not answer.is_fallback
+
+
+def test_time_to_first_token_is_recorded():
+    before = streaming.time_to_first_token.count
+    list(AnswerStream(FakeChain("Hello"), "Hi", "session-1", FALLBACK_KEYWORDS))
+
+    assert streaming.time_to_first_token.count == before + 1
+    assert streaming.time_to_first_token.summary()["p50_ms"] is not None
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Tests for per-request tracing of the retrieval chain and its Prometheus metrics
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from legacy import tracing
+from legacy.fake_llm import FakeChatModel
+from legacy.metrics import Registry
+from legacy.tracing import Tracer
+
+TEXTS = ("One API sends SMS and WhatsApp messages.", "Chat Desk is a live agent interface.")
+
+
+class TraceCollector(logging.Handler):
+    """Keeps the JSON traces logged by the tracer"""
+
+    def __init__(self):
+        super().__init__(logging.INFO)
+        self.traces = []
+
+    def emit(self, record):
+        self.traces.append(json.loads(record.getMessage()))
+
+
+def traced_chain(make_chain, make_store, llm):
+    store = make_store(TEXTS)
+    registry = Registry()
+    return make_chain(llm, vector_store=store, tracer=Tracer(registry)), store, registry
+
+
+def collect_traces(run):
+    collector = TraceCollector()
+    trace_logger = logging.getLogger("legacy.tracing")
+    level = trace_logger.level
+    trace_logger.addHandler(collector)
+    trace_logger.setLevel(logging.INFO)
+    try:
+        run()
+    finally:
+        trace_logger.removeHandler(collector)
+        trace_logger.setLevel(level)
+    return collector.traces
+
+
+def test_trace_records_stages_chunks_and_tokens(make_chain, make_store):
+    llm = FakeChatModel(response="One API is a REST API.", latency=0.05, tokens_per_second=200)
+    chain, store, registry = traced_chain(make_chain, make_store, llm)
+    answers = []
+
+    traces = collect_traces(lambda: answers.append(
+        chain.invoke({"input": "What is One API?"}, config={"configurable": {"session_id": "s1"}})))
+
+    assert answers == ["One API is a REST API."]
+    assert len(traces) == 1
+    trace = traces[0]
+    assert trace["session_id"] == "s1" and trace["outcome"] == "answered"
+    for stage in ("history_load", "embedding", "retrieval", "context", "llm_first_token", "llm", "parsing", "total"):
+        assert stage in trace["spans_ms"], stage
+    assert trace["spans_ms"]["llm_first_token"] >= 50
+    assert trace["spans_ms"]["llm"] >= trace["spans_ms"]["llm_first_token"]
+    assert trace["spans_ms"]["total"] >= trace["spans_ms"]["llm"]
+    assert {chunk["id"] for chunk in trace["chunks"]} <= set(store.index_to_docstore_id.values())
+    assert trace["prompt_tokens"] > trace["context_tokens"] > 0
+    assert trace["answer_tokens"] > 0
+
+    rendered = registry.render()
+    assert 'rag_stage_seconds_count{stage="llm_first_token"} 1' in rendered
+    assert 'rag_requests_total{outcome="answered"} 1' in rendered
+    assert tracing.current() is None, "The trace must not leak into the caller's context"
+
+
+def test_streamed_and_cached_answers_are_traced(make_chain, make_store):
+    llm = FakeChatModel(response="Chat Desk is for live agents.", tokens_per_second=500)
+    chain, _, registry = traced_chain(make_chain, make_store, llm)
+
+    async def run():
+        for session_id in ("a", "b"):
+            config = {"configurable": {"session_id": session_id}}
+            tokens = [token async for token in chain.astream({"input": "What is Chat Desk?"}, config=config)]
+            assert "".join(tokens) == llm.response
+
+    traces = collect_traces(lambda: asyncio.run(run()))
+
+    assert [trace["outcome"] for trace in traces] == ["answered", "exact_cache"]
+    assert "llm" not in traces[1]["spans_ms"]
+    assert llm.calls == 1
+    assert 'rag_requests_total{outcome="exact_cache"} 1' in registry.render()
+
+
+
+class NonStreamingLLM(FakeChatModel):
+    """Fails if the chain streams it"""
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        raise AssertionError("invoke() must not stream the LLM")
+
+
+def test_invoke_does_not_stream_and_leaves_the_question_out(make_chain, make_store):
+    llm = NonStreamingLLM(response="One API is a REST API.")
+    chain, _, _ = traced_chain(make_chain, make_store, llm)
+    config = {"configurable": {"session_id": "s1"}}
+
+    traces = collect_traces(lambda: chain.invoke({"input": "My number is 0821234567"}, config=config))
+
+    assert llm.calls == 1
+    assert "question" not in traces[0]
+    assert "0821234567" not in json.dumps(traces[0])
+
+    chain = make_chain(llm, vector_store=make_store(TEXTS), tracer=Tracer(Registry(), log_questions=True))
+    traces = collect_traces(lambda: chain.invoke({"input": "What is One API?"}, config=config))
+    assert traces[0]["question"] == "What is One API?"
+
+def test_histogram_exposition_format():
+    registry = Registry()
+    histogram = registry.histogram("rag_test_seconds", "Test latency", labels=("stage",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "search")
+    histogram.observe(0.5, "search")
+    histogram.observe(5.0, "search")
+
+    lines = registry.render().splitlines()
+
+    assert lines[:2] == ["# HELP rag_test_seconds Test latency", "# TYPE rag_test_seconds histogram"]
+    assert 'rag_test_seconds_bucket{stage="search",le="0.1"} 1' in lines
+    assert 'rag_test_seconds_bucket{stage="search",le="1.0"} 2' in lines
+    assert 'rag_test_seconds_bucket{stage="search",le="+Inf"} 3' in lines
+    assert 'rag_test_seconds_count{stage="search"} 3' in lines
+    assert registry.histogram("rag_test_seconds", "Test latency") is histogram